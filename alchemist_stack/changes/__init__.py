@@ -0,0 +1,525 @@
+# System Imports
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Iterator, List, Tuple, Union
+
+# Third-Party Imports
+from sqlalchemy import event
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.engine.util import _distill_params
+from sqlalchemy.orm.session import sessionmaker
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.dml import Insert, Update, UpdateBase
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, BooleanClauseList, ClauseList, Grouping
+from sqlalchemy.schema import Column, Table
+
+# Local Source Imports
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+logger = logging.getLogger('Alchemist Stack')
+
+INSERT = 'insert'
+UPDATE = 'update'
+DELETE = 'delete'
+
+""" Keys of the change capture state kept in `Session.info`. """
+_STAGED = 'alchemist_staged_changes'
+_CONNECTIONS = 'alchemist_change_connections'
+
+class ChangeEvent(object):
+    """ One committed write: every row of `table` that a transaction changed with the same operation and columns.
+
+        `primary_keys` lists the primary keys written (scalars, or tuples for composite keys), or is None when the
+        statement did not name its rows (e.g. `UPDATE ... WHERE pk IN (SELECT ...)`, or an INSERT of server-generated
+        keys); subscribers should then treat every row of the table as changed. `count` is the number of rows.
+    """
+
+    __slots__ = ('table', 'model', 'operation', 'primary_keys', 'columns', 'count', 'committed_at')
+
+    def __init__(self, table: str, model: Union[str, None], operation: str, primary_keys: Union[List[Any], None],
+                 columns: FrozenSet[str], count: int, committed_at: float = None):
+        self.table = table
+        self.model = model
+        self.operation = operation
+        self.primary_keys = primary_keys
+        self.columns = columns
+        self.count = count
+        self.committed_at = committed_at if committed_at is not None else time.time()
+
+    def __repr__(self) -> str:
+        """ A String representation of the :class:`ChangeEvent <ChangeEvent>`.
+
+        :returns: String representation of :class:`ChangeEvent <ChangeEvent>` object.
+        :rtype: str
+        """
+        return '<class ChangeEvent({operation} {table}, {count} rows) at {hex_id}>'.format(operation=self.operation,
+                                                                                         table=self.table,
+                                                                                         count=self.count,
+                                                                                         hex_id=hex(id(self)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """ Gets a JSON-serializable representation of the ChangeEvent.
+
+        :rtype: dict
+        """
+        keys = None
+        if self.primary_keys is not None:
+            keys = [list(key) if isinstance(key, tuple) else key for key in self.primary_keys]
+        return {
+            'table': self.table,
+            'model': self.model,
+            'operation': self.operation,
+            'primary_keys': keys,
+            'columns': sorted(self.columns),
+            'count': self.count,
+            'committed_at': self.committed_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ChangeEvent':
+        keys = data.get('primary_keys')
+        if keys is not None:
+            keys = [tuple(key) if isinstance(key, list) else key for key in keys]
+        return cls(table=data['table'], model=data.get('model'), operation=data['operation'], primary_keys=keys,
+                   columns=frozenset(data.get('columns', ())), count=data.get('count', 0),
+                   committed_at=data.get('committed_at'))
+
+class Subscription(object):
+    """ A subscriber's bounded queue of :code:`ChangeEvent <ChangeEvent>`s.
+
+        Publishing never blocks the committing thread: events that do not fit are dropped and counted. A subscriber
+        that finds :code:`dropped` above zero has missed changes, and should resynchronize (e.g. clear its cache).
+
+        A subscription with a `callback` queues nothing: the callback is called with every event, on the committing
+        thread, right after the commit. It must be quick; an exception it raises is logged, and the other subscribers
+        still get the event.
+    """
+
+    def __init__(self, stream: 'ChangeStream', max_queue: int, callback: Callable[[ChangeEvent], Any] = None):
+        self.__stream = stream
+        self.__queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.__callback = callback
+        self.__dropped = 0
+        self.__closed = threading.Event()
+
+    def __iter__(self) -> Iterator[ChangeEvent]:
+        while True:
+            change = self.__take(timeout=None)
+            if change is None:
+                return
+            yield change
+
+    @property
+    def closed(self) -> bool:
+        return self.__closed.is_set()
+
+    @property
+    def dropped(self) -> int:
+        return self.__dropped
+
+    @property
+    def pending(self) -> int:
+        return self.__queue.qsize()
+
+    def get(self, timeout: float = None) -> Union[ChangeEvent, None]:
+        """ Gets the next event, waiting up to `timeout` seconds.
+
+        :return: The next event, or None if none arrived in time, or the subscription was closed.
+        :rtype: ChangeEvent
+        """
+        return self.__take(timeout=timeout)
+
+    def drain(self) -> List[ChangeEvent]:
+        """ Gets every event waiting, without blocking. """
+        changes = []
+        while True:
+            try:
+                change = self.__queue.get_nowait()
+            except queue.Empty:
+                return changes
+            if change is not None:
+                changes.append(change)
+
+    def close(self):
+        """ Unsubscribes, and wakes up a consumer waiting on :code:`get()` or iterating. Events already queued are
+                still handed out; then the consumer gets None, or its iteration ends.
+        """
+        self.__closed.set()
+        self.__stream.unsubscribe(self)
+        try:
+            # Only wakes a consumer blocked on an empty queue. A full queue needs no sentinel: the consumer finds the
+            # closed flag once it has taken the events queued.
+            self.__queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def __take(self, timeout: Union[float, None]) -> Union[ChangeEvent, None]:
+        try:
+            if self.__closed.is_set():
+                return self.__queue.get_nowait()
+            return self.__queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _offer(self, change: ChangeEvent):
+        if self.__closed.is_set():
+            return
+        if self.__callback is not None:
+            try:
+                self.__callback(change)
+            except Exception as error:
+                # The transaction is already committed: a failing subscriber must not fail the caller's commit.
+                logger.error('Change subscriber failed on {change}: {error}'.format(change=repr(change), error=error))
+            return
+        try:
+            self.__queue.put_nowait(change)
+        except queue.Full:
+            self.__dropped += 1
+
+class ChangeStream(object):
+    """ In-process change stream: publishes the writes of every committed Session of a :code:`Context <Context>`.
+
+        Every INSERT, UPDATE and DELETE a Session executes (ORM flushes, bulk saves, and Core statements alike) is
+        staged on the Session, and published once the Session commits; a rollback discards it. Writes are grouped per
+        transaction by table, operation and columns, so a 10,000 row bulk write is one event, not 10,000.
+
+        Writes executed on the Engine outside of a Session are not captured.
+
+    Usage:
+        >>> changes = ChangeStream()
+        >>> db = Context(settings={...}, change_stream=changes)
+        >>> subscription = changes.subscribe()
+        >>> for change in subscription:
+        ...     cache.invalidate(change.table, change.primary_keys)
+    """
+
+    def __init__(self, max_queue: int = 1000):
+        """ Change Stream Constructor
+
+        :param max_queue: The default capacity of a subscriber's queue.
+        :type max_queue: int
+        """
+        self.__max_queue = max_queue
+        self.__subscriptions: List[Subscription] = []
+        self.__lock = threading.Lock()
+        self.__published = 0
+        self.__models: Dict[str, str] = {}
+
+    @property
+    def published(self) -> int:
+        return self.__published
+
+    @property
+    def subscriptions(self) -> int:
+        return len(self.__subscriptions)
+
+    def subscribe(self, max_queue: int = None, callback: Callable[[ChangeEvent], Any] = None) -> Subscription:
+        """ Adds a subscriber.
+
+        :param max_queue: The capacity of the subscriber's queue.
+            Default: None => The stream's `max_queue`.
+        :type max_queue: int
+        :param callback: Called with every event on the committing thread, instead of queuing it.
+        :rtype: Subscription
+        """
+        subscription = Subscription(self, max_queue=self.__max_queue if max_queue is None else max_queue,
+                                    callback=callback)
+        with self.__lock:
+            self.__subscriptions = self.__subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.__lock:
+            self.__subscriptions = [s for s in self.__subscriptions if s is not subscription]
+
+    def publish(self, changes: List[ChangeEvent]):
+        """ Offers `changes` to every subscriber, without blocking. """
+        subscriptions = self.__subscriptions
+        for change in changes:
+            for subscription in subscriptions:
+                subscription._offer(change)
+        with self.__lock:
+            self.__published += len(changes)
+
+    def watch(self, engine: Engine):
+        """ Stages the writes executed on `engine` by watched Sessions. """
+
+        @event.listens_for(engine, 'after_execute')
+        def after_execute(conn, clauseelement, multiparams, params, result):
+            staged = conn.info.get(_STAGED)
+            if staged is not None and isinstance(clauseelement, UpdateBase):
+                change = self.__capture(clauseelement, _distill_params(multiparams, params), result)
+                if change is not None:
+                    staged.append(change)
+
+        @event.listens_for(engine, 'checkin')
+        def checkin(dbapi_connection, connection_record):
+            # A Session closed mid-transaction may leave its staging list linked; the next checkout must not inherit it.
+            if connection_record is not None:
+                connection_record.info.pop(_STAGED, None)
+
+    def watch_sessions(self, factory: sessionmaker):
+        """ Publishes the writes of every Session `factory` creates, when it commits. """
+
+        @event.listens_for(factory, 'after_begin')
+        def after_begin(session, transaction, connection):
+            staged = session.info.setdefault(_STAGED, [])
+            # The connection's info outlives the checkout, so the link is removed again when the transaction ends.
+            connection.info[_STAGED] = staged
+            session.info.setdefault(_CONNECTIONS, []).append(connection.info)
+
+        @event.listens_for(factory, 'after_commit')
+        def after_commit(session):
+            staged = self.__end(session)
+            if staged:
+                self.publish(self.__batch(staged))
+
+        @event.listens_for(factory, 'after_rollback')
+        def after_rollback(session):
+            self.__end(session)
+
+        @event.listens_for(factory, 'after_transaction_end')
+        def after_transaction_end(session, transaction):
+            # Also reached by a Session closed without a commit or a rollback; its writes are discarded.
+            if transaction.parent is None:
+                self.__end(session)
+
+    @staticmethod
+    def __end(session) -> List[Tuple[str, str, Tuple[str, ...], Union[List[Any], None], int]]:
+        """ Unlinks the Session's connections, and gets the writes it staged. """
+        for info in session.info.pop(_CONNECTIONS, ()):
+            info.pop(_STAGED, None)
+        return session.info.pop(_STAGED, [])
+
+    def __batch(self, staged) -> List[ChangeEvent]:
+        """ Groups staged writes by table, operation and columns, in the order they were first seen. """
+        committed_at = time.time()
+        groups: Dict[Tuple[str, str, FrozenSet[str]], ChangeEvent] = OrderedDict()
+        for (table, operation, columns, keys, count) in staged:
+            change = groups.get((table, operation, columns))
+            if change is None:
+                groups[(table, operation, columns)] = ChangeEvent(table=table, model=self.__model(table),
+                                                                  operation=operation, primary_keys=keys,
+                                                                  columns=columns, count=count,
+                                                                  committed_at=committed_at)
+                continue
+            change.count += count
+            if change.primary_keys is not None and keys is not None:
+                change.primary_keys.extend(keys)
+            else:
+                change.primary_keys = None
+        return list(groups.values())
+
+    def __model(self, table: str) -> Union[str, None]:
+        """ Gets the name of the `Base` model mapped to `table`. """
+        if table not in self.__models:
+            from alchemist_stack.repository.models import Base
+            for cls in list(Base._decl_class_registry.values()):
+                if getattr(getattr(cls, '__table__', None), 'name', None) == table:
+                    self.__models[table] = cls.__name__
+                    break
+        return self.__models.get(table)
+
+    @staticmethod
+    def __capture(statement: UpdateBase, parameters: List[Dict[str, Any]], result) \
+            -> Union[Tuple[str, str, FrozenSet[str], Union[List[Any], None], int], None]:
+        """ Describes a write: (table, operation, columns, primary keys, row count). """
+        table = statement.table
+        if not isinstance(table, Table):
+            return None
+        primary_key = list(table.primary_key.columns)
+        literal_values = {_column_key(key): value for (key, value) in (getattr(statement, 'parameters', None)
+                                                                       or {}).items()}
+
+        if isinstance(statement, Insert):
+            operation = INSERT
+            columns = set(literal_values.keys())
+            for params in parameters:
+                columns.update(key for key in params.keys() if key in table.c)
+            keys = []
+            for params in parameters or [{}]:
+                values = [params.get(column.key, literal_values.get(column.key)) for column in primary_key]
+                keys.append(values)
+            if len(keys) == 1 and any(value is None for value in keys[0]) and result.context.isinsert:
+                inserted = getattr(result, 'inserted_primary_key', None)
+                keys = [list(inserted)] if inserted else keys
+            keys = None if any(value is None for key in keys for value in key) else \
+                [tuple(key) if len(key) > 1 else key[0] for key in keys]
+            count = max(len(parameters), 1)
+        else:
+            operation = UPDATE if isinstance(statement, Update) else DELETE
+            columns = set()
+            if operation == UPDATE:
+                columns.update(literal_values.keys())
+                where_binds = _bind_names(statement._whereclause)
+                for params in parameters:
+                    columns.update(key for key in params.keys() if key in table.c and key not in where_binds)
+            keys = _where_keys(statement._whereclause, primary_key, parameters)
+            count = result.rowcount if result.rowcount is not None and result.rowcount >= 0 else \
+                (len(keys) if keys is not None else 0)
+        return (table.name, operation, frozenset(columns), keys, count)
+
+def _column_key(key: Any) -> str:
+    return key.key if isinstance(key, Column) else str(key)
+
+def _bind_names(clause) -> set:
+    """ Gets the names of the bind parameters in `clause`. """
+    names = set()
+    if clause is None:
+        return names
+    stack = [clause]
+    while stack:
+        element = stack.pop()
+        if isinstance(element, BindParameter):
+            names.add(element.key)
+        stack.extend(element.get_children())
+    return names
+
+def _bind_value(bind: BindParameter, params: Dict[str, Any]) -> Any:
+    if bind.key in params:
+        return params[bind.key]
+    return bind.effective_value
+
+def _where_keys(clause, primary_key: List[Column], parameters: List[Dict[str, Any]]) -> Union[List[Any], None]:
+    """ Gets the primary keys an UPDATE/DELETE WHERE clause names, for every parameter set: `pk = :x`, or
+            `pk IN (...)` on a single key column, and `pk_1 = :x AND pk_2 = :y` on composite keys. Returns None if the
+            clause does not pin its rows down by primary key.
+    """
+    if clause is None:
+        return None
+    terms = list(clause.clauses) if isinstance(clause, BooleanClauseList) and clause.operator is operators.and_ \
+        else [clause]
+
+    keys = []
+    for params in parameters or [{}]:
+        values = {}
+        for term in terms:
+            if not (isinstance(term, BinaryExpression) and isinstance(term.left, Column)):
+                continue
+            column = next((c for c in primary_key if term.left is c or term.left.shares_lineage(c)), None)
+            if column is None:
+                continue
+            if term.operator is operators.eq and isinstance(term.right, BindParameter):
+                values[column.key] = [_bind_value(term.right, params)]
+            elif term.operator is operators.in_op:
+                if isinstance(term.right, BindParameter):
+                    values[column.key] = list(_bind_value(term.right, params) or [])
+                elif isinstance(term.right, Grouping) and isinstance(term.right.element, ClauseList) \
+                        and all(isinstance(b, BindParameter) for b in term.right.element.clauses):
+                    values[column.key] = [_bind_value(b, params) for b in term.right.element.clauses]
+        if len(values) != len(primary_key):
+            return None
+        if len(primary_key) == 1:
+            keys.extend(values[primary_key[0].key])
+        elif all(len(v) == 1 for v in values.values()):
+            keys.append(tuple(values[column.key][0] for column in primary_key))
+        else:
+            return None
+    return keys
+
+class UnixSocketPublisher(object):
+    """ Fans a :code:`ChangeStream <ChangeStream>` out to other processes over a local Unix socket, as JSON lines.
+
+        Events are sent from a background thread, so publishing stays non-blocking; a client that cannot keep up
+        (its socket stays full for `send_timeout` seconds) is disconnected.
+
+    Usage:
+        >>> publisher = UnixSocketPublisher(changes, path='/run/app/changes.sock')
+        >>> # In another process:
+        >>> for change in UnixSocketSubscriber(path='/run/app/changes.sock'):
+        ...     search_index.refresh(change.table, change.primary_keys)
+    """
+
+    def __init__(self, stream: ChangeStream, path: str, max_queue: int = 10000, send_timeout: float = 1.0):
+        self.__path = path
+        self.__send_timeout = send_timeout
+        self.__clients: List[socket.socket] = []
+        self.__lock = threading.Lock()
+        self.__closed = False
+        if os.path.exists(path):
+            os.unlink(path)
+        self.__server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__server.bind(path)
+        self.__server.listen()
+        self.__subscription = stream.subscribe(max_queue=max_queue)
+        self.__acceptor = threading.Thread(target=self.__accept, name='alchemist-change-acceptor', daemon=True)
+        self.__sender = threading.Thread(target=self.__send, name='alchemist-change-sender', daemon=True)
+        self.__acceptor.start()
+        self.__sender.start()
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    @property
+    def clients(self) -> int:
+        return len(self.__clients)
+
+    def close(self):
+        """ Stops accepting clients, disconnects them, and removes the socket file. """
+        self.__closed = True
+        self.__subscription.close()
+        self.__server.close()
+        self.__sender.join(timeout=self.__send_timeout + 1)
+        with self.__lock:
+            for client in self.__clients:
+                client.close()
+            self.__clients = []
+        if os.path.exists(self.__path):
+            os.unlink(self.__path)
+
+    def __accept(self):
+        while not self.__closed:
+            try:
+                (client, _) = self.__server.accept()
+            except OSError:
+                return
+            client.settimeout(self.__send_timeout)
+            with self.__lock:
+                self.__clients.append(client)
+
+    def __send(self):
+        for change in self.__subscription:
+            line = (json.dumps(change.to_dict(), default=str) + '\n').encode('utf-8')
+            with self.__lock:
+                clients = list(self.__clients)
+            for client in clients:
+                try:
+                    client.sendall(line)
+                except OSError:
+                    with self.__lock:
+                        self.__clients = [c for c in self.__clients if c is not client]
+                    client.close()
+
+class UnixSocketSubscriber(object):
+    """ Receives the :code:`ChangeEvent <ChangeEvent>`s of a :code:`UnixSocketPublisher <UnixSocketPublisher>`. """
+
+    def __init__(self, path: str, timeout: float = None):
+        self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__socket.connect(path)
+        self.__socket.settimeout(timeout)
+        self.__file = self.__socket.makefile('r', encoding='utf-8')
+
+    def __iter__(self) -> Iterator[ChangeEvent]:
+        for line in self.__file:
+            yield ChangeEvent.from_dict(json.loads(line))
+
+    def get(self) -> Union[ChangeEvent, None]:
+        """ Waits for the next event.
+
+        :return: The next event, or None if the publisher closed the socket.
+        :raises: socket.timeout
+        """
+        line = self.__file.readline()
+        return ChangeEvent.from_dict(json.loads(line)) if line else None
+
+    def close(self):
+        self.__file.close()
+        self.__socket.close()
@@ -4,7 +4,14 @@ from typing import Union, NoReturn
 # Third-Party Imports
 
 # Local Source Imports
-from .context import Context
+from .admission import AdmissionController, AIMDLimit, GradientLimit, LimitAlgorithm, ContextSaturatedException
+from .context import Context, ContextDrainingException, UnknownSessionProfileException, DEFAULT_PROFILE,\
+    READ_ONLY_PROFILE, BULK_PROFILE
+from .registry import SessionRegistry, ThreadLocalSessionRegistry, ContextVarSessionRegistry, THREAD_SCOPING,\
+    CONTEXT_SCOPING
+from .replica import LocalReplica, ReplicaRoutingSession
+from .deadline import deadline, current_deadline, remaining, check_deadline, DeadlineQueuePool,\
+    DeadlineExceededException
 
 
 __author__ = 'H.D. "Chip" McCullough IV'
@@ -0,0 +1,358 @@
+# System Imports
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Union
+
+# Third-Party Imports
+from sqlalchemy import event
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.orm.session import Session, sessionmaker
+
+# Local Source Imports
+from .deadline import check_deadline, current_deadline
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+""" Keys of the admission state kept in `Session.info`, and linked from the `Connection.info` of its connections. """
+_SESSION_LOAD = 'alchemist_admission_load'
+_STATEMENT_START = 'alchemist_admission_start'
+
+class _SessionLoad(object):
+    """ What an admitted Session asked of the database: the time its statements took, and whether it failed. """
+
+    __slots__ = ('execute_time', 'statements', 'failed', 'connections')
+
+    def __init__(self):
+        self.execute_time = 0.0
+        self.statements = 0
+        self.failed = False
+        self.connections: List[Dict[str, Any]] = []
+
+class LimitAlgorithm(ABC):
+    """ Limit Algorithm Abstract Base Class for adapting a concurrency limit to observed latency """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 200):
+        self._limit = float(initial)
+        self._minimum = minimum
+        self._maximum = maximum
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @abstractmethod
+    def update(self, latency: float, in_flight: int, dropped: bool) -> int:
+        """ Feeds one observation to the algorithm.
+
+        :param latency: How long the admitted operation took, in seconds.
+        :type latency: float
+        :param in_flight: How many operations were admitted when it finished.
+        :type in_flight: int
+        :param dropped: Whether the operation failed or timed out.
+        :type dropped: bool
+        :return: The new concurrency limit.
+        :rtype: int
+        """
+        raise NotImplementedError
+
+    def _clamp(self, limit: float) -> float:
+        return min(max(limit, self._minimum), self._maximum)
+
+class AIMDLimit(LimitAlgorithm):
+    """ Additive-Increase / Multiplicative-Decrease limit.
+
+        The limit grows by one for every operation that completes under `latency_threshold` while the limit is in use,
+        and is multiplied by `backoff` whenever an operation is slower than the threshold, or is dropped.
+    """
+
+    def __init__(self, initial: int = 10, minimum: int = 1, maximum: int = 200, latency_threshold: float = 0.5,
+                 backoff: float = 0.9):
+        super().__init__(initial=initial, minimum=minimum, maximum=maximum)
+        self.__latency_threshold = latency_threshold
+        self.__backoff = backoff
+
+    def update(self, latency: float, in_flight: int, dropped: bool) -> int:
+        if dropped or latency > self.__latency_threshold:
+            self._limit = self._clamp(self._limit * self.__backoff)
+        elif in_flight * 2 >= self._limit:
+            self._limit = self._clamp(self._limit + 1)
+        return self.limit
+
+class GradientLimit(LimitAlgorithm):
+    """ Gradient limit.
+
+        Tracks the best (no-load) latency seen and a smoothed recent latency. Their ratio, the gradient, shrinks the
+        limit as queueing pushes latency up, and a headroom of sqrt(limit) lets it keep probing upward while latency
+        stays flat.
+    """
+
+    def __init__(self, initial: int = 10, minimum: int = 1, maximum: int = 200, smoothing: float = 0.2,
+                 tolerance: float = 1.5):
+        super().__init__(initial=initial, minimum=minimum, maximum=maximum)
+        self.__smoothing = smoothing
+        self.__tolerance = tolerance
+        self.__min_latency: float = math.inf
+        self.__recent_latency: float = 0.0
+
+    def update(self, latency: float, in_flight: int, dropped: bool) -> int:
+        if dropped:
+            self._limit = self._clamp(self._limit / 2)
+            return self.limit
+        self.__min_latency = min(self.__min_latency, latency)
+        if self.__recent_latency == 0.0:
+            self.__recent_latency = latency
+        else:
+            self.__recent_latency += self.__smoothing * (latency - self.__recent_latency)
+        if self.__recent_latency <= 0:
+            return self.limit
+
+        gradient = max(0.5, min(1.0, self.__tolerance * self.__min_latency / self.__recent_latency))
+        target = self._limit * gradient + math.sqrt(self._limit)
+        self._limit = self._clamp((1 - self.__smoothing) * self._limit + self.__smoothing * target)
+        return self.limit
+
+class AdmissionController(object):
+    """ Admission Controller for bounding the number of concurrently active Sessions.
+
+        Up to `limit` Sessions may be active at once. Further requests wait in a queue of at most `max_queue` entries,
+        for at most `queue_timeout` seconds; a request that finds the queue full, or times out in it, is rejected with
+        a :code:`ContextSaturatedException <ContextSaturatedException>` instead of piling up on the connection pool.
+
+        With an adaptive :code:`LimitAlgorithm <LimitAlgorithm>`, the limit follows the latency observed on release.
+        The :code:`Context <Context>` releases its Sessions with :code:`release_session()`: the latency is the time the
+        Session's statements took in the database (not the time the caller held it), and a Session that hit a
+        database error or was rolled back counts as dropped.
+
+    Usage:
+        >>> db = Context(settings={...}, admission=AdmissionController(limit=20, max_queue=50, queue_timeout=0.25))
+    """
+
+    def __init__(self, limit: int = 10, max_queue: int = 100, queue_timeout: float = 1.0,
+                 algorithm: LimitAlgorithm = None):
+        """ Admission Controller Constructor
+
+        :param limit: The number of Sessions allowed to be active at once. Ignored if `algorithm` is given.
+        :type limit: int
+        :param max_queue: The maximum number of requests waiting for a slot.
+        :type max_queue: int
+        :param queue_timeout: The maximum number of seconds a request waits for a slot.
+        :type queue_timeout: float
+        :param algorithm: An adaptive limit algorithm (e.g. :code:`AIMDLimit <AIMDLimit>`).
+            Default: None => The limit is fixed.
+        :type algorithm: LimitAlgorithm
+        """
+        self.__limit = algorithm.limit if algorithm is not None else limit
+        self.__max_queue = max_queue
+        self.__queue_timeout = queue_timeout
+        self.__algorithm = algorithm
+        self.__slot_released = threading.Condition()
+        self.__in_flight = 0
+        self.__waiting = 0
+        self.__admitted = 0
+        self.__rejected = 0
+
+    def __repr__(self) -> str:
+        """ A String representation of the :class:`AdmissionController <AdmissionController>`.
+
+        :returns: String representation of :class:`AdmissionController <AdmissionController>` object.
+        :rtype: str
+        """
+        return '<class AdmissionController(limit={limit}, max_queue={max_queue}) at {hex_id}>'\
+            .format(limit=self.__limit,
+                    max_queue=self.__max_queue,
+                    hex_id=hex(id(self)))
+
+    @property
+    def limit(self) -> int:
+        return self.__limit
+
+    @property
+    def in_flight(self) -> int:
+        return self.__in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return self.__waiting
+
+    @property
+    def metrics(self) -> Dict[str, Union[int, float]]:
+        """ Gets a snapshot of the controller's gauges and counters.
+
+        :return: Dictionary of limit, in_flight, queue_depth, admitted and rejected.
+        :rtype: dict
+        """
+        with self.__slot_released:
+            return {
+                'limit': self.__limit,
+                'in_flight': self.__in_flight,
+                'queue_depth': self.__waiting,
+                'admitted': self.__admitted,
+                'rejected': self.__rejected,
+            }
+
+    def acquire(self, timeout: float = None) -> float:
+        """ Takes a slot, waiting in the queue if none is free.
+
+        :param timeout: The maximum number of seconds to wait for a slot.
+            Default: None => The controller's `queue_timeout`.
+        :type timeout: float
+        :raises: ContextSaturatedException
+        :return: The admission time, to be handed back to :code:`release()`.
+        :rtype: float
+        """
+        __timeout = self.__queue_timeout if timeout is None else timeout
+        expires_at = current_deadline()
+        if expires_at is not None:
+            __timeout = min(__timeout, expires_at - time.monotonic())
+        with self.__slot_released:
+            if self.__in_flight >= self.__limit:
+                if self.__waiting >= self.__max_queue:
+                    self.__reject(reason='queue full')
+                deadline = time.monotonic() + __timeout
+                self.__waiting += 1
+                try:
+                    while self.__in_flight >= self.__limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            check_deadline(operation='admission')
+                            self.__reject(reason='timed out after {timeout}s in queue'.format(timeout=__timeout))
+                        self.__slot_released.wait(timeout=remaining)
+                finally:
+                    self.__waiting -= 1
+            self.__in_flight += 1
+            self.__admitted += 1
+        return time.monotonic()
+
+    def release(self, admitted_at: float, dropped: bool = False, latency: float = None):
+        """ Hands a slot back, and feeds its latency to the adaptive limit algorithm (if any).
+
+        :param admitted_at: The value returned by :code:`acquire()`.
+        :type admitted_at: float
+        :param dropped: Whether the admitted operation failed.
+        :type dropped: bool
+        :param latency: The latency of the admitted operation, in seconds.
+            Default: None => The time since admission.
+        :type latency: float
+        """
+        self.__release(latency=time.monotonic() - admitted_at if latency is None else latency, dropped=dropped)
+
+    def release_session(self, session: Session, admitted_at: float):
+        """ Hands the slot of a Session back, once it is closed: feeds the time its statements took to the adaptive
+                limit algorithm, as dropped if it failed or was rolled back. A Session that executed nothing, and did not
+                fail, is not a latency sample.
+
+        :param session: The Session, from a factory passed to :code:`watch_sessions()`.
+        :type session: Session
+        :param admitted_at: The value returned by :code:`acquire()`.
+        :type admitted_at: float
+        """
+        load = session.info.pop(_SESSION_LOAD, None)
+        if load is None or not (load.statements or load.failed):
+            self.__release(latency=None, dropped=False)
+            return
+        self.__unlink(load)
+        self.__release(latency=load.execute_time, dropped=load.failed)
+
+    def watch(self, engine: Engine):
+        """ Times the statements, and records the errors, of watched Sessions on `engine`. """
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if _SESSION_LOAD in conn.info:
+                conn.info[_STATEMENT_START] = time.perf_counter()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            load = conn.info.get(_SESSION_LOAD)
+            started = conn.info.pop(_STATEMENT_START, None)
+            if load is not None and started is not None:
+                load.execute_time += time.perf_counter() - started
+                load.statements += 1
+
+        @event.listens_for(engine, 'handle_error')
+        def handle_error(context):
+            if context.connection is None:
+                return
+            context.connection.info.pop(_STATEMENT_START, None)
+            load = context.connection.info.get(_SESSION_LOAD)
+            if load is not None:
+                load.failed = True
+
+        @event.listens_for(engine, 'checkin')
+        def checkin(dbapi_connection, connection_record):
+            if connection_record is not None:
+                connection_record.info.pop(_SESSION_LOAD, None)
+                connection_record.info.pop(_STATEMENT_START, None)
+
+    def watch_sessions(self, factory: sessionmaker):
+        """ Tracks the load of every Session `factory` creates, for :code:`release_session()`. """
+
+        @event.listens_for(factory, 'after_begin')
+        def after_begin(session, transaction, connection):
+            load = session.info.get(_SESSION_LOAD)
+            if load is None:
+                load = session.info[_SESSION_LOAD] = _SessionLoad()
+            connection.info[_SESSION_LOAD] = load
+            load.connections.append(connection.info)
+
+        @event.listens_for(factory, 'after_rollback')
+        def after_rollback(session):
+            load = session.info.get(_SESSION_LOAD)
+            if load is not None:
+                load.failed = True
+
+        @event.listens_for(factory, 'after_transaction_end')
+        def after_transaction_end(session, transaction):
+            load = session.info.get(_SESSION_LOAD)
+            if load is not None and transaction.parent is None:
+                self.__unlink(load)
+
+    @staticmethod
+    def __unlink(load: _SessionLoad):
+        """ Unlinks a Session's load from its connections, which outlive it in the pool. """
+        for info in load.connections:
+            if info.get(_SESSION_LOAD) is load:
+                info.pop(_SESSION_LOAD, None)
+        load.connections = []
+
+    def __release(self, latency: Union[float, None], dropped: bool):
+        """ Frees a slot, and feeds the observation (if any) to the adaptive limit algorithm. """
+        with self.__slot_released:
+            self.__in_flight -= 1
+            if self.__algorithm is not None and (latency is not None or dropped):
+                self.__limit = self.__algorithm.update(latency=latency or 0.0, in_flight=self.__in_flight,
+                                                       dropped=dropped)
+            self.__slot_released.notify_all()
+
+    def __reject(self, reason: str):
+        """ Counts a rejection, and raises a :code:`ContextSaturatedException <ContextSaturatedException>`.
+                Must be called with the lock held.
+        """
+        self.__rejected += 1
+        __errors = {
+            'limit': self.__limit,
+            'in_flight': self.__in_flight,
+            'queue_depth': self.__waiting,
+            'reason': reason,
+        }
+        raise ContextSaturatedException(
+            message='The context is saturated ({in_flight}/{limit} Sessions active, {waiting} waiting): {reason}.'
+                .format(in_flight=self.__in_flight,
+                        limit=self.__limit,
+                        waiting=self.__waiting,
+                        reason=reason),
+            errors=__errors
+        )
+
+class ContextSaturatedException(Exception):
+    """ Context Is Saturated """
+
+    def __init__(self, message: str, errors: dict, *args):
+        super().__init__(message, *args)
+        self.__errors = errors
+
+    @property
+    def errors(self) -> dict:
+        return self.__errors
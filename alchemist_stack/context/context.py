@@ -1,43 +1,112 @@
 # System Imports
-from typing import Any, Dict, Tuple
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from typing import Any, Dict, List, Tuple
 
 # Third-Party Imports
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, literal, select
 from sqlalchemy.engine.base import Engine
 from sqlalchemy.engine.url import URL
 from sqlalchemy.orm.session import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
 
 # Local Source Imports
+from alchemist_stack.changes import ChangeStream
+from alchemist_stack.tracing import SlowQueryLog, Tracer, instrument_engine
+from .admission import AdmissionController
+from .deadline import DeadlineQueuePool, check_deadline, instrument_deadlines
+from .replica import LocalReplica, ReplicaRoutingSession
+from .registry import CONTEXT_SCOPING, THREAD_SCOPING, ContextVarSessionRegistry, SessionRegistry,\
+    ThreadLocalSessionRegistry
 
 __author__ = 'H.D. "Chip" McCullough IV'
 
+""" The Session profile used when no profile is requested: autoflush on, attributes expired on commit. """
+DEFAULT_PROFILE = 'default'
+
+""" Session profile for reads: no autoflush, no expire on commit, and an AUTOCOMMIT connection where supported. """
+READ_ONLY_PROFILE = 'read-only'
+
+""" Session profile for large batches of writes: no autoflush, no expire on commit. """
+BULK_PROFILE = 'bulk'
+
+def _close_connection(future: Future):
+    """ Closes the connection a warmup future opened after :code:`Context.warmup()` stopped waiting for it. """
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
 class Context(object):
     """ Database Context class. """
 
-    def __init__(self, settings: dict, *args, **kwargs):
-        self.__engine: Engine = create_engine(URL(**settings))
-        self.__sessionmaker: sessionmaker = sessionmaker(bind=self.__engine, autoflush=True)
+    def __init__(self, settings: dict, *args, admission: AdmissionController = None, tracer: Tracer = None,
+                 session_scoping: str = THREAD_SCOPING, change_stream: ChangeStream = None,
+                 replica: LocalReplica = None, slow_query_log: SlowQueryLog = None, **kwargs):
+        if session_scoping not in _SESSION_REGISTRIES:
+            raise ValueError('Unknown session scoping {scoping!r}; expected one of {choices}.'
+                             .format(scoping=session_scoping, choices=tuple(_SESSION_REGISTRIES)))
+        self.__settings: dict = dict(settings)
+        self.__engine: Engine = create_engine(URL(**settings), **self.__engine_arguments(settings))
+        self.__admission = admission
+        self.__tracer = tracer
+        self.__change_stream = change_stream
+        self.__replica = replica
+        self.__slow_query_log = slow_query_log
+        self.__session_scoping = session_scoping
+        self.__registries: Dict[str, SessionRegistry] = {}
+        self.__registries_lock = threading.Lock()
+        self.__profiles: Dict[str, sessionmaker] = {}
         self.__args: Tuple[Any, ...] = args
         self.__kwargs: Dict[str, Any] = kwargs
+        self.__sessions_changed = threading.Condition()
+        self.__active_sessions: Dict[int, Tuple[Session, str, Any, float, float]] = {}
+        self.__draining = False
 
-    def __call__(self) -> Session:
+        instrument_deadlines(self.__engine)
+        if admission is not None:
+            admission.watch(self.__engine)
+        if tracer is not None:
+            instrument_engine(self.__engine)
+        if change_stream is not None:
+            change_stream.watch(self.__engine)
+        if slow_query_log is not None:
+            slow_query_log.watch(self.__engine)
+
+        self.register_session_profile(DEFAULT_PROFILE, autoflush=True)
+        self.register_session_profile(READ_ONLY_PROFILE, bind=self.__read_only_engine(),
+                                      autoflush=False, expire_on_commit=False)
+        self.register_session_profile(BULK_PROFILE, autoflush=False, expire_on_commit=False)
+        self.__sessionmaker: sessionmaker = self.__profiles[DEFAULT_PROFILE]
+        if replica is not None:
+            replica.attach(self)
+
+    def __call__(self, profile: str = DEFAULT_PROFILE) -> Session:
         """ Calling an instance of Context will return a new SQL Alchemy :class:`Session <Session>` object.
 
         Usage:
             >>> db = Context(settings={...})
             >>> session = db()
+            >>> read_only_session = db(profile=READ_ONLY_PROFILE)
 
         Equivalent To:
             >>> db = Context(settings={...})
             >>> session_factory = db.sessionmaker
             >>> session = session_factory()
+        :param profile: The name of the Session profile to create the Session from.
+        :type profile: str
+        :raises: UnknownSessionProfileException, ContextDrainingException
         :returns: A new Session instance
         :rtype: Session
         """
-        return self.sessionmaker()
+        if self.__draining:
+            self.__throw_context_draining_exception()
+        return self.session_profile(profile)()
 
     def __del__(self):
-        """ Called when an instance of Context is about to be destroyed. """
+        """ Called when an instance of Context is about to be destroyed. Use :code:`drain()` to shut a Context down
+                gracefully; nothing is waited for here.
+        """
         pass
 
     def __repr__(self) -> str:
@@ -72,10 +141,93 @@ class Context(object):
     def engine(self) -> Engine:
         return self.__engine
 
+    @property
+    def settings(self) -> dict:
+        """ Gets a copy of the connection settings the Context was created with, e.g. to build an Engine of its own
+                in another process.
+
+        :rtype: dict
+        """
+        return dict(self.__settings)
+
     @property
     def sessionmaker(self) -> sessionmaker:
         return self.__sessionmaker
 
+    @property
+    def session_profiles(self) -> Tuple[str, ...]:
+        """ Gets the names of the registered Session profiles.
+
+        :rtype: Tuple[str, ...]
+        """
+        return tuple(self.__profiles.keys())
+
+    @property
+    def admission(self) -> AdmissionController:
+        """ Gets the :code:`AdmissionController <AdmissionController>` gating :code:`open_session()`, if any.
+
+        :rtype: AdmissionController
+        """
+        return self.__admission
+
+    @property
+    def tracer(self) -> Tracer:
+        """ Gets the :code:`Tracer <Tracer>` recording this Context's Sessions and repository operations, if any.
+
+        :rtype: Tracer
+        """
+        return self.__tracer
+
+    @property
+    def change_stream(self) -> ChangeStream:
+        """ Gets the :code:`ChangeStream <ChangeStream>` the writes of this Context's Sessions are published to, if
+                any.
+
+        :rtype: ChangeStream
+        """
+        return self.__change_stream
+
+    @property
+    def replica(self) -> LocalReplica:
+        """ Gets the Context's :code:`LocalReplica <LocalReplica>`, which serves reads of its models locally.
+
+        :rtype: LocalReplica
+        """
+        return self.__replica
+
+    @property
+    def slow_query_log(self) -> SlowQueryLog:
+        """ Gets the Context's :code:`SlowQueryLog <SlowQueryLog>`, which captures the plans of slow statements.
+
+        :rtype: SlowQueryLog
+        """
+        return self.__slow_query_log
+
+    @property
+    def session_scoping(self) -> str:
+        """ Gets how :code:`session_registry()` scopes Sessions: 'thread' or 'context'.
+
+        :rtype: str
+        """
+        return self.__session_scoping
+
+    @property
+    def draining(self) -> bool:
+        """ Gets whether the Context is draining, and refusing new Sessions.
+
+        :rtype: bool
+        """
+        return self.__draining
+
+    @property
+    def active_sessions(self) -> int:
+        """ Gets the number of Sessions opened through :code:`open_session()` that have not been closed yet.
+
+        :rtype: int
+        """
+        with self.__sessions_changed:
+            return len(self.__active_sessions)
+
     @property
     def arguments(self) -> Tuple[Any, ...]:
         return self.__args
@@ -83,3 +235,279 @@ class Context(object):
     @property
     def keyword_arguments(self) -> dict:
         return self.__kwargs
+
+    def session_profile(self, name: str = DEFAULT_PROFILE) -> sessionmaker:
+        """ Gets the :class:`sessionmaker <sessionmaker>` registered under the Session profile `name`.
+            If there is no such profile, it will raise an UnknownSessionProfileException.
+
+        :param name: The Session profile name (e.g. 'default', 'read-only', 'bulk').
+        :type name: str
+        :raises: UnknownSessionProfileException
+        :return: The profile's Session factory.
+        :rtype: sessionmaker
+        """
+        try:
+            return self.__profiles[name]
+        except KeyError:
+            __errors = {
+                'profile': name,
+                'profiles': self.session_profiles,
+            }
+            raise UnknownSessionProfileException(
+                message='The Session profile {profile} is not registered on {context}.'
+                    .format(profile=name,
+                            context=repr(self)),
+                errors=__errors,
+                profile=name
+            )
+
+    def register_session_profile(self, name: str, bind: Engine = None, **kwargs) -> sessionmaker:
+        """ Registers (or replaces) the Session profile `name`.
+
+        Usage:
+            >>> db = Context(settings={...})
+            >>> db.register_session_profile('reporting', autoflush=False, expire_on_commit=False)
+            >>> session = db(profile='reporting')
+
+        :param name: The Session profile name.
+        :type name: str
+        :param bind: The Engine (or Connectable) Sessions of this profile bind to.
+            Default: None => The Context's Engine.
+        :type bind: Engine
+        :param kwargs: Keyword arguments passed to :class:`sessionmaker <sessionmaker>` (e.g. autoflush,
+            expire_on_commit).
+        :return: The profile's Session factory.
+        :rtype: sessionmaker
+        """
+        if self.__replica is not None:
+            kwargs.setdefault('class_', ReplicaRoutingSession)
+        factory = sessionmaker(bind=self.__engine if bind is None else bind, **kwargs)
+        if self.__admission is not None:
+            self.__admission.watch_sessions(factory)
+        if self.__change_stream is not None:
+            self.__change_stream.watch_sessions(factory)
+        if self.__replica is not None:
+            self.__replica.watch_sessions(factory)
+        self.__profiles[name] = factory
+        return factory
+
+    def session_registry(self, profile: str = DEFAULT_PROFILE) -> SessionRegistry:
+        """ Gets the Context's :code:`SessionRegistry <SessionRegistry>` for the Session profile `profile`, which hands
+                out one Session per thread ('thread' scoping) or per thread, asyncio task and greenlet ('context'
+                scoping).
+
+        Usage:
+            >>> db = Context(settings={...}, session_scoping=CONTEXT_SCOPING)
+            >>> registry = db.session_registry()
+            >>> with registry.scope() as session:
+            ...     session.add(obj)
+            ...     session.commit()
+
+        :param profile: The name of the Session profile the registry opens Sessions from.
+        :type profile: str
+        :raises: UnknownSessionProfileException
+        :rtype: SessionRegistry
+        """
+        self.session_profile(profile)
+        with self.__registries_lock:
+            registry = self.__registries.get(profile)
+            if registry is None:
+                registry = _SESSION_REGISTRIES[self.__session_scoping](context=self, profile=profile)
+                self.__registries[profile] = registry
+            return registry
+
+    def open_session(self, profile: str = DEFAULT_PROFILE, owner: Any = None, timeout: float = None) -> Session:
+        """ Creates a new Session from the Session profile `profile`, and tracks it as in flight until it is handed
+                back to :code:`close_session()`. Repositories open all of their Sessions this way, so :code:`drain()`
+                can wait for them, and the :code:`AdmissionController <AdmissionController>` (if any) can bound them.
+
+        :param profile: The name of the Session profile to create the Session from.
+        :type profile: str
+        :param owner: The object the Session is opened for (e.g. a repository), reported by :code:`drain()`.
+        :param timeout: The maximum number of seconds to wait for admission.
+            Default: None => The admission controller's queue timeout.
+        :type timeout: float
+        :raises: UnknownSessionProfileException, ContextDrainingException, ContextSaturatedException
+        :return: A new Session instance
+        :rtype: Session
+        """
+        check_deadline(operation='open_session')
+        with self.span('session.open', profile=profile, owner=str(owner)) as span:
+            admitted_at = self.__admission.acquire(timeout=timeout) if self.__admission is not None else None
+            try:
+                session = self(profile=profile)
+                if span is not None:
+                    # Check the connection out now, so the time spent waiting on the pool is measured on its own.
+                    checkout_started = time.perf_counter()
+                    session.connection()
+                    span.pool_wait += time.perf_counter() - checkout_started
+            except Exception:
+                if admitted_at is not None:
+                    self.__admission.release(admitted_at, dropped=True)
+                raise
+        with self.__sessions_changed:
+            self.__active_sessions[id(session)] = (session, profile, owner, time.monotonic(), admitted_at)
+        return session
+
+    def close_session(self, session: Session):
+        """ Closes a Session opened by :code:`open_session()`, and stops tracking it. Its admission slot is released
+                with the time its statements took, as dropped if it hit a database error or was rolled back.
+
+        :param session: The Session to close.
+        :type session: Session
+        """
+        try:
+            with self.span('session.close'):
+                session.close()
+        finally:
+            with self.__sessions_changed:
+                record = self.__active_sessions.pop(id(session), None)
+                self.__sessions_changed.notify_all()
+            if record is not None and record[4] is not None:
+                self.__admission.release_session(session, record[4])
+
+    def span(self, name: str, **attributes):
+        """ Starts a tracing Span on the Context's :code:`Tracer <Tracer>`.
+
+        :param name: The span name.
+        :type name: str
+        :param attributes: Span attributes.
+        :return: A context manager yielding the Span, or None if there is no Tracer or the Span is not sampled.
+        """
+        if self.__tracer is None:
+            return nullcontext()
+        return self.__tracer.span(name, **attributes)
+
+    def warmup(self, n: int, timeout: float = None) -> int:
+        """ Pre-establishes and validates `n` pooled connections concurrently, so the first requests after startup
+                do not pay for connection setup. Connections beyond what the pool keeps (e.g. more than `pool_size` on a
+                :code:`QueuePool`) are validated, then discarded by the pool.
+
+        :param n: The number of connections to open.
+        :type n: int
+        :param timeout: The maximum number of seconds to wait for the connections, all together. Connections opened
+            later are closed when they arrive.
+            Default: None => As long as it takes.
+        :type timeout: float
+        :return: The number of connections opened and validated successfully within `timeout`.
+        :rtype: int
+        """
+        if n < 1:
+            return 0
+
+        ping = select([literal(1)])
+
+        def connect(_):
+            connection = self.__engine.connect()
+            try:
+                connection.scalar(ping)
+            except Exception:
+                connection.close()
+                raise
+            return connection
+
+        pool = ThreadPoolExecutor(max_workers=n)
+        (done, late) = wait([pool.submit(connect, i) for i in range(n)], timeout=timeout)
+        pool.shutdown(wait=False)
+        # Connections still being opened once the timeout expires are closed as soon as they arrive.
+        for future in late:
+            if not future.cancel():
+                future.add_done_callback(_close_connection)
+        connections = [future.result() for future in done if future.exception() is None]
+
+        # Every connection is held until all have been opened, otherwise the pool would hand the same one back.
+        for connection in connections:
+            connection.close()
+        return len(connections)
+
+    def drain(self, timeout: float = None) -> List[Dict[str, Any]]:
+        """ Gracefully shuts the Context down: stops handing out new Sessions, waits up to `timeout` seconds for the
+                Sessions opened through :code:`open_session()` to be closed, then disposes of the Engine's pool.
+
+        :param timeout: The maximum number of seconds to wait for in-flight Sessions.
+            Default: None => Wait until every Session is closed.
+        :type timeout: float
+        :return: A description of every Session still in flight when the Engine was disposed (profile, owner, and
+            age in seconds). Empty if the drain completed cleanly.
+        :rtype: List[Dict[str, Any]]
+        """
+        self.__draining = True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.__sessions_changed:
+            while self.__active_sessions:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.__sessions_changed.wait(timeout=remaining)
+            now = time.monotonic()
+            in_flight = [{
+                'profile': profile,
+                'owner': str(owner),
+                'age': now - opened_at,
+            } for (_, profile, owner, opened_at, _) in self.__active_sessions.values()]
+        self.__engine.dispose()
+        return in_flight
+
+    def __throw_context_draining_exception(self):
+        """ Raise a :code:`ContextDrainingException <ContextDrainingException>` """
+        __errors = {
+            'context': repr(self),
+            'active_sessions': self.active_sessions,
+        }
+        raise ContextDrainingException(
+            message='The context {context} is draining, and is not accepting new Sessions.'
+                .format(context=repr(self)),
+            errors=__errors
+        )
+
+    @staticmethod
+    def __engine_arguments(settings: dict) -> dict:
+        """ Gets the extra `create_engine()` arguments: dialects pooling with a QueuePool get a
+                :code:`DeadlineQueuePool <DeadlineQueuePool>`, so pool waits end with the caller's deadline.
+        """
+        url = URL(**settings)
+        if url.get_dialect().get_pool_class(url) is QueuePool:
+            return {'poolclass': DeadlineQueuePool}
+        return {}
+
+    def __read_only_engine(self) -> Engine:
+        """ Gets an Engine that checks out AUTOCOMMIT connections, so reads do not open (and later roll back) a
+            transaction. Dialects without an AUTOCOMMIT isolation level get the Context's Engine.
+
+        :rtype: Engine
+        """
+        if 'AUTOCOMMIT' in getattr(self.__engine.dialect, '_isolation_lookup', ()):
+            return self.__engine.execution_options(isolation_level='AUTOCOMMIT')
+        return self.__engine
+
+_SESSION_REGISTRIES = {
+    THREAD_SCOPING: ThreadLocalSessionRegistry,
+    CONTEXT_SCOPING: ContextVarSessionRegistry,
+}
+
+class UnknownSessionProfileException(Exception):
+    """ Unknown Session Profile """
+
+    def __init__(self, message: str, errors: dict, profile: str, *args):
+        super().__init__(message, *args)
+        self.__errors = errors
+        self.__profile = profile
+
+    @property
+    def errors(self) -> dict:
+        return self.__errors
+
+    @property
+    def profile(self) -> str:
+        return self.__profile
+
+class ContextDrainingException(Exception):
+    """ Context Is Draining """
+
+    def __init__(self, message: str, errors: dict, *args):
+        super().__init__(message, *args)
+        self.__errors = errors
+
+    @property
+    def errors(self) -> dict:
+        return self.__errors
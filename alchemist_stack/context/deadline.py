@@ -0,0 +1,191 @@
+# System Imports
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Union
+
+# Third-Party Imports
+from sqlalchemy import event
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+
+# Local Source Imports
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+""" The current request's deadline, as a `time.monotonic()` timestamp, or None when it has none. """
+_DEADLINE: ContextVar[Union[float, None]] = ContextVar('alchemist_deadline', default=None)
+
+""" Keys of the per-connection timeout state kept in `Connection.info`. """
+_SESSION_TIMEOUT = 'alchemist_session_statement_timeout'
+_PROGRESS_HANDLER = 'alchemist_progress_handler'
+
+""" How many SQLite virtual machine instructions run between two deadline checks. """
+_SQLITE_PROGRESS_STEPS = 1000
+
+_SELECT = re.compile(r'^(\s*SELECT)\b', re.IGNORECASE)
+
+@contextmanager
+def deadline(timeout: float):
+    """ Gives the database work done inside the block `timeout` seconds, at most.
+
+        The deadline follows the code through `contextvars` (so it is per thread and per asyncio task), and bounds
+        admission and pool waits, and every statement: `statement_timeout` on PostgreSQL, a `MAX_EXECUTION_TIME`
+        hint on MySQL SELECTs, and a progress handler on SQLite. Work that runs out of time raises a
+        :code:`DeadlineExceededException <DeadlineExceededException>`. A nested deadline never extends the one
+        around it.
+
+    Usage:
+        >>> with deadline(0.05):
+        ...     flags = repo.list(enabled=True)
+
+    :param timeout: How many seconds the block has.
+    :type timeout: float
+    """
+    expires_at = time.monotonic() + timeout
+    current = _DEADLINE.get()
+    token = _DEADLINE.set(expires_at if current is None else min(current, expires_at))
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+def current_deadline() -> Union[float, None]:
+    """ Gets the current deadline, as a `time.monotonic()` timestamp.
+
+    :rtype: float
+    """
+    return _DEADLINE.get()
+
+def remaining() -> Union[float, None]:
+    """ Gets how many seconds are left before the current deadline (negative once it has passed), or None without one.
+
+    :rtype: float
+    """
+    expires_at = _DEADLINE.get()
+    return None if expires_at is None else expires_at - time.monotonic()
+
+def check_deadline(operation: str = None):
+    """ Raises a :code:`DeadlineExceededException <DeadlineExceededException>` if the current deadline has passed.
+
+    :param operation: What was about to run, for the error message.
+    :type operation: str
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        _throw_deadline_exceeded_exception(operation=operation, overrun=-left)
+
+def _throw_deadline_exceeded_exception(operation: str = None, overrun: float = 0.0, cause: BaseException = None):
+    """ Raise a :code:`DeadlineExceededException <DeadlineExceededException>` """
+    __errors = {
+        'operation': operation,
+        'deadline': _DEADLINE.get(),
+        'overrun': overrun,
+    }
+    raise DeadlineExceededException(
+        message='The deadline passed {overrun:.3f}s ago{operation}.'
+            .format(overrun=overrun,
+                    operation='' if operation is None else ', before {op} finished'.format(op=operation)),
+        errors=__errors,
+        deadline=_DEADLINE.get()
+    ) from cause
+
+class DeadlineQueuePool(QueuePool):
+    """ QueuePool whose checkout timeout is cut to the time left before the current :code:`deadline()`. """
+
+    @property
+    def _timeout(self) -> float:
+        left = remaining()
+        return self.__timeout if left is None else max(0.0, min(self.__timeout, left))
+
+    @_timeout.setter
+    def _timeout(self, timeout: float):
+        self.__timeout = timeout
+
+    def _do_get(self):
+        try:
+            return super()._do_get()
+        except TimeoutError:
+            check_deadline(operation='connection checkout')
+            raise
+
+    def recreate(self):
+        # The new pool must get the configured timeout, not the time left to whoever recreates it.
+        token = _DEADLINE.set(None)
+        try:
+            return super().recreate()
+        finally:
+            _DEADLINE.reset(token)
+
+def instrument_deadlines(engine: Engine):
+    """ Bounds every statement executed on `engine` by the current :code:`deadline()`, and turns the errors of
+            statements cancelled by it into :code:`DeadlineExceededException <DeadlineExceededException>`s.
+    """
+    dialect = engine.dialect.name
+
+    @event.listens_for(engine, 'before_cursor_execute', retval=True)
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        left = remaining()
+        if left is None:
+            if dialect == 'sqlite' and conn.info.pop(_PROGRESS_HANDLER, False):
+                cursor.connection.set_progress_handler(None, 0)
+            return statement, parameters
+        if left <= 0:
+            _throw_deadline_exceeded_exception(operation=statement.split(None, 1)[0] if statement else None,
+                                               overrun=-left)
+
+        milliseconds = max(1, int(left * 1000))
+        if dialect == 'postgresql':
+            raw = cursor.connection
+            if getattr(raw, 'autocommit', False):
+                # Outside of a transaction SET LOCAL does nothing, so the timeout is set for the connection, and reset
+                # when it goes back to the pool.
+                cursor.execute('SET statement_timeout = {ms:d}'.format(ms=milliseconds))
+                conn.info[_SESSION_TIMEOUT] = True
+            else:
+                cursor.execute('SET LOCAL statement_timeout = {ms:d}'.format(ms=milliseconds))
+        elif dialect == 'mysql':
+            statement = _SELECT.sub(r'\1 /*+ MAX_EXECUTION_TIME({ms:d}) */'.format(ms=milliseconds), statement, count=1)
+        elif dialect == 'sqlite':
+            expires_at = _DEADLINE.get()
+            # The handler stays in place while the rows are fetched, and is removed by the next statement without a
+            # deadline, or when the connection goes back to the pool.
+            cursor.connection.set_progress_handler(lambda: time.monotonic() >= expires_at, _SQLITE_PROGRESS_STEPS)
+            conn.info[_PROGRESS_HANDLER] = True
+        return statement, parameters
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        left = remaining()
+        if left is not None and left <= 0:
+            statement = context.statement
+            _throw_deadline_exceeded_exception(operation=statement.split(None, 1)[0] if statement else None,
+                                               overrun=-left, cause=context.original_exception)
+
+    @event.listens_for(engine, 'checkin')
+    def checkin(dbapi_connection, connection_record):
+        info = connection_record.info
+        if info.pop(_PROGRESS_HANDLER, False):
+            dbapi_connection.set_progress_handler(None, 0)
+        if info.pop(_SESSION_TIMEOUT, False):
+            cursor = dbapi_connection.cursor()
+            cursor.execute('SET statement_timeout = DEFAULT')
+            cursor.close()
+
+class DeadlineExceededException(Exception):
+    """ The current :code:`deadline()` passed before the database work finished. """
+
+    def __init__(self, message: str, errors: dict, deadline: float, *args):
+        super().__init__(message, *args)
+        self.__errors = errors
+        self.__deadline = deadline
+
+    @property
+    def errors(self) -> dict:
+        return self.__errors
+
+    @property
+    def deadline(self) -> float:
+        return self.__deadline
@@ -0,0 +1,247 @@
+# System Imports
+import asyncio
+import threading
+import weakref
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Union
+
+# Third-Party Imports
+from sqlalchemy.orm.session import Session
+
+# Local Source Imports
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+""" Scope registered Sessions by thread, like SQL Alchemy's :code:`scoped_session <scoped_session>`. """
+THREAD_SCOPING = 'thread'
+
+""" Scope registered Sessions by execution context: thread, asyncio task, or greenlet. """
+CONTEXT_SCOPING = 'context'
+
+class SessionRegistry(ABC):
+    """ Session Registry Abstract Base Class for handing out one Session per scope.
+
+        Sessions are opened and closed through the :code:`Context <Context>`'s :code:`open_session()` and
+        :code:`close_session()`, so they count towards admission control, tracing, and :code:`drain()`. A Session that
+        is never removed is closed when its owner ends: the thread that opened it, or with context scoping, the asyncio
+        task.
+    """
+
+    def __init__(self, context: Any, profile: str):
+        self._context = context
+        self._profile = profile
+        self.__lock = threading.Lock()
+        self.__cancel_cleanup: Dict[int, Callable[[], None]] = {}
+
+    def __call__(self) -> Session:
+        """ Gets the current scope's Session, opening it if there is none.
+
+        :raises: UnknownSessionProfileException, ContextDrainingException, ContextSaturatedException
+        :rtype: Session
+        """
+        session = self._get()
+        if session is None:
+            session = self._context.open_session(profile=self._profile, owner=self)
+            self._set(session)
+            cancel = _when_owner_ends(self._owner(), lambda: self.__release(session))
+            with self.__lock:
+                self.__cancel_cleanup[id(session)] = cancel
+        return session
+
+    def __repr__(self) -> str:
+        """ A String representation of the :class:`SessionRegistry <SessionRegistry>`.
+
+        :returns: String representation of :class:`SessionRegistry <SessionRegistry>` object.
+        :rtype: str
+        """
+        return '<class {cls}(profile={profile}) at {hex_id}>'.format(cls=self.__class__.__name__,
+                                                                     profile=self._profile,
+                                                                     hex_id=hex(id(self)))
+
+    @property
+    def profile(self) -> str:
+        return self._profile
+
+    def has(self) -> bool:
+        """ Gets whether the current scope has a Session.
+
+        :rtype: bool
+        """
+        return self._get() is not None
+
+    def remove(self):
+        """ Closes the current scope's Session (if any) through the :code:`Context <Context>`. Uncommitted work is
+                rolled back.
+        """
+        session = self._get()
+        if session is not None:
+            self._set(None)
+            with self.__lock:
+                cancel = self.__cancel_cleanup.pop(id(session), None)
+            if cancel is not None:
+                cancel()
+            self._context.close_session(session)
+
+    @contextmanager
+    def scope(self):
+        """ Runs the body with a Session of its own, that is closed on exit no matter how the body exits. Scopes nest;
+                the enclosing scope's Session is restored afterwards.
+
+        Usage:
+            >>> registry = db.session_registry()
+            >>> async def handle(request):
+            ...     with registry.scope() as session:
+            ...         await do_work(registry)  # registry() is `session` here, and only here.
+
+        :return: The scope's Session.
+        """
+        with self._new_scope():
+            try:
+                yield self()
+            finally:
+                self.remove()
+
+    def query_property(self, query_cls: Any = None):
+        """ Gets a class property that produces a Query against the current scope's Session.
+
+        :param query_cls: The Query class to use.
+            Default: None => The Session's Query class.
+        """
+        registry = self
+
+        class QueryProperty(object):
+            def __get__(self, instance, owner):
+                session = registry()
+                if query_cls is not None:
+                    return query_cls(owner, session=session)
+                return session.query(owner)
+
+        return QueryProperty()
+
+    def __release(self, session: Session):
+        """ Closes `session` once the task or thread that opened it has ended without removing it. """
+        with self.__lock:
+            self.__cancel_cleanup.pop(id(session), None)
+        self._context.close_session(session)
+
+    def _owner(self) -> Any:
+        """ Gets what the current scope's Session belongs to: the asyncio task running in this thread, if any,
+                otherwise the thread.
+        """
+        return _current_owner()
+
+    @abstractmethod
+    def _get(self) -> Union[Session, None]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def _set(self, session: Union[Session, None]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def _new_scope(self):
+        raise NotImplementedError
+
+class ThreadLocalSessionRegistry(SessionRegistry):
+    """ One Session per thread. Tasks and greenlets sharing a thread share its Session. """
+
+    def __init__(self, context: Any, profile: str):
+        super().__init__(context=context, profile=profile)
+        self.__local = threading.local()
+
+    def _owner(self) -> Any:
+        return threading.get_ident()
+
+    def _get(self) -> Union[Session, None]:
+        return getattr(self.__local, 'session', None)
+
+    def _set(self, session: Union[Session, None]):
+        self.__local.session = session
+
+    @contextmanager
+    def _new_scope(self):
+        outer = self._get()
+        self._set(None)
+        try:
+            yield
+        finally:
+            self._set(outer)
+
+class _Slot(object):
+    """ Holds a scope's Session. `owner` is the asyncio task (or thread) that created the slot. """
+
+    __slots__ = ('owner', 'session')
+
+    def __init__(self, owner: Any):
+        self.owner = owner
+        self.session = None
+
+def _current_owner() -> Any:
+    """ Gets the asyncio task running in this thread, if any, otherwise the thread. """
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return task if task is not None else threading.get_ident()
+
+class _ThreadExit(object):
+    """ Marker kept in thread-local storage; it is collected, and its finalizers run, when its thread ends. """
+
+    __slots__ = ('__weakref__',)
+
+_THREAD_EXITS = threading.local()
+
+def _when_owner_ends(owner: Any, callback: Callable[[], None]) -> Callable[[], None]:
+    """ Calls `callback` once `owner` (an asyncio task, or the current thread) ends.
+
+    :param owner: The owner, from :code:`_current_owner()`.
+    :param callback: What to call.
+    :return: A function that cancels the call.
+    """
+    if isinstance(owner, asyncio.Future):
+        def done(_):
+            callback()
+        owner.add_done_callback(done)
+        return lambda: owner.remove_done_callback(done)
+    marker = getattr(_THREAD_EXITS, 'marker', None)
+    if marker is None:
+        marker = _THREAD_EXITS.marker = _ThreadExit()
+    return weakref.finalize(marker, callback).detach
+
+class ContextVarSessionRegistry(SessionRegistry):
+    """ One Session per execution context, held in a :code:`ContextVar <ContextVar>`.
+
+        Threads and greenlets each start with a context of their own. An asyncio task starts with a copy of its
+        creator's context, so a Session inherited that way is not reused: each task opens its own on first use.
+    """
+
+    def __init__(self, context: Any, profile: str):
+        super().__init__(context=context, profile=profile)
+        self.__slot: ContextVar = ContextVar('alchemist_stack_session_{id:x}'.format(id=id(self)), default=None)
+
+    def __current_slot(self, create: bool) -> Union[_Slot, None]:
+        slot = self.__slot.get()
+        owner = _current_owner()
+        if slot is None or slot.owner != owner:
+            if not create:
+                return None
+            slot = _Slot(owner=owner)
+            self.__slot.set(slot)
+        return slot
+
+    def _get(self) -> Union[Session, None]:
+        slot = self.__current_slot(create=False)
+        return slot.session if slot is not None else None
+
+    def _set(self, session: Union[Session, None]):
+        self.__current_slot(create=True).session = session
+
+    @contextmanager
+    def _new_scope(self):
+        token = self.__slot.set(_Slot(owner=_current_owner()))
+        try:
+            yield
+        finally:
+            self.__slot.reset(token)
@@ -0,0 +1,344 @@
+# System Imports
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Set, Union
+
+# Third-Party Imports
+from sqlalchemy import and_, create_engine, event, inspect, or_, select
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.orm.session import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import Column, Table
+from sqlalchemy.sql.selectable import Select
+from sqlalchemy.sql.util import find_tables
+
+# Local Source Imports
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+logger = logging.getLogger('Alchemist Stack')
+
+""" Keys of the routing state kept in `Session.info`. """
+_REPLICA = 'alchemist_replica'
+_WROTE = 'alchemist_replica_wrote'
+
+""" The largest number of primary keys refreshed with one `IN (...)`. """
+_KEY_CHUNK = 500
+
+class _ReplicatedTable(object):
+    """ Refresh state of one replicated table. """
+
+    __slots__ = ('table', 'primary_key', 'watermark', 'last_watermark', 'refreshed_at', 'refreshes', 'generation',
+                 'dirty', 'pending', 'full')
+
+    def __init__(self, table: Table, watermark: Union[Column, None]):
+        self.table = table
+        self.primary_key: List[Column] = list(table.primary_key.columns)
+        self.watermark = watermark
+        self.last_watermark = None
+        self.refreshed_at: Union[float, None] = None
+        self.refreshes = 0
+        self.generation = 0
+        self.dirty = False
+        self.pending: Set[Any] = set()
+        self.full = True
+
+class ReplicaRoutingSession(Session):
+    """ Session sending the SELECTs of replicated models to the :code:`Context <Context>`'s
+            :code:`LocalReplica <LocalReplica>`, as long as the replica is fresh for every table they read.
+
+        Everything else goes to the primary: writes, `SELECT ... FOR UPDATE`, text statements, queries touching a table
+        that is not replicated, and every query of a Session that has written (so it reads its own writes).
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        replica: LocalReplica = self.info.get(_REPLICA)
+        if replica is not None and mapper is not None and not self.info.get(_WROTE):
+            if isinstance(clause, Select):
+                if clause._for_update_arg is None:
+                    engine = replica.route(clause)
+                    if engine is not None:
+                        return engine
+            elif clause is not None:
+                self.info[_WROTE] = True
+        return super().get_bind(mapper=mapper, clause=clause)
+
+@event.listens_for(ReplicaRoutingSession, 'after_flush')
+def _after_flush(session: Session, flush_context):
+    session.info[_WROTE] = True
+
+class LocalReplica(object):
+    """ Read-through local replica of small, read-mostly tables (codes, configuration, feature flags), kept in a
+            per-process, memory-mapped SQLite database.
+
+        A background thread copies the chosen models from the primary every `refresh_interval` seconds: the whole
+        table, or, for models given a `watermark` column (e.g. an `updated_at` or version column), only the rows whose
+        watermark moved, with a full copy every `full_refresh_every` refreshes to pick up deletes. With a
+        :code:`ChangeStream <ChangeStream>` on the Context, every committed write to a replicated table marks it stale
+        at once, and wakes the thread to copy just the rows written.
+
+        Sessions of the Context are :code:`ReplicaRoutingSession <ReplicaRoutingSession>`s: queries on replicated
+        models (e.g. from `_read_object()`) are served locally through the same Query API while the replica is fresh,
+        and go to the primary while it is stale (not yet loaded, a write not yet copied, or older than
+        `max_staleness` seconds).
+
+    Usage:
+        >>> replica = LocalReplica(models=[FeatureFlag, CountryCode], refresh_interval=5)
+        >>> db = Context(settings={...}, replica=replica, change_stream=ChangeStream())
+        >>> repo._read_object(FeatureFlag).with_session(session).filter_by(name='beta').one()   # Served locally.
+    """
+
+    def __init__(self, models: Iterable[Any], path: str = None, refresh_interval: float = 5.0,
+                 max_staleness: float = None, watermarks: Dict[Any, Any] = None, full_refresh_every: int = 12,
+                 mmap_size: int = 256 * 1024 * 1024):
+        """ Local Replica Constructor
+
+        :param models: The models to replicate.
+        :param path: The SQLite database file.
+            Default: None => A file in a new temporary directory, removed by :code:`close()`.
+        :type path: str
+        :param refresh_interval: How many seconds between refreshes.
+        :type refresh_interval: float
+        :param max_staleness: How old (in seconds) the last refresh may be before reads fall back to the primary.
+            Default: None => Three refresh intervals.
+        :type max_staleness: float
+        :param watermarks: Model => the column (or attribute) whose value grows on every insert and update.
+        :type watermarks: dict
+        :param full_refresh_every: How many incremental refreshes run between two full ones.
+        :type full_refresh_every: int
+        :param mmap_size: How many bytes of the database file SQLite memory-maps.
+        :type mmap_size: int
+        """
+        self.__directory = tempfile.mkdtemp(prefix='alchemist-replica-') if path is None else None
+        self.__path = path if path is not None else os.path.join(self.__directory, 'replica.db')
+        self.__refresh_interval = refresh_interval
+        self.__max_staleness = max_staleness if max_staleness is not None else refresh_interval * 3
+        self.__full_refresh_every = full_refresh_every
+        self.__tables: Dict[str, _ReplicatedTable] = {}
+        for model in models:
+            table = inspect(model).local_table
+            watermark = (watermarks or {}).get(model)
+            if watermark is not None and not isinstance(watermark, Column):
+                watermark = inspect(model).get_property(getattr(watermark, 'key', watermark)).columns[0]
+            self.__tables[table.name] = _ReplicatedTable(table, watermark)
+
+        self.__engine: Engine = create_engine('sqlite:///{path}'.format(path=self.__path), poolclass=QueuePool,
+                                              pool_size=8, max_overflow=32,
+                                              connect_args={'check_same_thread': False})
+
+        @event.listens_for(self.__engine, 'connect')
+        def connect(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=OFF')
+            cursor.execute('PRAGMA mmap_size={size:d}'.format(size=mmap_size))
+            cursor.close()
+
+        for state in self.__tables.values():
+            state.table.create(bind=self.__engine, checkfirst=True)
+
+        self.__context = None
+        self.__subscription = None
+        self.__refresh_lock = threading.Lock()
+        self.__state_lock = threading.Lock()
+        self.__wake = threading.Event()
+        self.__closed = False
+        self.__thread: Union[threading.Thread, None] = None
+        self.__local_reads = 0
+        self.__primary_reads = 0
+
+    @property
+    def engine(self) -> Engine:
+        return self.__engine
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    @property
+    def tables(self) -> List[str]:
+        return list(self.__tables.keys())
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """ Gets how many routed queries were served locally, and how many fell back to the primary.
+
+        :rtype: dict
+        """
+        return {'local': self.__local_reads, 'primary': self.__primary_reads}
+
+    def attach(self, context: Any):
+        """ Replicates from `context`. Called by the :code:`Context <Context>` given this replica; the refresh thread
+                starts with the first routed read.
+        """
+        if self.__context is not None:
+            raise ValueError('The LocalReplica is already attached to {context}'.format(context=repr(self.__context)))
+        self.__context = context
+        if context.change_stream is not None:
+            self.__subscription = context.change_stream.subscribe(callback=self.__on_change)
+
+    def watch_sessions(self, factory: sessionmaker):
+        """ Routes the Sessions `factory` creates (which must be :code:`ReplicaRoutingSession
+                <ReplicaRoutingSession>`s) through this replica.
+        """
+        info = dict(factory.kw.get('info') or {})
+        info[_REPLICA] = self
+        factory.configure(info=info)
+
+    def is_fresh(self, table: str) -> bool:
+        """ Gets whether reads of `table` may be served locally.
+
+        :rtype: bool
+        """
+        state = self.__tables.get(table)
+        return state is not None and not state.dirty and state.refreshed_at is not None \
+            and time.monotonic() - state.refreshed_at <= self.__max_staleness
+
+    def route(self, statement: Select) -> Union[Engine, None]:
+        """ Gets the replica's Engine if every table `statement` reads is replicated and fresh, otherwise None.
+                The first call starts the refresh thread.
+        """
+        if self.__thread is None:
+            self.__start()
+        for table in find_tables(statement, include_aliases=True, include_joins=True):
+            if isinstance(table, Table) and not self.is_fresh(table.name):
+                self.__primary_reads += 1
+                return None
+        self.__local_reads += 1
+        return self.__engine
+
+    def invalidate(self, table: str = None, primary_keys: List[Any] = None):
+        """ Marks `table` (or every table) stale until its rows `primary_keys` (or all of its rows) are copied again,
+                and wakes the refresh thread.
+        """
+        with self.__state_lock:
+            for state in (self.__tables.values() if table is None else [self.__tables[table]]):
+                state.generation += 1
+                state.dirty = True
+                if primary_keys is None:
+                    state.full = True
+                else:
+                    state.pending.update(primary_keys)
+        self.__wake.set()
+
+    def refresh(self, full: bool = False):
+        """ Copies the changes of every replicated table from the primary, now.
+
+        :param full: Whether to copy every row, not only the changed ones.
+        :type full: bool
+        """
+        with self.__refresh_lock:
+            for state in self.__tables.values():
+                self.__refresh_table(state, full=full)
+
+    def close(self):
+        """ Stops refreshing, unsubscribes from the change stream, and removes the temporary database. """
+        self.__closed = True
+        self.__wake.set()
+        if self.__subscription is not None:
+            self.__subscription.close()
+        if self.__thread is not None:
+            self.__thread.join()
+        self.__engine.dispose()
+        if self.__directory is not None:
+            shutil.rmtree(self.__directory, ignore_errors=True)
+
+    def __start(self):
+        with self.__state_lock:
+            if self.__thread is None and not self.__closed:
+                self.__thread = threading.Thread(target=self.__run, name='alchemist-replica-refresh', daemon=True)
+                self.__thread.start()
+
+    def __on_change(self, change):
+        if change.table in self.__tables:
+            self.invalidate(change.table, primary_keys=change.primary_keys)
+
+    def __run(self):
+        # Tables already copied (e.g. by an explicit refresh()) are next due one interval after their last copy.
+        refreshed = [state.refreshed_at for state in self.__tables.values()]
+        deadline = 0.0 if None in refreshed else min(refreshed, default=0.0) + self.__refresh_interval
+        while not self.__closed:
+            woken = self.__wake.wait(timeout=max(0.0, deadline - time.monotonic()))
+            self.__wake.clear()
+            if self.__closed:
+                return
+            now = time.monotonic()
+            try:
+                with self.__refresh_lock:
+                    for state in self.__tables.values():
+                        if now >= deadline or state.dirty:
+                            self.__refresh_table(state)
+            except Exception as error:
+                logger.error('Local replica failed to refresh: {error}'.format(error=error))
+            if not woken or now >= deadline:
+                deadline = now + self.__refresh_interval
+
+    def __refresh_table(self, state: _ReplicatedTable, full: bool = False):
+        """ Copies the rows of one table from the primary, in one replica transaction, so readers only ever see a
+                whole refresh.
+        """
+        with self.__state_lock:
+            started = time.monotonic()
+            generation = state.generation
+            (pending, state.pending) = (state.pending, set())
+            full = full or state.full or (not pending and (state.watermark is None or state.last_watermark is None
+                                                           or state.refreshes >= self.__full_refresh_every))
+            state.full = False
+        table = state.table
+        try:
+            with self.__context.engine.connect() as primary:
+                if full:
+                    rows = primary.execute(select([table])).fetchall()
+                    keys = None
+                else:
+                    keys = set(pending)
+                    if not pending:
+                        rows = primary.execute(select([table]).where(state.watermark >= state.last_watermark))\
+                            .fetchall()
+                        keys.update(self.__key(state, row) for row in rows)
+                    else:
+                        rows = []
+                        keys_list = list(pending)
+                        for i in range(0, len(keys_list), _KEY_CHUNK):
+                            rows.extend(primary.execute(select([table]).where(
+                                self.__key_criteria(state, keys_list[i:i + _KEY_CHUNK]))).fetchall())
+            with self.__engine.begin() as replica:
+                if keys is None:
+                    replica.execute(table.delete())
+                else:
+                    keys_list = list(keys)
+                    for i in range(0, len(keys_list), _KEY_CHUNK):
+                        replica.execute(table.delete().where(self.__key_criteria(state, keys_list[i:i + _KEY_CHUNK])))
+                if rows:
+                    replica.execute(table.insert(), [{column.key: row[column] for column in table.c} for row in rows])
+        except Exception:
+            # Put the work back, so the next refresh retries it.
+            with self.__state_lock:
+                state.pending.update(pending)
+                state.full = state.full or full
+            raise
+
+        if state.watermark is not None and rows:
+            highest = max(row[state.watermark] for row in rows)
+            if state.last_watermark is None or full or highest > state.last_watermark:
+                state.last_watermark = highest
+        with self.__state_lock:
+            state.refreshes = 0 if full else state.refreshes + 1
+            state.refreshed_at = started
+            if state.generation == generation:
+                state.dirty = False
+
+    @staticmethod
+    def __key(state: _ReplicatedTable, row) -> Any:
+        values = tuple(row[column] for column in state.primary_key)
+        return values if len(values) > 1 else values[0]
+
+    @staticmethod
+    def __key_criteria(state: _ReplicatedTable, keys: List[Any]):
+        if len(state.primary_key) == 1:
+            return state.primary_key[0].in_(keys)
+        return or_(*[and_(*[column == value for (column, value) in zip(state.primary_key, key)]) for key in keys])
@@ -1,38 +1,80 @@
 # System Imports
+import asyncio
+import contextvars
 from abc import ABC, abstractmethod
+from concurrent.futures import Future
 from contextlib import contextmanager
-from typing import Any, Type
+from typing import Any, Callable, Dict, List, Tuple, Type, Union
 
 # Third-Party Imports
+from sqlalchemy import and_, bindparam, func, or_, select
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 from sqlalchemy.orm.query import Query
 from sqlalchemy.orm.session import Session
 from sqlalchemy.util import IdentitySet
 
 # Local Source Imports
-from alchemist_stack.context import Context
+from alchemist_stack.context import Context, SessionRegistry, BULK_PROFILE, DEFAULT_PROFILE, READ_ONLY_PROFILE
+from .advisor import IndexAdvisor, IndexCandidate, RecordedStatement, WorkloadRecorder, analyze_statement
+from .batch import BatchSession, BATCH_COMMIT, BATCH_FLUSH, BATCH_MODES, BATCH_SAVEPOINT, approximate_size
+from .buffer import WriteBuffer, WriteBufferClosedException, WriteBufferFullException
+from .loader import DataLoader, LoaderFuture, loader_scope, scoped_loader
+from .counting import CountCache, COUNT_CACHED, COUNT_ESTIMATED, COUNT_EXACT, COUNT_MODES, estimate_count
 from .models import Base, B, create_tables
+from .models.registry import ModelMetadata, model_metadata
+from .retry import RetryPolicy, NO_RETRY
+from .singleflight import SingleFlight, SingleFlightTimeoutException, statement_key
+from .scan import parallel_scan, SPLIT_MINMAX, SPLIT_QUANTILE
+from .tracking import ChangeTracker
 
 __author__ = 'H.D. "Chip" McCullough IV'
 
+_PK_PARAM = '_pk_'
+_VALUE_PARAM = '_v_'
+_VERSION_PARAM = '_version_'
+_NEXT_VERSION_PARAM = '_next_version_'
+
+""" The most bound parameters one statement may hold, per dialect: SQLite's default SQLITE_MAX_VARIABLE_NUMBER (999
+    before 3.32), SQL Server's 2100, Oracle's 1000 expressions per IN list, and the 16-bit parameter counts of the
+    PostgreSQL and MySQL wire protocols. Other dialects get `_DEFAULT_IN_LIST_LIMIT`.
+"""
+_IN_LIST_LIMITS = {'sqlite': 999, 'mssql': 2000, 'oracle': 1000, 'postgresql': 32767, 'mysql': 65535}
+_DEFAULT_IN_LIST_LIMIT = 1000
+
 class RepositoryBase(ABC):
     """ Repository Base Abstract Base Class for implementing model repositories """
 
-    __scoped_session_factory = None
-    __active_scoped_session = False
-
-    def __init__(self, context: Context, *args, **kwargs):
+    def __init__(self, context: Context, *args, write_buffer: WriteBuffer = None, retry_policy: RetryPolicy = None,
+                 count_cache: CountCache = None, single_flight: SingleFlight = None, **kwargs):
         """ Repository Base Constructor
         
         :param context: The Database :code:`Context <Context>`
         :type context:
         :param args: 
+        :param write_buffer: An optional, shared :code:`WriteBuffer <WriteBuffer>`. When given, auto-committed creates
+            are group-committed through the buffer instead of opening one transaction each.
+        :type write_buffer: WriteBuffer
+        :param retry_policy: How versioned updates that lose a race are retried.
+            Default: None => :code:`RetryPolicy() <RetryPolicy>` (3 retries, with jittered exponential backoff).
+        :type retry_policy: RetryPolicy
+        :param count_cache: Where :code:`_count_objects()` caches counts.
+            Default: None => The cache shared by every repository of `context`.
+        :type count_cache: CountCache
+        :param single_flight: Where identical concurrent reads (:code:`_select()`, :code:`_count_objects()`) are
+            deduplicated. Default: None => Every read runs.
+        :type single_flight: SingleFlight
         :param kwargs: 
         """
         self.__context = context
         self.__session_factory = context.sessionmaker
+        self.__write_buffer = write_buffer
+        self.__change_tracker = ChangeTracker()
+        self.__retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.__count_cache = count_cache if count_cache is not None else CountCache.for_context(context)
+        self.__single_flight = single_flight
+        self.__batch_session: Union[BatchSession, None] = None
+        self.__session_registry: Union[SessionRegistry, None] = None
         self.__local_session = None
         self.__args = args
         self.__kwargs = kwargs
@@ -45,7 +87,7 @@ class RepositoryBase(ABC):
         """
         if not self.__active_local_session:
             self.__active_local_session = True
-            self.__local_session = self.__session_factory()
+            self.__local_session = self.__context.open_session(owner=self)
         return self.__local_session
 
     def __del__(self):
@@ -54,8 +96,6 @@ class RepositoryBase(ABC):
                 `commit_session()`, as this will commit the existing transaction, then close the connection.
         """
         if self.__active_local_session and isinstance(self.__local_session, Session):
-            self.__local_session.close()
-            self.__local_session = None
             self.__session_close()
 
     def __repr__(self) -> str:
@@ -123,27 +163,30 @@ class RepositoryBase(ABC):
         pass
 
     @contextmanager
-    def session_scope(self):
+    def session_scope(self, profile: str = DEFAULT_PROFILE):
         """ Transactional scope for committing a series of transactions.
             If there are no pending transactions (create, update, delete), it will raise a NoPendingCommitException.
             If the session instance was not able to be created, it will raise a NoOpenSessionException.
 
-        :raises: NoPendingCommitException, NoOpenSessionException
+        :param profile: The name of the :code:`Context <Context>` Session profile to open the Session with.
+        :type profile: str
+        :raises: NoPendingCommitException, NoOpenSessionException, UnknownSessionProfileException
         """
-        __session = self.__session_factory()
-
-        if isinstance(__session, Session):
-            try:
-                yield __session
-                __session.commit()
-            except SQLAlchemyError as sqlerror:  # TODO: Catch psycopg2 IntegretyError -> Expand to other dialects.
-                __session.rollback()
-                print(sqlerror)
-                self.__throw_no_pending_commit_exception()
-            finally:
-                __session.close()
-        else:
-            self.__throw_no_open_session_exception()
+        with self.__span(operation='session_scope'):
+            __session = self.__context.open_session(profile=profile, owner=self)
+
+            if isinstance(__session, Session):
+                try:
+                    yield __session
+                    __session.commit()
+                except SQLAlchemyError as sqlerror:  # TODO: Catch psycopg2 IntegretyError -> Expand to other dialects.
+                    __session.rollback()
+                    print(sqlerror)
+                    self.__throw_no_pending_commit_exception()
+                finally:
+                    self.__context.close_session(__session)
+            else:
+                self.__throw_no_open_session_exception()
 
     @property
     def context(self) -> Context:
@@ -154,6 +197,58 @@ class RepositoryBase(ABC):
         """
         return self.__context
 
+    @property
+    def write_buffer(self) -> Union[WriteBuffer, None]:
+        """ Gets the :code:`WriteBuffer <WriteBuffer>` used for auto-committed creates, if any.
+
+        :return: The repository's Write Buffer, or None.
+        :rtype: WriteBuffer
+        """
+        return self.__write_buffer
+
+    @property
+    def change_tracker(self) -> ChangeTracker:
+        """ Gets the repository's :code:`ChangeTracker <ChangeTracker>`, used by :code:`_save_tracked()` when no
+                other tracker is given.
+
+        :return: The repository's Change Tracker.
+        :rtype: ChangeTracker
+        """
+        return self.__change_tracker
+
+    @property
+    def retry_policy(self) -> RetryPolicy:
+        """ Gets the policy versioned updates are retried with.
+
+        :rtype: RetryPolicy
+        """
+        return self.__retry_policy
+
+    @property
+    def count_cache(self) -> CountCache:
+        """ Gets the cache :code:`_count_objects()` reuses counts from.
+
+        :rtype: CountCache
+        """
+        return self.__count_cache
+
+    @property
+    def batch_session(self) -> Union[BatchSession, None]:
+        """ Gets the :code:`BatchSession <BatchSession>` bounding the local Session, if it was created with
+                :code:`_create_batch_session()`.
+
+        :rtype: BatchSession
+        """
+        return self.__batch_session
+
+    @property
+    def single_flight(self) -> Union[SingleFlight, None]:
+        """ Gets the :code:`SingleFlight <SingleFlight>` deduplicating identical concurrent reads, if any.
+
+        :rtype: SingleFlight
+        """
+        return self.__single_flight
+
     @property
     def local_session(self) -> Session:
         """ Gets the current instance of the SQL Alchemy Session.
@@ -169,12 +264,24 @@ class RepositoryBase(ABC):
 
     @property
     def thread_safe_session(self) -> Session:
-        """ Gets the current thread-safe Scoped Session.
+        """ Gets the Session of the current scope (thread, or thread / asyncio task / greenlet, depending on the
+                :code:`Context <Context>`'s `session_scoping`), opening it if there is none.
 
-        :return: SQL Alchemy :code`scoped_session <scoped_session>`
-        :rtype: scoped_session
+        :return: SQL Alchemy Session instance
+        :rtype: Session
         """
-        return self.__scoped_session_factory()
+        if self.__session_registry is None:
+            self._create_thread_safe_session()
+        return self.__session_registry()
+
+    @property
+    def session_registry(self) -> Union[SessionRegistry, None]:
+        """ Gets the :code:`SessionRegistry <SessionRegistry>` handing out :code:`thread_safe_session`, if one was
+                created.
+
+        :rtype: SessionRegistry
+        """
+        return self.__session_registry
 
     @property
     def pending_commit(self) -> bool:
@@ -209,25 +316,51 @@ class RepositoryBase(ABC):
         """
         raise NotImplementedError
 
-    def _create_session(self):
+    def _create_session(self, profile: str = DEFAULT_PROFILE):
         """ Creates a new SQL Alchemy Session.
             If there is already an open Session, it will raise a SessionIsOpenException.
 
-        :raises: SessionIsOpenException
+        :param profile: The name of the :code:`Context <Context>` Session profile to open the Session with.
+        :type profile: str
+        :raises: SessionIsOpenException, UnknownSessionProfileException
         """
         if self.__active_local_session:
             self.__throw_session_is_open_exception()
-        self.__local_session = self.__session_factory()
+        self.__local_session = self.__context.open_session(profile=profile, owner=self)
         self.__session_open()
 
-    def _create_thread_safe_session(self):
+    def _create_batch_session(self, batch: BatchSession = None, profile: str = BULK_PROFILE) -> BatchSession:
+        """ Creates a new local SQL Alchemy Session for a batch job, kept within a fixed footprint by `batch`: the
+                objects added with :code:`_create_object(auto_commit=False) <_create_object>` are checkpointed (flushed,
+                committed, or released in a savepoint) and expunged every batch, and :code:`_commit_session()` commits
+                the rest.
+            If there is already an open Session, it will raise a SessionIsOpenException.
+
+        :param batch: The batch limits and mode. Default: None => :code:`BatchSession() <BatchSession>` (flush and
+            expunge every 10000 objects or 64 MB).
+        :type batch: BatchSession
+        :param profile: The name of the :code:`Context <Context>` Session profile to open the Session with.
+        :type profile: str
+        :raises: SessionIsOpenException, UnknownSessionProfileException
+        :return: The BatchSession, to read its stats from.
+        :rtype: BatchSession
+        """
+        self._create_session(profile=profile)
+        self.__batch_session = batch if batch is not None else BatchSession()
+        self.__batch_session.attach(self.__local_session)
+        return self.__batch_session
+
+    def _create_thread_safe_session(self, profile: str = DEFAULT_PROFILE):
         """ Creates the context to distribute thread-safe Sessions via
-            code:`thread_safe_session <thread_safe_session>`.
+            code:`thread_safe_session <thread_safe_session>`. The registry belongs to the :code:`Context <Context>`,
+            so repositories sharing a Context and profile share the current scope's Session.
 
+        :param profile: The name of the :code:`Context <Context>` Session profile to create Sessions with.
+        :type profile: str
+        :raises: UnknownSessionProfileException
         """
-        if not self.__active_scoped_session:
-            self.__scoped_session_factory = scoped_session(self.__session_factory)
-            self.__scoped_session_open()
+        if self.__session_registry is None:
+            self.__session_registry = self.__context.session_registry(profile)
 
     def _commit_session(self):
         """ Commits the current open SQL Alchemy Session, saving pending transactions to the context.
@@ -239,13 +372,14 @@ class RepositoryBase(ABC):
         """
         if self.__active_local_session and isinstance(self.__local_session, Session) and self.pending_commit:
             try:
+                if self.__batch_session is not None:
+                    self.__batch_session.finish()
                 self.__local_session.commit()
                 self.__pending_commit = False
             except SQLAlchemyError as sqlerror:
                 print(sqlerror)
                 self.__local_session.rollback()
             finally:
-                self.__local_session.close()
                 self.__session_close()
         else:
             if not self.__active_local_session:
@@ -262,45 +396,61 @@ class RepositoryBase(ABC):
         """
         if self.__active_local_session and isinstance(self.__local_session, Session):
             if force:
-                self.__local_session.close()
                 self.__session_close()
             else:
                 if self.__pending_commit:
                     self._commit_session()
                 else:
-                    self.__local_session.close()
                     self.__session_close()
 
     def _remove_thread_safe_sessions(self, force: bool = False):
-        """ Closes the current SQL Alchemy Scoped Session
+        """ Closes the current scope's thread-safe Session.
 
         :param force: Whether to force the Session closed without committing or not.
             Default: False => Session will be committed before closing.
         :type force: bool
         """
-        if self.__active_scoped_session:
-            if force:
-                self.__scoped_session_factory.remove()
+        if self.__session_registry is not None and self.__session_registry.has():
+            if not force:
+                session = self.__session_registry()
+                try:
+                    session.commit()
+                except SQLAlchemyError:
+                    session.rollback()
+                    raise
+                finally:
+                    self.__session_registry.remove()
+            else:
+                self.__session_registry.remove()
 
     def __session_open(self):
         """ Sets the value of `__session_is_open` to True. """
         self.__active_local_session = True
 
-    def __scoped_session_open(self):
-        """ Sets the value of `__active_scoped_session` to True. """
-        self.__active_scoped_session = True
-
     def __session_close(self):
-        """ Sets the value of `__session_is_open` to False. """
+        """ Closes the local Session through the :code:`Context <Context>`, and sets the value of `__session_is_open`
+                to False.
+        """
+        if self.__batch_session is not None:
+            self.__batch_session.detach()
+            self.__batch_session = None
+        if isinstance(self.__local_session, Session):
+            self.__context.close_session(self.__local_session)
         self.__local_session = None
         self.__active_local_session = False
 
-    def __scoped_session_close(self):
-        """ Kills all thread-local sessions, and sets the value of `__active_scoped_session` to False. """
-        if isinstance(self.__scoped_session_factory, scoped_session):
-            self.__scoped_session_factory.remove()
-            self.__scoped_session_factory = None
-            self.__active_scoped_session = False
+    def __span(self, operation: str, model: Any = None):
+        """ Starts a tracing Span for a repository operation on the :code:`Context <Context>`'s Tracer.
+
+        :param operation: The operation name (e.g. 'create', 'read').
+        :type operation: str
+        :param model: The model class the operation works on.
+        :return: A context manager yielding the Span, or None if it is not being recorded.
+        """
+        return self.__context.span('repository.{operation}'.format(operation=operation),
+                                   repository=self.__class__.__name__,
+                                   model=getattr(model, '__name__', None),
+                                   operation=operation)
 
     def __create_query(self, cls: Base) -> Query:
         """ Creates a raw SQL Alchemy Query on table `cls`. This Query is not bound to a session, and therefore must be
@@ -311,11 +461,66 @@ class RepositoryBase(ABC):
         :return: A SQL Alchemy Query on table `cls`.
         :rtype: Query
         """
-        if issubclass(cls, Base):
+        if model_metadata(cls) is not None:
             return Query(entities=cls)
         else:
             self.__throw_unknown_model_exception(cls=cls)
 
+    def __metadata(self, cls: Base) -> ModelMetadata:
+        """ Gets the :code:`ModelMetadata <ModelMetadata>` of `cls`, or raises an
+                :code:`UnknownModelException <UnknownModelException>` if `cls` does not inherit from Base.
+        """
+        metadata = model_metadata(cls)
+        if metadata is None:
+            self.__throw_unknown_model_exception(cls=cls)
+        return metadata
+
+    def __versioned_metadata(self, cls: Base) -> ModelMetadata:
+        """ Gets the metadata of `cls`, which must declare a version column
+                (`__mapper_args__ = {'version_id_col': ...}`). Otherwise it will raise an
+                :code:`UnknownModelException <UnknownModelException>` or
+                :code:`UnknownColumnException <UnknownColumnException>`.
+        """
+        metadata = self.__metadata(cls)
+        if metadata.version_column is None:
+            self.__throw_unknown_column_exception(cls=cls, column='version_id_col')
+        if metadata.mapper.version_id_generator is False:
+            # Server-side versions cannot be predicted, so the UPDATE could not be made conditional on them.
+            self.__throw_unknown_column_exception(cls=cls, column='version_id_generator')
+        return metadata
+
+    def __update_columns(self, cls: Base, metadata: ModelMetadata, values: dict) -> dict:
+        """ Validates the keys of `values` (attribute names, or InstrumentedAttributes of `cls`), and keys the values
+                by Column for a Core UPDATE.
+        """
+        columns = {}
+        for (key, value) in values.items():
+            if isinstance(key, InstrumentedAttribute) and metadata.attribute(key) is None:
+                self.__throw_unknown_update_key_exception(cls=cls, key=key, value=value)
+            column = metadata.column(key)
+            if column is None:
+                self.__throw_unknown_column_exception(cls=cls, column=key)
+            columns[column] = value
+        return columns
+
+    @staticmethod
+    def __primary_key_criteria(metadata: ModelMetadata, key: Any):
+        """ Builds the WHERE criteria matching the primary key `key` (a scalar, or a tuple for composite keys). """
+        keys = key if isinstance(key, tuple) else (key,)
+        return and_(*[column == value for ((_, column), value) in zip(metadata.primary_keys, keys)])
+
+    @staticmethod
+    def __current_versions(session: Session, metadata: ModelMetadata,
+                           keys: List[Tuple[Any, ...]]) -> Dict[Tuple[Any, ...], Any]:
+        """ Selects the current version of every row in `keys` (primary key tuples). Missing rows are left out. """
+        primary_key = [column for (_, column) in metadata.primary_keys]
+        if len(primary_key) == 1:
+            criteria = primary_key[0].in_([key[0] for key in keys])
+        else:
+            criteria = or_(*[and_(*[column == value for (column, value) in zip(primary_key, key)]) for key in keys])
+        rows = session.execute(select(primary_key + [metadata.version_column]).where(criteria))
+        return {tuple(row[:-1]): row[-1] for row in rows}
+
     def __bind_current_session_to_query(self, query: Query) -> Query:
         """ Binds the current open SQL Alchemy :code:`Session <Session>` to :parameter:`query <Query>`.
 
@@ -373,7 +578,7 @@ class RepositoryBase(ABC):
         }
         raise UnknownModelException(
             message='The entity {cls} does not inherit from the Declarative Base.'
-                .format(cls=cls.__name__),
+                .format(cls=getattr(cls, '__name__', type(cls).__name__)),
             errors=__errors,
             model=cls
         )
@@ -415,7 +620,26 @@ class RepositoryBase(ABC):
             value=value,
         )
 
-    def _create_object(self, obj: Type[Base], auto_commit: bool = True):
+    def __throw_stale_object_exception(self, cls: Base, conflicts: List[Tuple[Any, Any, Any]]):
+        """ Raise a :code:`StaleObjectException <StaleObjectException>` """
+        __conflicts = [{'key': key, 'expected': expected, 'actual': actual} for (key, expected, actual) in conflicts]
+        __errors = {
+            'repo': self.__str__(),
+            'entity': cls,
+            'conflicts': __conflicts,
+        }
+        raise StaleObjectException(
+            message='{count} row(s) of the entity {cls} were changed by another writer: {conflicts}'
+                .format(count=len(__conflicts),
+                        cls=cls.__name__,
+                        conflicts=__conflicts),
+            errors=__errors,
+            cls=cls,
+            conflicts=__conflicts
+        )
+
+    def _create_object(self, obj: Type[Base], auto_commit: bool = True,
+                       profile: str = DEFAULT_PROFILE) -> Union[Future, None]:
         """ Simple CREATE (Crud) operation.
 
         :param obj: The entity model to be created (inserted). This entity model must inherit from `Base`.
@@ -423,25 +647,36 @@ class RepositoryBase(ABC):
         :param auto_commit: Whether to automatically commit the inserted object to the context and close the Session
         or not.
             Default: True => The object will be added to a separate Session, which will be committed and closed on
-        completion.
+        completion. If the repository has a :code:`WriteBuffer <WriteBuffer>`, the object is queued in the buffer
+        instead, and committed with the rest of its batch.
         :type auto_commit: bool
+        :param profile: The name of the :code:`Context <Context>` Session profile to open the Session with.
+        :type profile: str
+        :return: If the object was queued in the repository's Write Buffer, a Future that resolves once its batch has
+            been committed. Otherwise, None.
+        :rtype: Future
         """
-        if isinstance(obj, Base):
-            if auto_commit:
-                with self.session_scope() as s:
-                    if isinstance(s, Session):
-                        s.add(obj)
-                    else:
-                        self.__throw_no_open_session_exception()
+        with self.__span(operation='create', model=type(obj)):
+            if model_metadata(type(obj)) is not None:
+                if auto_commit and self.__write_buffer is not None:
+                    return self.__write_buffer.submit(obj)
+                elif auto_commit:
+                    with self.session_scope(profile=profile) as s:
+                        if isinstance(s, Session):
+                            s.add(obj)
+                        else:
+                            self.__throw_no_open_session_exception()
+                else:
+                    if not (self.__active_local_session and isinstance(self.__local_session, Session)):
+                        self._create_session(profile=profile)
+                    self.__local_session.add(obj)
+                    self.__pending_commit = True
+                    if self.__batch_session is not None:
+                        self.__batch_session.checkpoint()
+                    if auto_commit:
+                        self._commit_session()
             else:
-                if not (self.__active_local_session and isinstance(self.__local_session, Session)):
-                    self._create_session()
-                self.__local_session.add(obj)
-                self.__pending_commit = True
-                if auto_commit:
-                    self._commit_session()
-        else:
-            self.__throw_unknown_model_exception(cls=obj)
+                self.__throw_unknown_model_exception(cls=obj)
 
     def _read_object(self, cls: Base) -> Query:
         """ Simple READ (cRud) operation.
@@ -455,11 +690,228 @@ class RepositoryBase(ABC):
         :return: SQL Alchemy Query instance.
         :rtype: Query
         """
-        if issubclass(cls, Base):
-            return self.__create_query(cls)
+        if model_metadata(cls) is not None:
+            return Query(entities=cls)
         else:
             self.__throw_unknown_model_exception(cls=cls)
 
+    def _get_objects(self, cls: Base, keys: List[Any], profile: str = READ_ONLY_PROFILE,
+                     session: Session = None) -> List[Union[Base, None]]:
+        """ Batched READ (cRud) operation: gets the objects of `cls` with the primary keys `keys`, in as few queries
+                as the dialect's bound parameter limit allows.
+
+        Usage:
+            >>> (a, missing, b) = repo._get_objects(Record, [3, 1000, 1])
+
+        :param cls: The model to get. `cls` must inherit from Base.
+        :type cls: Base
+        :param keys: Primary keys: scalars, or tuples for composite keys. Duplicates are only queried once.
+        :type keys: list
+        :param profile: The name of the :code:`Context <Context>` Session profile to open the Session with.
+        :type profile: str
+        :param session: The Session to load the objects into.
+            Default: None => A Session opened for the call, and closed (so the objects are returned detached).
+        :type session: Session
+        :raises: UnknownModelException
+        :return: The object of every key, in the order of `keys`; None for keys without a row.
+        :rtype: list
+        """
+        with self.__span(operation='get_many', model=cls):
+            metadata = self.__metadata(cls)
+            unique = list(dict.fromkeys(keys))
+            if not unique:
+                return []
+            __session = session if session is not None else self.__context.open_session(profile=profile, owner=self)
+            try:
+                dialect = __session.get_bind(mapper=metadata.mapper).dialect.name
+                chunk = max(1, _IN_LIST_LIMITS.get(dialect, _DEFAULT_IN_LIST_LIMIT) // len(metadata.primary_keys))
+                primary_key = [column for (_, column) in metadata.primary_keys]
+                found = {}
+                for i in range(0, len(unique), chunk):
+                    batch = unique[i:i + chunk]
+                    if len(primary_key) == 1:
+                        criteria = primary_key[0].in_(batch)
+                    else:
+                        criteria = or_(*[self.__primary_key_criteria(metadata, key) for key in batch])
+                    for obj in __session.query(cls).filter(criteria):
+                        identity = metadata.mapper.primary_key_from_instance(obj)
+                        found[identity[0] if len(identity) == 1 else tuple(identity)] = obj
+                return [found.get(key) for key in keys]
+            finally:
+                if session is None:
+                    self.__context.close_session(__session)
+
+    def _loader(self, cls: Base, max_batch_size: int = None) -> DataLoader:
+        """ Gets the :code:`DataLoader <DataLoader>` batching single-object gets of `cls` through
+                :code:`_get_objects()`: the one of the current :code:`loader_scope()`, shared by every get of the
+                request, or a new one outside of a scope.
+
+        Usage:
+            >>> with loader_scope():
+            ...     authors = [repo._loader(User).load(post.author_id) for post in posts]
+            ...     names = [author.result().name for author in authors]     # One query.
+
+        :param cls: The model to load. `cls` must inherit from Base.
+        :type cls: Base
+        :param max_batch_size: The most keys loaded by one call to :code:`_get_objects()`.
+        :type max_batch_size: int
+        :raises: UnknownModelException
+        :rtype: DataLoader
+        """
+        self.__metadata(cls)
+        return scoped_loader((id(self), cls), lambda: DataLoader(lambda keys: self._get_objects(cls, keys),
+                                                                 max_batch_size=max_batch_size))
+
+    def _count_objects(self, cls: Base, *criterion, mode: str = COUNT_EXACT, ttl: float = None,
+                       profile: str = READ_ONLY_PROFILE) -> int:
+        """ COUNT (cRud) operation, trading accuracy for latency per call.
+
+            - 'exact': `SELECT count(*)` every time.
+            - 'cached': the exact count, reused for up to `ttl` seconds, and dropped as soon as a write to the table
+              goes through the :code:`Context <Context>`.
+            - 'estimated': the planner's estimate for the whole table (PostgreSQL `pg_class.reltuples`, MySQL
+              `information_schema`, SQLite `sqlite_stat1`), without a scan. Filtered counts, and tables without
+              statistics, fall back to 'cached'.
+
+        Usage:
+            >>> total = repo._count_objects(Record, mode=COUNT_ESTIMATED)
+            >>> pages = repo._count_objects(Record, Record.name == 'a', mode=COUNT_CACHED, ttl=5)
+
+        :param cls: The model to count. `cls` must inherit from Base.
+        :type cls: Base
+        :param criterion: SQL Alchemy filter criteria.
+        :param mode: 'exact', 'cached', or 'estimated'.
+        :type mode: str
+        :param ttl: How many seconds a cached count may be reused for.
+            Default: None => The :code:`CountCache <CountCache>`'s ttl.
+        :type ttl: float
+        :param profile: The name of the :code:`Context <Context>` Session profile to open the Session with.
+        :type profile: str
+        :raises: UnknownModelException, ValueError
+        :return: The number of rows.
+        :rtype: int
+        """
+        with self.__span(operation='count', model=cls):
+            table = self.__metadata(cls).table
+            if mode not in COUNT_MODES:
+                raise ValueError('Unknown count mode {mode!r}; expected one of {modes}.'.format(mode=mode,
+                                                                                              modes=COUNT_MODES))
+            statement = select([func.count()]).select_from(table)
+            for clause in criterion:
+                statement = statement.where(clause)
+
+            # A Session (and its connection and admission slot) is only opened by the call that runs a query: not
+            # for cache hits, nor for the callers waiting on an identical count in flight.
+            key = statement_key(statement)
+
+            def count() -> int:
+                return self.__read(profile, lambda s: s.execute(statement).scalar())
+
+            if mode == COUNT_EXACT:
+                return self.__shared(profile, key, count)
+
+            if mode == COUNT_ESTIMATED and not criterion:
+                estimate = self.__read(profile, lambda s: estimate_count(s, table))
+                if estimate is not None:
+                    return estimate
+
+            if key is None:
+                return count()
+            cached = self.__count_cache.get(table.name, key, ttl=ttl)
+            if cached is None:
+
+                def count_and_cache() -> int:
+                    generation = self.__count_cache.generation(table.name)
+                    __count = count()
+                    self.__count_cache.put(table.name, key, __count, generation)
+                    return __count
+
+                cached = self.__shared(profile, key, count_and_cache)
+            return cached
+
+    def _select(self, statement: Any, profile: str = READ_ONLY_PROFILE, timeout: float = None) -> List[Any]:
+        """ Core READ (cRud) operation: executes `statement` and fetches its rows. With a
+                :code:`SingleFlight <SingleFlight>`, identical statements (same SQL and parameters, same profile)
+                running at the same time are executed once, and share their rows.
+
+        Usage:
+            >>> rows = repo._select(select([Flag.__table__]).where(Flag.__table__.c.tenant == tenant))
+
+        :param statement: The SQL Alchemy SELECT.
+        :param profile: The name of the :code:`Context <Context>` Session profile to open the Session with.
+        :type profile: str
+        :param timeout: How many seconds to wait for an identical statement in flight.
+            Default: None => The SingleFlight's timeout.
+        :type timeout: float
+        :raises: SingleFlightTimeoutException
+        :return: The rows.
+        :rtype: list
+        """
+        with self.__span(operation='select'):
+            return self.__shared(profile, statement_key(statement), lambda: self.__fetch(statement, profile), timeout)
+
+    async def _select_async(self, statement: Any, profile: str = READ_ONLY_PROFILE,
+                            timeout: float = None) -> List[Any]:
+        """ :code:`_select()` for asyncio code: the statement runs in the event loop's default executor, and
+                identical statements of concurrent tasks (and threads) share one execution.
+
+        :raises: SingleFlightTimeoutException
+        :rtype: list
+        """
+        def fetch() -> List[Any]:
+            return self.__fetch(statement, profile)
+
+        if self.__single_flight is None:
+            return await asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, fetch)
+        key = statement_key(statement)
+        return await self.__single_flight.do_async(None if key is None else (profile, key), fetch, timeout=timeout)
+
+    def __fetch(self, statement: Any, profile: str) -> List[Any]:
+        return self.__read(profile, lambda s: s.execute(statement).fetchall())
+
+    def __read(self, profile: str, call: Callable[[Session], Any]) -> Any:
+        """ Runs `call` with a Session opened for it, and closes the Session. """
+        __session = self.__context.open_session(profile=profile, owner=self)
+        try:
+            return call(__session)
+        finally:
+            self.__context.close_session(__session)
+
+    def __shared(self, profile: str, key: Any, call: Callable[[], Any], timeout: float = None) -> Any:
+        """ Runs `call` through the repository's :code:`SingleFlight <SingleFlight>`, if it has one, keyed by the
+                profile and statement `key`.
+        """
+        if self.__single_flight is None or key is None:
+            return call()
+        return self.__single_flight.do((profile, key), call, timeout=timeout)
+
+    def _scan_objects(self, cls: Base, map_batch: Callable[[List[Tuple[Any, ...]]], Any],
+                      reduce: Callable[[Any, Any], Any] = None, initial: Any = None, max_workers: int = None,
+                      batch_size: int = 1000, split: str = SPLIT_MINMAX) -> Any:
+        """ Parallel SCAN (cRud) operation: map-reduces every row of `cls` across a pool of worker processes, each
+                streaming a primary key range over an Engine of its own. See :code:`parallel_scan()`.
+
+        :param cls: The model to scan. `cls` must inherit from Base, and have a single primary key column.
+        :type cls: Base
+        :param map_batch: Picklable function mapping a list of rows (tuples, in column order) to a result.
+        :param reduce: Picklable function folding two results into one.
+            Default: None => The list of mapped batches, in key order.
+        :param initial: The starting value (an identity of `reduce`) of every fold.
+        :param max_workers: The number of worker processes.
+            Default: None => The number of CPUs.
+        :type max_workers: int
+        :param batch_size: The number of rows fetched and mapped at a time.
+        :type batch_size: int
+        :param split: 'minmax' or 'quantile'.
+        :type split: str
+        :raises: UnknownModelException
+        :return: The folded result, or the list of mapped batches.
+        """
+        with self.__span(operation='scan', model=cls):
+            self.__metadata(cls)
+            return parallel_scan(self.__context, cls, map_batch=map_batch, reduce=reduce, initial=initial,
+                                 max_workers=max_workers, batch_size=batch_size, split=split)
+
     def _update_object(self, cls: Base, values: dict) -> Query:
         """ Simple UPDATE (crUd) operation.
 
@@ -475,20 +927,216 @@ class RepositoryBase(ABC):
         :return: SQL Alchemy Query instance.
         :rtype: Query
         """
-        if issubclass(cls, Base):
-            for value in values.keys():
-                if isinstance(value, str):
-                    if not hasattr(cls, value):
-                        self.__throw_unknown_column_exception(cls=cls, column=value)
-                elif isinstance(value, InstrumentedAttribute):
-                    if not hasattr(cls, value.key):
+        with self.__span(operation='update', model=cls):
+            metadata = model_metadata(cls)
+            if metadata is not None:
+                for value in values.keys():
+                    if metadata.attribute(value) is not None:
+                        continue
+                    if isinstance(value, InstrumentedAttribute):
                         self.__throw_unknown_update_key_exception(cls=cls, key=value, value=values.get(value))
-                else:
-                    self.__throw_unknown_column_exception(cls=cls, column=value)
-            self.__pending_commit = True
-            return self.__create_query(cls=cls)
-        else:
-            self.__throw_unknown_model_exception(cls=cls)
+                    else:
+                        self.__throw_unknown_column_exception(cls=cls, column=value)
+                self.__pending_commit = True
+                return Query(entities=cls)
+            else:
+                self.__throw_unknown_model_exception(cls=cls)
+
+    def _update_versioned(self, cls: Base, key: Any, values: Union[dict, Callable[[dict], dict]], version: Any = None,
+                          retry_policy: RetryPolicy = None, profile: str = DEFAULT_PROFILE) -> Any:
+        """ Optimistic UPDATE (crUd) operation on one row of a versioned model.
+
+            Issues `UPDATE ... SET ..., version = :next WHERE pk = :key AND version = :version`, without locking the
+            row. If no row matched, another writer got there first: the row is reloaded, and the update is retried
+            under the repository's (or the given) :code:`RetryPolicy <RetryPolicy>`. If every attempt conflicts, it
+            raises a :code:`StaleObjectException <StaleObjectException>`.
+
+            `values` may be a callable, taking the current row (a dictionary of attribute values) and returning the
+            values to set; it is called again on every reload, so read-modify-write updates (e.g. counters) never
+            lose an increment. A dictionary of values, together with an explicit `version`, is a write based on the
+            caller's own read: its conflict is raised at once, rather than applied over a row the caller has not seen.
+
+        Usage:
+            >>> class Counter(Base):
+            ...     __tablename__ = 'counter'
+            ...     primary_key = Column('id', Integer, primary_key=True)
+            ...     hits = Column(Integer, nullable=False, default=0)
+            ...     version = Column(Integer, nullable=False)
+            ...     __mapper_args__ = {'version_id_col': version}
+            >>> repo._update_versioned(Counter, key=1, values=lambda row: {'hits': row['hits'] + 1})
+
+        :param cls: The versioned model (it must declare `version_id_col` in its `__mapper_args__`).
+        :type cls: Base
+        :param key: The primary key of the row (a tuple for composite keys).
+        :param values: Dictionary of `cls` attributes to update (string or InstrumentedAttribute keys), or a callable
+            returning one from the current row.
+        :param version: The version the caller read.
+            Default: None => The row's current version is read first.
+        :param retry_policy: How conflicts are retried.
+            Default: None => The repository's :code:`retry_policy <retry_policy>`.
+        :type retry_policy: RetryPolicy
+        :param profile: The name of the :code:`Context <Context>` Session profile to open the Session with.
+        :type profile: str
+        :raises: StaleObjectException, UnknownColumnException, UnknownUpdateKeyException, UnknownModelException,
+            SQLAlchemyError
+        :return: The row's new version.
+        """
+        with self.__span(operation='update_versioned', model=cls):
+            metadata = self.__versioned_metadata(cls)
+            mapper = metadata.mapper
+            version_column = metadata.version_column
+            criteria = self.__primary_key_criteria(metadata, key)
+            if version is not None and not callable(values):
+                __policy = NO_RETRY
+            else:
+                __policy = self.__retry_policy if retry_policy is None else retry_policy
+
+            attempt = 0
+            while True:
+                __session = self.__context.open_session(profile=profile, owner=self)
+                try:
+                    if version is None or callable(values):
+                        row = __session.execute(select([metadata.table]).where(criteria)).first()
+                        if row is None:
+                            self.__throw_stale_object_exception(cls=cls, conflicts=[(key, version, None)])
+                        current = {key: row[column] for (key, column) in metadata.columns.items()}
+                        if version is None:
+                            version = row[version_column]
+                        elif version != row[version_column]:
+                            current = None
+                    else:
+                        current = {}
+
+                    if current is not None:
+                        __values = values(current) if callable(values) else values
+                        columns = self.__update_columns(cls, metadata, __values)
+                        next_version = mapper.version_id_generator(version)
+                        columns[version_column] = next_version
+                        statement = metadata.table.update()\
+                            .where(and_(criteria, version_column == version))\
+                            .values(columns)
+                        if __session.execute(statement).rowcount == 1:
+                            __session.commit()
+                            return next_version
+
+                    actual = __session.execute(select([version_column]).where(criteria)).scalar()
+                    __session.rollback()
+                except SQLAlchemyError:
+                    __session.rollback()
+                    raise
+                finally:
+                    self.__context.close_session(__session)
+
+                if actual is None or attempt >= __policy.retries:
+                    self.__throw_stale_object_exception(cls=cls, conflicts=[(key, version, actual)])
+                __policy.sleep(attempt)
+                attempt += 1
+                version = None
+
+    def _bulk_update_versioned(self, cls: Base, rows: List[dict], profile: str = BULK_PROFILE) -> int:
+        """ Optimistic UPDATE (crUd) operation on many rows of a versioned model, in one transaction.
+
+            Every dictionary in `rows` holds a row's primary key attribute(s), the version the caller read (under the
+            version attribute's name), and the attributes to set. Rows setting the same attributes share one
+            executemany UPDATE, conditional on each row's version. If any row conflicts, the transaction is rolled
+            back, and a :code:`StaleObjectException <StaleObjectException>` lists every conflicting row with its
+            expected and current version; the caller reloads those rows and tries again.
+
+        :param cls: The versioned model (it must declare `version_id_col` in its `__mapper_args__`).
+        :type cls: Base
+        :param rows: The rows to update.
+        :type rows: List[dict]
+        :param profile: The name of the :code:`Context <Context>` Session profile to open the Session with.
+        :type profile: str
+        :raises: StaleObjectException, UnknownColumnException, UnknownUpdateKeyException, UnknownModelException,
+            SQLAlchemyError
+        :return: Number of rows updated.
+        :rtype: int
+        """
+        with self.__span(operation='bulk_update_versioned', model=cls):
+            metadata = self.__versioned_metadata(cls)
+            mapper = metadata.mapper
+            version_column = metadata.version_column
+            version_key = metadata.attribute_names[version_column.name]
+            primary_keys = [key for (key, _) in metadata.primary_keys]
+            reserved = set(primary_keys) | {version_key}
+
+            groups = {}
+            for row in rows:
+                names = tuple(sorted(name for name in row.keys() if name not in reserved))
+                groups.setdefault(names, []).append(row)
+
+            __session = self.__context.open_session(profile=profile, owner=self)
+            try:
+                rowcount = 0
+                expected = {}
+                for (names, group) in groups.items():
+                    columns = self.__update_columns(cls, metadata, {name: bindparam(_VALUE_PARAM + name)
+                                                                    for name in names})
+                    columns[version_column] = bindparam(_NEXT_VERSION_PARAM)
+                    statement = metadata.table.update()\
+                        .where(and_(*[column == bindparam(_PK_PARAM + key)
+                                      for (key, column) in metadata.primary_keys]))\
+                        .where(version_column == bindparam(_VERSION_PARAM))\
+                        .values(columns)
+                    parameters = []
+                    for row in group:
+                        params = {_PK_PARAM + key: row[key] for key in primary_keys}
+                        params.update({_VALUE_PARAM + name: row[name] for name in names})
+                        params[_VERSION_PARAM] = row[version_key]
+                        params[_NEXT_VERSION_PARAM] = mapper.version_id_generator(row[version_key])
+                        expected[tuple(row[key] for key in primary_keys)] = row[version_key]
+                        parameters.append(params)
+                    if __session.bind.dialect.supports_sane_multi_rowcount:
+                        result = __session.execute(statement, parameters)
+                        rowcount += result.rowcount if result.rowcount > 0 else 0
+                    else:
+                        # The driver does not report executemany rowcounts, so each row's UPDATE is counted alone.
+                        rowcount += sum(__session.execute(statement, params).rowcount for params in parameters)
+
+                if rowcount != len(expected):
+                    __session.rollback()
+                    current = self.__current_versions(__session, metadata, list(expected.keys()))
+                    conflicts = [(key if len(key) > 1 else key[0], old, current.get(key))
+                                 for (key, old) in expected.items() if current.get(key) != old]
+                    self.__throw_stale_object_exception(cls=cls, conflicts=conflicts)
+                __session.commit()
+            except SQLAlchemyError:
+                __session.rollback()
+                raise
+            finally:
+                self.__context.close_session(__session)
+            return rowcount
+
+    def _save_tracked(self, tracker: ChangeTracker = None, profile: str = BULK_PROFILE) -> int:
+        """ Partial UPDATE (crUd) operation for tracked domain models.
+
+            Writes only the columns that changed since each object was tracked, one executemany per model and set of
+            changed columns, in a single transaction. If the transaction fails, it is rolled back, the objects keep
+            their snapshots, and the error is raised.
+
+        :param tracker: The Change Tracker holding the objects to save.
+            Default: None => The repository's :code:`change_tracker <change_tracker>`.
+        :type tracker: ChangeTracker
+        :param profile: The name of the :code:`Context <Context>` Session profile to open the Session with.
+        :type profile: str
+        :raises: SQLAlchemyError
+        :return: Number of rows updated.
+        :rtype: int
+        """
+        with self.__span(operation='save_tracked'):
+            __tracker = self.__change_tracker if tracker is None else tracker
+            __session = self.__context.open_session(profile=profile, owner=self)
+            try:
+                rowcount = __tracker.save(__session)
+                __session.commit()
+            except SQLAlchemyError:
+                __session.rollback()
+                raise
+            finally:
+                self.__context.close_session(__session)
+            __tracker.mark_saved()
+            return rowcount
 
     def _delete_object(self):
         """ Simple DELETE (cruD) operation.
@@ -498,11 +1146,9 @@ class RepositoryBase(ABC):
 
     def base_query_on(self, cls: Base) -> Query:
         if isinstance(cls, Base):
-            if self.__active_scoped_session:
-                return self.__scoped_session_factory.query_property(query_cls=cls)
-            else:
+            if self.__session_registry is None:
                 self._create_thread_safe_session()
-                return self.__scoped_session_factory.query_property(query_cls=cls)
+            return self.__session_registry.query_property(query_cls=cls)
         else:
             self.__throw_unknown_model_exception(cls=cls)
 
@@ -613,3 +1259,27 @@ class UnknownUpdateKeyException(Exception):
     @property
     def value(self) -> Any:
         return self.__value
+
+class StaleObjectException(Exception):
+    """ Exception for Repo Objects: Stale Object (an optimistic update lost to another writer) """
+
+    def __init__(self, message: str, errors: dict, cls: Base, conflicts: List[Dict[str, Any]], *args):
+        super().__init__(message, *args)
+        self.__errors = errors
+        self.__cls = cls
+        self.__conflicts = conflicts
+
+    @property
+    def errors(self) -> dict:
+        return self.__errors
+
+    @property
+    def cls(self) -> Base:
+        return self.__cls
+
+    @property
+    def conflicts(self) -> List[Dict[str, Any]]:
+        """ Gets the conflicting rows: their key, the version the writer expected, and the current version (None if
+                the row no longer exists).
+        """
+        return self.__conflicts
@@ -0,0 +1,448 @@
+# System Imports
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+# Third-Party Imports
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.schema import Column, MetaData, Table, UniqueConstraint
+from sqlalchemy.sql import operators, visitors
+from sqlalchemy.sql.dml import Delete, Update
+from sqlalchemy.sql.elements import BinaryExpression, UnaryExpression
+from sqlalchemy.sql.selectable import Alias, Join, Select
+
+# Local Source Imports
+from alchemist_stack.tracing import fingerprint
+from .models import Base
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+""" How a statement uses a column: compared for equality (`=`, `IN`, `IS`), compared to a range (`<`, `BETWEEN`,
+    `LIKE 'prefix%'`), joined on, or sorted by.
+"""
+EQUALITY = 'equality'
+RANGE = 'range'
+JOIN = 'join'
+ORDER = 'order'
+USAGES = (EQUALITY, RANGE, JOIN, ORDER)
+
+_EQUALITY_OPERATORS = {operators.eq, operators.in_op, operators.is_}
+_RANGE_OPERATORS = {operators.lt, operators.le, operators.gt, operators.ge, operators.between_op, operators.like_op,
+                    operators.startswith_op}
+
+""" Key of the running statement's start time kept in `Connection.info`. """
+_STARTED = 'alchemist_workload_start'
+
+""" How many rows are copied per INSERT when validating a candidate. """
+_COPY_CHUNK = 1000
+
+def _base_table(column: Any) -> Union[Table, None]:
+    """ Gets the Table `column` belongs to, through aliases, or None for a column of anything else. """
+    if not isinstance(column, Column):
+        return None
+    table = column.table
+    while isinstance(table, Alias):
+        table = table.element
+    return table if isinstance(table, Table) else None
+
+def analyze_statement(statement: Any) -> Dict[str, Dict[str, Any]]:
+    """ Gets the columns a SELECT, UPDATE or DELETE filters, joins, and sorts on, per table.
+
+    Usage:
+        >>> analyze_statement(session.query(Record).filter(Record.name == 'a').order_by(Record.value).statement)
+        {'record': {'models': ['Record'], 'equality': ['name'], 'range': [], 'join': [], 'order': ['value']}}
+
+    :param statement: The statement.
+    :return: Table name => {'models': the names of the models the columns were read through, and each usage => the
+        names of the columns used so, in order}.
+    :rtype: dict
+    """
+    usage: Dict[str, Dict[str, Any]] = {}
+
+    def add(column: Any, kind: str):
+        table = _base_table(column)
+        if table is None:
+            return
+        entry = usage.setdefault(table.name, {'models': [], EQUALITY: [], RANGE: [], JOIN: [], ORDER: []})
+        if column.name not in entry[kind]:
+            entry[kind].append(column.name)
+        mapper = getattr(column, '_annotations', {}).get('parentmapper')
+        if mapper is not None and mapper.class_.__name__ not in entry['models']:
+            entry['models'].append(mapper.class_.__name__)
+
+    def add_comparisons(clause: Any, equality: str, ranges: Union[str, None]):
+        for element in visitors.iterate(clause, {}):
+            if isinstance(element, BinaryExpression):
+                kind = equality if element.operator in _EQUALITY_OPERATORS else \
+                    ranges if element.operator in _RANGE_OPERATORS else None
+                if kind is not None:
+                    add(element.left, kind)
+                    add(element.right, kind)
+
+    where = getattr(statement, '_whereclause', None)
+    if where is not None:
+        add_comparisons(where, EQUALITY, RANGE)
+    for element in visitors.iterate(statement, {}):
+        if isinstance(element, Join) and element.onclause is not None:
+            add_comparisons(element.onclause, JOIN, None)
+    if isinstance(statement, Select):
+        for clause in statement._order_by_clause.clauses:
+            while isinstance(clause, UnaryExpression):
+                clause = clause.element
+            add(clause, ORDER)
+    return usage
+
+class RecordedStatement(object):
+    """ One statement of a recorded workload: how often it ran and for how long, the columns it uses, and the first
+            execution of it, to replay.
+    """
+
+    __slots__ = ('fingerprint', 'statement', 'clause', 'multiparams', 'params', 'usage', 'executions', 'total_time',
+                 'max_time')
+
+    def __init__(self, fingerprint: str, statement: str, clause: Any, multiparams: tuple, params: dict):
+        self.fingerprint = fingerprint
+        self.statement = statement
+        self.clause = clause
+        self.multiparams = multiparams
+        self.params = params
+        self.usage = analyze_statement(clause)
+        self.executions = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def __repr__(self) -> str:
+        return '<RecordedStatement {fingerprint} x{executions} {total:.3f}s>'.format(
+            fingerprint=self.fingerprint, executions=self.executions, total=self.total_time)
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.executions if self.executions else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'fingerprint': self.fingerprint,
+            'statement': self.statement,
+            'usage': self.usage,
+            'executions': self.executions,
+            'total_time': self.total_time,
+            'max_time': self.max_time,
+        }
+
+class WorkloadRecorder(object):
+    """ Records the SELECT, UPDATE and DELETE statements executed on an Engine, grouped by fingerprint, with their
+            latencies, for the :code:`IndexAdvisor <IndexAdvisor>`.
+
+        Statements are only analyzed the first time their fingerprint is seen; after that, recording one costs a
+        fingerprint and two clock reads. Once `capacity` fingerprints are recorded, new ones are counted and ignored.
+
+    Usage:
+        >>> workload = WorkloadRecorder()
+        >>> workload.watch(db.engine)
+        >>> ...
+        >>> candidates = IndexAdvisor().advise(workload)
+    """
+
+    def __init__(self, capacity: int = 1024):
+        """ Workload Recorder Constructor
+
+        :param capacity: How many distinct statements are recorded, at most.
+        :type capacity: int
+        """
+        self.__capacity = capacity
+        self.__statements: Dict[str, RecordedStatement] = {}
+        self.__lock = threading.Lock()
+        self.__ignored = 0
+
+    def __len__(self) -> int:
+        return len(self.__statements)
+
+    @property
+    def statements(self) -> List[RecordedStatement]:
+        """ Gets the recorded statements, slowest in total first.
+
+        :rtype: List[RecordedStatement]
+        """
+        with self.__lock:
+            statements = list(self.__statements.values())
+        return sorted(statements, key=lambda statement: statement.total_time, reverse=True)
+
+    @property
+    def ignored(self) -> int:
+        """ Gets how many executions were not recorded because the recorder was full.
+
+        :rtype: int
+        """
+        return self.__ignored
+
+    def watch(self, engine: Engine):
+        """ Records every statement executed on `engine`. """
+
+        @event.listens_for(engine, 'before_execute')
+        def before_execute(conn, clauseelement, multiparams, params):
+            if isinstance(clauseelement, (Select, Update, Delete)):
+                conn.info[_STARTED] = time.perf_counter()
+
+        @event.listens_for(engine, 'after_execute')
+        def after_execute(conn, clauseelement, multiparams, params, result):
+            started = conn.info.pop(_STARTED, None)
+            if started is not None:
+                self.record(clauseelement, multiparams, params, time.perf_counter() - started,
+                            statement=getattr(getattr(result, 'context', None), 'statement', None))
+
+    def record(self, clause: Any, multiparams: tuple, params: dict, duration: float, statement: str = None):
+        """ Records one execution of `clause`, which took `duration` seconds.
+
+        :param clause: The executed statement.
+        :param multiparams: Its positional execution parameters.
+        :type multiparams: tuple
+        :param params: Its keyword execution parameters.
+        :type params: dict
+        :param duration: How many seconds it took.
+        :type duration: float
+        :param statement: Its SQL. Default: None => `clause` is compiled.
+        :type statement: str
+        """
+        statement = statement if statement is not None else str(clause)
+        key = fingerprint(statement)
+        with self.__lock:
+            recorded = self.__statements.get(key)
+            if recorded is None:
+                if len(self.__statements) >= self.__capacity:
+                    self.__ignored += 1
+                    return
+                recorded = self.__statements[key] = RecordedStatement(key, statement, clause, multiparams, params)
+            recorded.executions += 1
+            recorded.total_time += duration
+            recorded.max_time = max(recorded.max_time, duration)
+
+    def clear(self):
+        with self.__lock:
+            self.__statements.clear()
+            self.__ignored = 0
+
+class IndexCandidate(object):
+    """ An index the recorded workload would likely benefit from, and the statements it would serve. """
+
+    __slots__ = ('table', 'columns', 'models', 'statements', 'baseline', 'indexed')
+
+    def __init__(self, table: str, columns: Tuple[str, ...]):
+        self.table = table
+        self.columns = columns
+        self.models: List[str] = []
+        self.statements: List[RecordedStatement] = []
+        self.baseline: Union[float, None] = None
+        self.indexed: Union[float, None] = None
+
+    def __repr__(self) -> str:
+        return '<IndexCandidate {table}({columns}) {score:.3f}s>'.format(table=self.table,
+                                                                        columns=', '.join(self.columns),
+                                                                        score=self.score)
+
+    @property
+    def name(self) -> str:
+        return 'ix_{table}_{columns}'.format(table=self.table, columns='_'.join(self.columns))
+
+    @property
+    def score(self) -> float:
+        """ Gets how many seconds the statements the index would serve took, in total.
+
+        :rtype: float
+        """
+        return sum(statement.total_time for statement in self.statements)
+
+    @property
+    def executions(self) -> int:
+        return sum(statement.executions for statement in self.statements)
+
+    @property
+    def improvement(self) -> Union[float, None]:
+        """ Gets how many times faster the statements ran with the index, once :code:`IndexAdvisor.validate()` measured
+                it.
+
+        :rtype: float
+        """
+        if self.baseline is None or not self.indexed:
+            return None
+        return self.baseline / self.indexed
+
+    def ddl(self, engine: Engine = None) -> str:
+        """ Gets the `CREATE INDEX` statement of the index, quoted for `engine`'s dialect. """
+        quote = engine.dialect.identifier_preparer.quote if engine is not None else (lambda name: name)
+        return 'CREATE INDEX {name} ON {table} ({columns})'.format(
+            name=quote(self.name), table=quote(self.table), columns=', '.join(quote(column) for column in self.columns))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'table': self.table,
+            'columns': list(self.columns),
+            'models': self.models,
+            'ddl': self.ddl(),
+            'score': self.score,
+            'executions': self.executions,
+            'statements': [statement.fingerprint for statement in self.statements],
+            'baseline': self.baseline,
+            'indexed': self.indexed,
+            'improvement': self.improvement,
+        }
+
+class IndexAdvisor(object):
+    """ Suggests indexes from a recorded workload.
+
+        Every recorded statement suggests, per table, one index on the columns it compares for equality followed by
+        the first column it compares to a range (or, without one, the columns it sorts by), and one index per column
+        it joins on. Suggestions an existing index, unique constraint, or primary key of `metadata` already serves
+        (as a leading prefix) are dropped, a suggestion that is a prefix of another is folded into it, and the rest
+        are ranked by the time the statements they would serve took. :code:`validate()` measures a candidate on a
+        local SQLite copy of the tables.
+
+    Usage:
+        >>> candidates = IndexAdvisor().advise(workload)
+        >>> best = IndexAdvisor().validate(candidates[0], engine=db.engine)
+        >>> print(best.ddl(db.engine), best.improvement)
+    """
+
+    def __init__(self, metadata: MetaData = None):
+        """ Index Advisor Constructor
+
+        :param metadata: The tables and their indexes. Default: None => `Base.metadata`.
+        :type metadata: MetaData
+        """
+        self.__metadata = metadata if metadata is not None else Base.metadata
+
+    @property
+    def metadata(self) -> MetaData:
+        return self.__metadata
+
+    def existing_indexes(self, table: str) -> List[Tuple[str, ...]]:
+        """ Gets the column names of every index, unique constraint and primary key of `table`.
+
+        :rtype: List[Tuple[str, ...]]
+        """
+        __table = self.__metadata.tables[table]
+        indexes = [tuple(column.name for column in __table.primary_key.columns)]
+        indexes.extend(tuple(column.name for column in index.columns) for index in __table.indexes)
+        indexes.extend(tuple(column.name for column in constraint.columns) for constraint in __table.constraints
+                       if isinstance(constraint, UniqueConstraint))
+        indexes.extend((column.name,) for column in __table.columns if column.index or column.unique)
+        return [index for index in indexes if index]
+
+    def advise(self, workload: Union[WorkloadRecorder, Iterable[RecordedStatement]],
+               min_executions: int = 1) -> List[IndexCandidate]:
+        """ Gets the candidate indexes of `workload`, the most promising first.
+
+        :param workload: The recorded workload.
+        :param min_executions: How many times a statement must have run to be considered.
+        :type min_executions: int
+        :rtype: List[IndexCandidate]
+        """
+        statements = workload.statements if isinstance(workload, WorkloadRecorder) else list(workload)
+        candidates: Dict[Tuple[str, Tuple[str, ...]], IndexCandidate] = {}
+        for statement in statements:
+            if statement.executions < min_executions:
+                continue
+            for (table, usage) in statement.usage.items():
+                if table not in self.__metadata.tables:
+                    continue
+                for (columns, leading) in self.__suggestions(usage):
+                    if self.__is_served(table, columns, leading):
+                        continue
+                    candidate = candidates.setdefault((table, columns), IndexCandidate(table, columns))
+                    if statement not in candidate.statements:
+                        candidate.statements.append(statement)
+                    candidate.models.extend(model for model in usage['models'] if model not in candidate.models)
+
+        for candidate in list(candidates.values()):
+            wider = [other for other in candidates.values() if other is not candidate and other.table == candidate.table
+                     and other.columns[:len(candidate.columns)] == candidate.columns]
+            if wider:
+                widest = max(wider, key=lambda other: other.score)
+                widest.statements.extend(statement for statement in candidate.statements
+                                         if statement not in widest.statements)
+                del candidates[(candidate.table, candidate.columns)]
+        return sorted(candidates.values(), key=lambda candidate: (candidate.score, candidate.executions), reverse=True)
+
+    def validate(self, candidate: IndexCandidate, engine: Engine, repeat: int = 5,
+                 max_rows: int = 100000) -> IndexCandidate:
+        """ Measures `candidate`: copies the tables its statements read from `engine` to a temporary SQLite database,
+                and times its SELECTs there, without and with the index. Sets the candidate's `baseline` and `indexed`
+                times (the best of `repeat` runs of all of them), and so its `improvement`.
+
+        :param candidate: The candidate to measure.
+        :type candidate: IndexCandidate
+        :param engine: Where to copy the rows from.
+        :type engine: Engine
+        :param repeat: How many times the statements are run each way.
+        :type repeat: int
+        :param max_rows: How many rows of each table are copied, at most.
+        :type max_rows: int
+        :return: The candidate.
+        :rtype: IndexCandidate
+        """
+        selects = [statement for statement in candidate.statements if isinstance(statement.clause, Select)]
+        tables = {candidate.table}
+        for statement in selects:
+            tables.update(table for table in statement.usage if table in self.__metadata.tables)
+        directory = tempfile.mkdtemp(prefix='alchemist-index-advisor-')
+        copy = create_engine('sqlite:///{path}'.format(path=os.path.join(directory, 'copy.db')))
+        try:
+            for table in self.__metadata.sorted_tables:
+                if table.name in tables:
+                    table.create(bind=copy)
+                    self.__copy_rows(table, engine, copy, max_rows)
+            with copy.connect() as connection:
+                connection.execute('ANALYZE')
+                candidate.baseline = self.__time(connection, selects, repeat)
+                connection.execute(candidate.ddl(copy))
+                connection.execute('ANALYZE')
+                candidate.indexed = self.__time(connection, selects, repeat)
+        finally:
+            copy.dispose()
+            shutil.rmtree(directory, ignore_errors=True)
+        return candidate
+
+    @staticmethod
+    def __suggestions(usage: Dict[str, Any]) -> List[Tuple[Tuple[str, ...], int]]:
+        """ Gets the indexes one statement suggests on one table, with how many of their leading columns are
+                compared for equality (and so may come in any order).
+        """
+        suggestions = []
+        equality = tuple(sorted(usage[EQUALITY]))
+        tail = tuple(column for column in usage[RANGE][:1] if column not in equality) or \
+            tuple(column for column in usage[ORDER] if column not in equality)
+        if equality or tail:
+            suggestions.append((equality + tail, len(equality)))
+        suggestions.extend(((column,), 1) for column in usage[JOIN] if ((column,), 1) not in suggestions)
+        return suggestions
+
+    def __is_served(self, table: str, columns: Tuple[str, ...], leading: int) -> bool:
+        """ Whether an existing index of `table` starts with `columns`, its first `leading` columns in any order. """
+        return any(set(index[:leading]) == set(columns[:leading]) and index[leading:len(columns)] == columns[leading:]
+                   for index in self.existing_indexes(table))
+
+    @staticmethod
+    def __copy_rows(table: Table, source: Engine, copy: Engine, max_rows: int):
+        rows = source.execute(select([table]).limit(max_rows))
+        try:
+            while True:
+                chunk = rows.fetchmany(_COPY_CHUNK)
+                if not chunk:
+                    break
+                copy.execute(table.insert(), [{column.key: row[column] for column in table.c} for row in chunk])
+        finally:
+            rows.close()
+
+    @staticmethod
+    def __time(connection, statements: List[RecordedStatement], repeat: int) -> float:
+        best = None
+        for _ in range(max(1, repeat)):
+            started = time.perf_counter()
+            for statement in statements:
+                connection.execute(statement.clause, *statement.multiparams, **statement.params).fetchall()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
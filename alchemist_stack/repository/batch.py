@@ -0,0 +1,176 @@
+# System Imports
+import sys
+from typing import Any, Dict, Union
+
+# Third-Party Imports
+from sqlalchemy import event
+from sqlalchemy.orm.attributes import instance_state
+from sqlalchemy.orm.session import Session
+
+# Local Source Imports
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+""" Flush the Session (inside its one transaction), then expunge everything. """
+BATCH_FLUSH = 'flush'
+
+""" Commit the Session, then expunge everything: each checkpoint is a transaction of its own. """
+BATCH_COMMIT = 'commit'
+
+""" Flush inside a SAVEPOINT, release it and start the next one, then expunge everything: one transaction, whose
+    checkpoints can each be rolled back on their own.
+"""
+BATCH_SAVEPOINT = 'savepoint'
+
+BATCH_MODES = (BATCH_FLUSH, BATCH_COMMIT, BATCH_SAVEPOINT)
+
+""" The approximate size, in bytes, of a mapped object in a Session, attribute values aside: the object, its
+    `__dict__`, its InstanceState, and the Session's bookkeeping of it.
+"""
+_OBJECT_OVERHEAD = 1024
+
+def approximate_size(obj: Any) -> int:
+    """ Gets the approximate memory footprint of a mapped object in a Session, in bytes: a fixed overhead, plus the
+            size of every loaded attribute value.
+
+    :rtype: int
+    """
+    return _OBJECT_OVERHEAD + sum(sys.getsizeof(value) for value in instance_state(obj).dict.values())
+
+class BatchSession(object):
+    """ Keeps a long-running Session within a fixed footprint.
+
+        Counts the objects added to, or loaded into, the Session, and their approximate size; once there are
+        `max_objects` of them, or `max_megabytes`, the next :code:`checkpoint()` flushes (or commits, or releases a
+        savepoint, depending on `mode`) and expunges every object, so the identity map, and the flushes, never grow
+        past one batch. Objects are not usable through the Session after their checkpoint: keep their primary keys,
+        not the objects, to get back to them.
+
+    Usage:
+        >>> batch = repo._create_batch_session(BatchSession(max_objects=5000, max_megabytes=64, mode=BATCH_COMMIT))
+        >>> for row in source:
+        ...     repo._create_object(Record(**row), auto_commit=False)    # Checkpoints every 5000 objects.
+        >>> repo._commit_session()
+        >>> batch.stats
+        {'objects': 0, 'bytes': 0, 'checkpoints': 10000, 'total_objects': 50000000, 'peak_objects': 5000, ...}
+    """
+
+    def __init__(self, max_objects: int = 10000, max_megabytes: float = 64.0, mode: str = BATCH_FLUSH):
+        """ Batch Session Constructor
+
+        :param max_objects: How many objects the Session may hold before a checkpoint.
+        :type max_objects: int
+        :param max_megabytes: How many megabytes (approximately) the Session's objects may take before a checkpoint.
+        :type max_megabytes: float
+        :param mode: 'flush', 'commit', or 'savepoint'.
+        :type mode: str
+        """
+        if mode not in BATCH_MODES:
+            raise ValueError('Unknown batch mode {mode!r}; expected one of {modes}.'.format(mode=mode,
+                                                                                          modes=BATCH_MODES))
+        if max_objects < 1:
+            raise ValueError('max_objects must be at least 1, got {max_objects}'.format(max_objects=max_objects))
+        self.__max_objects = max_objects
+        self.__max_bytes = int(max_megabytes * 1024 * 1024)
+        self.__mode = mode
+        self.__session: Union[Session, None] = None
+        self.__objects = 0
+        self.__bytes = 0
+        self.__checkpoints = 0
+        self.__total_objects = 0
+        self.__peak_objects = 0
+        self.__peak_bytes = 0
+
+    @property
+    def session(self) -> Union[Session, None]:
+        return self.__session
+
+    @property
+    def mode(self) -> str:
+        return self.__mode
+
+    @property
+    def objects(self) -> int:
+        """ Gets how many objects the Session holds since the last checkpoint.
+
+        :rtype: int
+        """
+        return self.__objects
+
+    @property
+    def bytes(self) -> int:
+        """ Gets the approximate size, in bytes, of the objects the Session holds since the last checkpoint.
+
+        :rtype: int
+        """
+        return self.__bytes
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """ Gets the current and peak footprint of the Session, and how many checkpoints and objects went through it.
+
+        :rtype: dict
+        """
+        return {
+            'objects': self.__objects,
+            'bytes': self.__bytes,
+            'checkpoints': self.__checkpoints,
+            'total_objects': self.__total_objects,
+            'peak_objects': self.__peak_objects,
+            'peak_bytes': self.__peak_bytes,
+        }
+
+    def attach(self, session: Session):
+        """ Starts tracking `session`, and, in 'savepoint' mode, opens its first savepoint. """
+        if self.__session is not None:
+            raise ValueError('The BatchSession already tracks {session}'.format(session=repr(self.__session)))
+        self.__session = session
+        event.listen(session, 'after_attach', self.__track)
+        event.listen(session, 'loaded_as_persistent', self.__track)
+        if self.__mode == BATCH_SAVEPOINT:
+            session.begin_nested()
+
+    def checkpoint(self, force: bool = False) -> bool:
+        """ Flushes, commits, or releases the savepoint, and expunges every object, if the Session is over one of its
+                limits (or `force` is set).
+
+        :param force: Whether to checkpoint even under the limits.
+        :type force: bool
+        :return: Whether a checkpoint was made.
+        :rtype: bool
+        """
+        if not (force or self.__objects >= self.__max_objects or self.__bytes >= self.__max_bytes):
+            return False
+        session = self.__session
+        if self.__mode == BATCH_COMMIT:
+            session.commit()
+        else:
+            session.flush()
+            if self.__mode == BATCH_SAVEPOINT:
+                session.commit()
+                session.begin_nested()
+        session.expunge_all()
+        self.__checkpoints += 1
+        self.__objects = 0
+        self.__bytes = 0
+        return True
+
+    def finish(self):
+        """ Releases the last savepoint, in 'savepoint' mode, so the Session's own transaction can be committed. """
+        if self.__mode == BATCH_SAVEPOINT and self.__session is not None and self.__session.transaction is not None \
+                and self.__session.transaction.nested:
+            self.__session.commit()
+
+    def detach(self):
+        """ Stops tracking the Session. """
+        if self.__session is not None:
+            event.remove(self.__session, 'after_attach', self.__track)
+            event.remove(self.__session, 'loaded_as_persistent', self.__track)
+            self.__session = None
+
+    def __track(self, session: Session, instance: Any):
+        self.__objects += 1
+        self.__bytes += approximate_size(instance)
+        self.__total_objects += 1
+        self.__peak_objects = max(self.__peak_objects, self.__objects)
+        self.__peak_bytes = max(self.__peak_bytes, self.__bytes)
@@ -0,0 +1,293 @@
+# System Imports
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, List, Tuple
+
+# Third-Party Imports
+from sqlalchemy.orm.session import Session
+
+# Local Source Imports
+from alchemist_stack.context import Context, BULK_PROFILE
+from .models import Base
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+logger = logging.getLogger('Alchemist Stack')
+
+""" Sentinel placed on the queue to tell the flush thread to drain and exit. """
+_STOP = object()
+
+class WriteBuffer(object):
+    """ Group-Commit Write Buffer.
+
+        Collects ORM objects submitted from any number of threads and inserts them in batches: a batch is flushed as
+        one multi-row INSERT, in one transaction, once it holds `max_rows` objects or once `flush_interval` seconds
+        have passed since its first object arrived, whichever comes first. Every caller gets a
+        :class:`Future <concurrent.futures.Future>` that resolves to its object once the batch commits, or to the
+        exception that made the batch fail.
+
+        Memory is bounded by `max_pending`; once that many objects are waiting, :code:`submit()` blocks (backpressure)
+        until the flush thread catches up or the submit timeout expires.
+
+    Usage:
+        >>> buffer = WriteBuffer(context=db, max_rows=500, flush_interval=0.05)
+        >>> repo = TestRepository(context=db, write_buffer=buffer)
+        >>> future = repo.create_test(obj=Test())
+        >>> buffer.close()
+    """
+
+    def __init__(self, context: Context, max_rows: int = 500, flush_interval: float = 0.05,
+                 max_pending: int = 10000, return_defaults: bool = False):
+        """ Write Buffer Constructor
+
+        :param context: The Database :code:`Context <Context>` used to open the flush Sessions.
+        :type context: Context
+        :param max_rows: The maximum number of objects inserted per batch.
+        :type max_rows: int
+        :param flush_interval: The maximum time, in seconds, an object waits in the buffer before its batch is flushed.
+        :type flush_interval: float
+        :param max_pending: The maximum number of objects waiting to be flushed before submitters are blocked.
+        :type max_pending: int
+        :param return_defaults: Whether to fetch server-generated primary keys and defaults back onto the objects.
+            This makes the INSERT row-by-row on most dialects, so it is off by default.
+        :type return_defaults: bool
+        """
+        if max_rows < 1:
+            raise ValueError('max_rows must be at least 1, got {max_rows}'.format(max_rows=max_rows))
+        if flush_interval <= 0:
+            raise ValueError('flush_interval must be positive, got {interval}'.format(interval=flush_interval))
+
+        self.__context = context
+        self.__max_rows = max_rows
+        self.__flush_interval = flush_interval
+        self.__return_defaults = return_defaults
+        self.__queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self.__closed = threading.Event()
+        # Submits past the closed check that have not enqueued yet; close() waits for them, so none is left behind.
+        self.__submitting = 0
+        self.__submits_done = threading.Condition()
+        self.__flushed_batches = 0
+        self.__flushed_rows = 0
+        self.__thread = threading.Thread(target=self.__run, name='alchemist-write-buffer', daemon=True)
+        self.__thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self) -> str:
+        """ A String representation of the :class:`WriteBuffer <WriteBuffer>`.
+
+        :returns: String representation of :class:`WriteBuffer <WriteBuffer>` object.
+        :rtype: str
+        """
+        return '<class WriteBuffer(max_rows={max_rows}, flush_interval={interval}) at {hex_id}>'\
+            .format(max_rows=self.__max_rows,
+                    interval=self.__flush_interval,
+                    hex_id=hex(id(self)))
+
+    @property
+    def closed(self) -> bool:
+        return self.__closed.is_set()
+
+    @property
+    def pending(self) -> int:
+        """ Gets the approximate number of objects waiting to be flushed.
+
+        :rtype: int
+        """
+        return self.__queue.qsize()
+
+    @property
+    def flushed_batches(self) -> int:
+        return self.__flushed_batches
+
+    @property
+    def flushed_rows(self) -> int:
+        return self.__flushed_rows
+
+    def submit(self, obj: Base, block: bool = True, timeout: float = None) -> Future:
+        """ Queues `obj` for insertion in the next batch.
+
+        :param obj: The entity model to be inserted. This entity model must inherit from `Base`.
+        :type obj: Base
+        :param block: Whether to wait for room in the buffer when it is full.
+            Default: True => Wait up to `timeout` seconds (forever if `timeout` is None).
+        :type block: bool
+        :param timeout: The maximum number of seconds to wait for room in the buffer.
+        :type timeout: float
+        :raises: WriteBufferClosedException, WriteBufferFullException
+        :return: A Future resolving to `obj` once its batch has been committed.
+        :rtype: Future
+        """
+        with self.__submits_done:
+            if self.__closed.is_set():
+                self.__throw_write_buffer_closed_exception()
+            self.__submitting += 1
+        future = Future()
+        try:
+            self.__queue.put((obj, future), block=block, timeout=timeout)
+        except queue.Full:
+            self.__throw_write_buffer_full_exception(timeout=timeout)
+        finally:
+            with self.__submits_done:
+                self.__submitting -= 1
+                self.__submits_done.notify_all()
+        return future
+
+    def close(self, timeout: float = None):
+        """ Stops accepting new objects, flushes everything still buffered, and stops the flush thread.
+
+        :param timeout: The maximum number of seconds to wait for the flush thread to drain the buffer.
+        :type timeout: float
+        """
+        with self.__submits_done:
+            if self.__closed.is_set():
+                return
+            self.__closed.set()
+        try:
+            self.__queue.put((_STOP, None), timeout=timeout)
+        except queue.Full:
+            # The flush thread also stops once it finds the buffer closed and empty.
+            pass
+        self.__thread.join(timeout=timeout)
+
+        # Anything submitted while close() was racing the flush thread is flushed here, on the closing thread, until
+        # every submit accepted before the close has enqueued.
+        while True:
+            leftovers = self.__drain_nowait()
+            if leftovers:
+                self.__flush(leftovers)
+            with self.__submits_done:
+                if self.__submitting == 0 and self.__queue.empty():
+                    return
+                self.__submits_done.wait(timeout=self.__flush_interval)
+
+    def __run(self):
+        """ Flush thread main loop. """
+        stopping = False
+        while not stopping:
+            try:
+                obj, future = self.__queue.get(timeout=self.__flush_interval)
+            except queue.Empty:
+                if self.__closed.is_set():
+                    break
+                continue
+            if obj is _STOP:
+                break
+
+            batch: List[Tuple[Base, Future]] = [(obj, future)]
+            deadline = time.monotonic() + self.__flush_interval
+            while len(batch) < self.__max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    obj, future = self.__queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if obj is _STOP:
+                    stopping = True
+                    break
+                batch.append((obj, future))
+
+            if stopping:
+                batch.extend(self.__drain_nowait())
+            self.__flush(batch)
+
+    def __drain_nowait(self) -> List[Tuple[Base, Future]]:
+        """ Removes every object currently waiting in the queue without blocking. """
+        drained = []
+        while True:
+            try:
+                obj, future = self.__queue.get_nowait()
+            except queue.Empty:
+                return drained
+            if obj is not _STOP:
+                drained.append((obj, future))
+
+    def __flush(self, batch: List[Tuple[Base, Future]]):
+        """ Inserts `batch` in a single transaction and resolves its futures.
+
+        :param batch: List of (object, future) pairs.
+        """
+        for start in range(0, len(batch), self.__max_rows):
+            chunk = [(obj, future) for (obj, future) in batch[start:start + self.__max_rows]
+                     if future.set_running_or_notify_cancel()]
+            if not chunk:
+                continue
+
+            session: Session = None
+            try:
+                session = self.__context.open_session(profile=BULK_PROFILE, owner=self)
+                session.bulk_save_objects([obj for (obj, _) in chunk], return_defaults=self.__return_defaults)
+                session.commit()
+            except Exception as error:
+                # Any failure (the database, admission, a deadline, a draining Context) fails this chunk only: the
+                # flush thread keeps serving the next ones.
+                if session is not None:
+                    session.rollback()
+                logger.error('Write buffer failed to flush {count} objects: {error}'
+                             .format(count=len(chunk), error=error))
+                for (_, future) in chunk:
+                    future.set_exception(error)
+            else:
+                self.__flushed_batches += 1
+                self.__flushed_rows += len(chunk)
+                for (obj, future) in chunk:
+                    future.set_result(obj)
+            finally:
+                if session is not None:
+                    self.__context.close_session(session)
+
+    def __throw_write_buffer_closed_exception(self):
+        """ Raise a :code:`WriteBufferClosedException <WriteBufferClosedException>` """
+        __errors = {
+            'buffer': repr(self),
+        }
+        raise WriteBufferClosedException(
+            message='The write buffer {buffer} has been closed.'
+                .format(buffer=repr(self)),
+            errors=__errors
+        )
+
+    def __throw_write_buffer_full_exception(self, timeout: Any):
+        """ Raise a :code:`WriteBufferFullException <WriteBufferFullException>` """
+        __errors = {
+            'buffer': repr(self),
+            'pending': self.__queue.qsize(),
+            'timeout': timeout,
+        }
+        raise WriteBufferFullException(
+            message='The write buffer {buffer} is full ({pending} objects pending).'
+                .format(buffer=repr(self),
+                        pending=self.__queue.qsize()),
+            errors=__errors
+        )
+
+class WriteBufferClosedException(Exception):
+    """ Exception for Write Buffers: Buffer Is Closed """
+
+    def __init__(self, message: str, errors: dict, *args):
+        super().__init__(message, *args)
+        self.__errors = errors
+
+    @property
+    def errors(self) -> dict:
+        return self.__errors
+
+class WriteBufferFullException(Exception):
+    """ Exception for Write Buffers: Buffer Is Full """
+
+    def __init__(self, message: str, errors: dict, *args):
+        super().__init__(message, *args)
+        self.__errors = errors
+
+    @property
+    def errors(self) -> dict:
+        return self.__errors
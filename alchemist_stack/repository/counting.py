@@ -0,0 +1,171 @@
+# System Imports
+import threading
+import time
+import weakref
+from typing import Any, Dict, Hashable, Tuple, Union
+
+# Third-Party Imports
+from sqlalchemy import event, text
+from sqlalchemy.engine.base import Connection, Engine
+from sqlalchemy.schema import Table
+
+# Local Source Imports
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+""" Count with `SELECT count(*)`, every time. """
+COUNT_EXACT = 'exact'
+
+""" Count with `SELECT count(*)`, and reuse the result until it expires, or a write to the table is committed. """
+COUNT_CACHED = 'cached'
+
+""" Read the planner's row estimate for the whole table (no scan); falls back to a cached count. """
+COUNT_ESTIMATED = 'estimated'
+
+COUNT_MODES = (COUNT_EXACT, COUNT_CACHED, COUNT_ESTIMATED)
+
+class CountCache(object):
+    """ Cache of row counts, keyed by table and filter.
+
+        Every INSERT, UPDATE or DELETE executed on an Engine the cache :code:`watch()`es invalidates the counts of
+        its table, once when it is executed and again when its transaction commits. A count is only stored if no
+        write to its table was seen while it was being computed, so a count never outlives a write it missed by more
+        than the time its own query took.
+    """
+
+    __contexts = weakref.WeakKeyDictionary()
+    __contexts_lock = threading.Lock()
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 4096):
+        """ Count Cache Constructor
+
+        :param ttl: How many seconds a count is reused for, at most.
+        :type ttl: float
+        :param max_entries: The maximum number of counts kept; the oldest are dropped first.
+        :type max_entries: int
+        """
+        self.__ttl = ttl
+        self.__max_entries = max_entries
+        self.__lock = threading.Lock()
+        self.__counts: Dict[Tuple[str, Hashable], Tuple[int, float]] = {}
+        self.__generations: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.__counts)
+
+    @classmethod
+    def for_context(cls, context: Any) -> 'CountCache':
+        """ Gets the cache shared by every repository of `context`, creating it (and watching the Context's Engine)
+                on first use.
+
+        :rtype: CountCache
+        """
+        with cls.__contexts_lock:
+            cache = cls.__contexts.get(context)
+            if cache is None:
+                cache = cls()
+                cache.watch(context.engine)
+                cls.__contexts[context] = cache
+            return cache
+
+    @property
+    def ttl(self) -> float:
+        return self.__ttl
+
+    def generation(self, table: str) -> int:
+        """ Gets the number of writes seen on `table`; handed back to :code:`put()`. """
+        with self.__lock:
+            return self.__generations.get(table, 0)
+
+    def get(self, table: str, key: Hashable, ttl: float = None) -> Union[int, None]:
+        """ Gets the cached count of `table` for `key`, if it is younger than `ttl` seconds.
+
+        :rtype: int
+        """
+        __ttl = self.__ttl if ttl is None else ttl
+        with self.__lock:
+            entry = self.__counts.get((table, key))
+        if entry is None or time.monotonic() - entry[1] > __ttl:
+            return None
+        return entry[0]
+
+    def put(self, table: str, key: Hashable, count: int, generation: int):
+        """ Stores a count computed while `table` was at `generation`, unless the table has been written since. """
+        with self.__lock:
+            if self.__generations.get(table, 0) != generation:
+                return
+            if len(self.__counts) >= self.__max_entries:
+                self.__counts.pop(next(iter(self.__counts)))
+            self.__counts[(table, key)] = (count, time.monotonic())
+
+    def invalidate(self, table: str = None):
+        """ Drops the cached counts of `table`, or of every table. """
+        with self.__lock:
+            if table is None:
+                for name in self.__generations:
+                    self.__generations[name] += 1
+                self.__counts.clear()
+                return
+            self.__generations[table] = self.__generations.get(table, 0) + 1
+            for key in [key for key in self.__counts if key[0] == table]:
+                del self.__counts[key]
+
+    def watch(self, engine: Engine):
+        """ Invalidates the counts of every table written through `engine`. """
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            compiled = getattr(context, 'compiled', None)
+            if compiled is None or not (context.isinsert or context.isupdate or context.isdelete):
+                return
+            table = getattr(compiled.statement, 'table', None)
+            if isinstance(table, Table):
+                self.invalidate(table.name)
+                conn.info.setdefault('alchemist_written_tables', set()).add(table.name)
+
+        @event.listens_for(engine, 'commit')
+        def commit(conn):
+            for table in conn.info.pop('alchemist_written_tables', ()):
+                self.invalidate(table)
+
+        @event.listens_for(engine, 'rollback')
+        def rollback(conn):
+            conn.info.pop('alchemist_written_tables', None)
+
+def estimate_count(connection: Connection, table: Table) -> Union[int, None]:
+    """ Reads the planner's row estimate for `table`, without scanning it:
+            PostgreSQL `pg_class.reltuples`, MySQL `information_schema.tables.table_rows`, and SQLite `sqlite_stat1`
+            (filled by `ANALYZE`).
+
+    :param connection: The Connection, or Session, to read the statistics with.
+    :param table: The table to estimate.
+    :type table: Table
+    :return: The estimated number of rows, or None if the dialect has no statistics, or the table was never analyzed.
+    :rtype: int
+    """
+    dialect = (connection.dialect if isinstance(connection, Connection) else connection.get_bind().dialect).name
+    name = table.name if table.schema is None else '{schema}.{name}'.format(schema=table.schema, name=table.name)
+
+    if dialect == 'postgresql':
+        estimate = connection.execute(text('SELECT reltuples FROM pg_class WHERE oid = to_regclass(:name)'),
+                                      {'name': name}).scalar()
+        return int(estimate) if estimate is not None and estimate >= 0 else None
+
+    if dialect == 'mysql':
+        estimate = connection.execute(text('SELECT table_rows FROM information_schema.tables '
+                                           'WHERE table_schema = COALESCE(:schema, DATABASE()) AND table_name = :name'),
+                                      {'schema': table.schema, 'name': table.name}).scalar()
+        return int(estimate) if estimate is not None else None
+
+    if dialect == 'sqlite':
+        exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"))\
+            .scalar()
+        if not exists:
+            return None
+        stats = connection.execute(text('SELECT stat FROM sqlite_stat1 WHERE tbl = :name'),
+                                   {'name': table.name}).fetchall()
+        # The first figure of every index's `stat` is the number of rows in the table.
+        counts = [int(stat.split()[0]) for (stat,) in stats if stat]
+        return max(counts) if counts else None
+
+    return None
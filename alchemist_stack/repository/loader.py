@@ -0,0 +1,198 @@
+# System Imports
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Union
+
+# Third-Party Imports
+
+# Local Source Imports
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+""" The loaders of the current request, keyed by whatever their owner chooses, or None outside of a
+    :code:`loader_scope()`.
+"""
+_LOADERS: ContextVar[Union[Dict[Hashable, 'DataLoader'], None]] = ContextVar('alchemist_loaders', default=None)
+
+@contextmanager
+def loader_scope():
+    """ Scopes :code:`DataLoader <DataLoader>`s to a request: inside the block, `RepositoryBase._loader()` hands out
+            one loader per repository and model, shared by the code the request runs (including the asyncio tasks it
+            starts, which inherit the scope), so the loads of the whole request are batched and cached together. The
+            loaders, and their caches, are dropped at the end of the block.
+
+    Usage:
+        >>> with loader_scope():
+        ...     result = schema.execute(query)
+    """
+    token = _LOADERS.set({})
+    try:
+        yield
+    finally:
+        _LOADERS.reset(token)
+
+def scoped_loader(key: Hashable, factory: Callable[[], 'DataLoader']) -> 'DataLoader':
+    """ Gets the loader `key` of the current :code:`loader_scope()`, creating it with `factory` on first use. Outside of
+            a scope, every call gets a new loader.
+
+    :rtype: DataLoader
+    """
+    loaders = _LOADERS.get()
+    if loaders is None:
+        return factory()
+    loader = loaders.get(key)
+    if loader is None:
+        loader = loaders.setdefault(key, factory())
+    return loader
+
+class LoaderFuture(Future):
+    """ The pending result of a :code:`DataLoader.load()`. Asking for its result dispatches the loader's batch, if it
+            has not been dispatched yet.
+    """
+
+    def __init__(self, loader: 'DataLoader'):
+        super().__init__()
+        self.__loader = loader
+
+    def result(self, timeout: float = None) -> Any:
+        if not self.done():
+            self.__loader.dispatch()
+        return super().result(timeout=timeout)
+
+    def exception(self, timeout: float = None) -> Union[BaseException, None]:
+        if not self.done():
+            self.__loader.dispatch()
+        return super().exception(timeout=timeout)
+
+class DataLoader(object):
+    """ Coalesces single-key loads into batched loads.
+
+        :code:`load()` queues a key and returns a :code:`LoaderFuture <LoaderFuture>`; the queued keys are loaded
+        together, with one call to `batch_load`, as soon as any of their results is needed (or on :code:`dispatch()`).
+        :code:`load_async()` does the same for asyncio code, and dispatches once every coroutine ready to run in the
+        current event loop tick has queued its keys. Keys are loaded once per loader: later loads of the same key get
+        the cached result.
+
+    Usage:
+        >>> loader = DataLoader(lambda ids: repo._get_objects(User, ids))
+        >>> futures = [loader.load(post.author_id) for post in posts]   # Nothing is loaded yet.
+        >>> authors = [future.result() for future in futures]            # One query.
+        >>> author = await loader.load_async(post.author_id)
+    """
+
+    def __init__(self, batch_load: Callable[[List[Any]], List[Any]], max_batch_size: int = None, cache: bool = True):
+        """ Data Loader Constructor
+
+        :param batch_load: Loads a list of keys: returns their values, in the same order (None for a missing key).
+        :param max_batch_size: The most keys passed to one call of `batch_load`.
+            Default: None => Every queued key.
+        :type max_batch_size: int
+        :param cache: Whether loaded values are reused by later loads of the same key.
+        :type cache: bool
+        """
+        self.__batch_load = batch_load
+        self.__max_batch_size = max_batch_size
+        self.__cache_enabled = cache
+        self.__cache: Dict[Hashable, Future] = {}
+        self.__queue: Dict[Hashable, LoaderFuture] = {}
+        self.__lock = threading.Lock()
+        self.__scheduled = False
+        self.__batches = 0
+
+    @property
+    def batches(self) -> int:
+        """ Gets how many times `batch_load` was called.
+
+        :rtype: int
+        """
+        return self.__batches
+
+    def load(self, key: Hashable) -> Future:
+        """ Queues `key` to be loaded with the next batch.
+
+        :return: A Future resolving to the key's value.
+        :rtype: Future
+        """
+        with self.__lock:
+            future = self.__cache.get(key) if self.__cache_enabled else None
+            if future is None:
+                future = self.__queue.get(key)
+            if future is None:
+                future = self.__queue[key] = LoaderFuture(self)
+                if self.__cache_enabled:
+                    self.__cache[key] = future
+            return future
+
+    def load_many(self, keys: Iterable[Hashable]) -> List[Future]:
+        """ Queues every key of `keys` to be loaded with the next batch.
+
+        :rtype: List[Future]
+        """
+        return [self.load(key) for key in keys]
+
+    async def load_async(self, key: Hashable) -> Any:
+        """ Loads `key` with the batch of everything the current event loop tick loads; the batch runs in the loop's
+                default executor.
+        """
+        future = self.load(key)
+        if not future.done():
+            loop = asyncio.get_running_loop()
+            with self.__lock:
+                schedule = not self.__scheduled
+                self.__scheduled = True
+            if schedule:
+                loop.call_soon(self.__dispatch_in_executor, loop)
+        return await asyncio.wrap_future(future)
+
+    def prime(self, key: Hashable, value: Any):
+        """ Caches `value` as the value of `key`, unless it is already loaded or queued. """
+        if not self.__cache_enabled:
+            return
+        future = Future()
+        future.set_result(value)
+        with self.__lock:
+            self.__cache.setdefault(key, future)
+
+    def clear(self, key: Hashable = None):
+        """ Forgets the cached value of `key` (or of every key), so it is loaded again. """
+        with self.__lock:
+            if key is None:
+                self.__cache.clear()
+            else:
+                self.__cache.pop(key, None)
+
+    def dispatch(self):
+        """ Loads every queued key now. """
+        with self.__lock:
+            (queue, self.__queue) = (self.__queue, {})
+            self.__scheduled = False
+        if not queue:
+            return
+        keys = list(queue.keys())
+        size = self.__max_batch_size or len(keys)
+        for i in range(0, len(keys), size):
+            batch = keys[i:i + size]
+            try:
+                self.__batches += 1
+                values = list(self.__batch_load(batch))
+                if len(values) != len(batch):
+                    raise ValueError('The batch load returned {values} values for {keys} keys.'
+                                     .format(values=len(values), keys=len(batch)))
+            except Exception as error:
+                with self.__lock:
+                    for key in batch:
+                        if self.__cache.get(key) is queue[key]:
+                            del self.__cache[key]
+                for key in batch:
+                    queue[key].set_exception(error)
+                continue
+            for (key, value) in zip(batch, values):
+                queue[key].set_result(value)
+
+    def __dispatch_in_executor(self, loop: asyncio.AbstractEventLoop):
+        # The batch runs with the context of the coroutine that scheduled it (e.g. its deadline).
+        loop.run_in_executor(None, contextvars.copy_context().run, self.dispatch)
@@ -1,14 +1,31 @@
 # System Imports
-from typing import TypeVar
+from typing import List, TypeVar
 
 # Third-Party Imports
 from sqlalchemy.engine.base import Engine
 from sqlalchemy.ext.declarative import declarative_base
 
 # Local Source Imports
+from .bootstrap import bootstrap_schema, existing_tables, schema_fingerprint
+from .compression import CompressedBinary, CompressedJSON, CompressedText, CompressedValue, train_dictionary, ZLIB, \
+    ZSTD
 
 B = TypeVar('B', bound='Base')
 Base = declarative_base()
 
-def create_tables(engine: Engine):
-    Base.metadata.create_all(engine)
+def create_tables(engine: Engine, fingerprint_path: str = None) -> List[str]:
+    """ Creates the tables of every model missing from the database, with one catalog query, in one transaction
+            where the dialect allows. See :code:`bootstrap_schema()`.
+
+    Usage:
+        >>> create_tables(engine=db.engine, fingerprint_path='/var/cache/app/schema.json')
+
+    :param engine: The Engine of the database.
+    :type engine: Engine
+    :param fingerprint_path: A JSON file caching the schema fingerprint of every bootstrapped database, so an unchanged
+        schema is not checked again. Default: None => The database is always checked.
+    :type fingerprint_path: str
+    :return: The names of the tables created.
+    :rtype: List[str]
+    """
+    return bootstrap_schema(engine, Base.metadata, fingerprint_path=fingerprint_path)
@@ -1,19 +1,397 @@
-from sqlalchemy import Column, PrimaryKeyConstraint, Table
-from sqlalchemy.ext.declarative.base import declared_attr
+# System Imports
+from contextlib import contextmanager
+from typing import Any, Dict, FrozenSet, Iterable, List, Sequence, Tuple, Type, Union
+
+# Third-Party Imports
+from sqlalchemy import Column, PrimaryKeyConstraint, Table, and_, bindparam, func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext import baked
+from sqlalchemy.ext.declarative import declared_attr
+from sqlalchemy.orm.attributes import instance_state
+
+# Local Source Imports
+from alchemist_stack.context import Context, BULK_PROFILE, DEFAULT_PROFILE, READ_ONLY_PROFILE
+from alchemist_stack.repository import RepositoryBase, UnknownColumnException, UnknownModelException,\
+    UnknownUpdateKeyException
+from alchemist_stack.repository.counting import COUNT_EXACT
+from alchemist_stack.repository.models import Base
+from alchemist_stack.repository.models.registry import model_metadata
 
 __author__ = 'H.D. "Chip" McCullough IV'
 
-# class AutoTable(object):
-#     @classmethod
-#     @declared_attr
-#     def __tablename__(cls):
-#         return cls.__name__
-#
-#     @classmethod
-#     def __table_cls__(cls, *args, **kwargs):
-#         for obj in args[1:]:
-#             if (isinstance(obj, Column) and obj.primary_key) \
-#                     or (isinstance(obj, PrimaryKeyConstraint)):
-#                 return Table(*args, **kwargs)
-#
-#         return None
\ No newline at end of file
+class AutoTable(object):
+    """ Declarative mixin that names the table after the class, and skips creating a Table for classes that do not
+            declare a primary key (e.g. abstract intermediates).
+    """
+
+    @declared_attr
+    def __tablename__(cls):
+        return cls.__name__
+
+    @classmethod
+    def __table_cls__(cls, *args, **kwargs):
+        for obj in args[1:]:
+            if (isinstance(obj, Column) and obj.primary_key) \
+                    or (isinstance(obj, PrimaryKeyConstraint)):
+                return Table(*args, **kwargs)
+
+        return None
+
+""" Bind parameter names; prefixed so they never collide with the column names in INSERT/UPDATE statements. """
+_PK_PARAM = '_pk_{index}'
+_VALUE_PARAM = '_v_{key}'
+_LIMIT_PARAM = '_limit'
+_OFFSET_PARAM = '_offset'
+
+class AutoRepositoryBase(RepositoryBase):
+    """ Auto Repository Base class for repositories generated by :code:`create_repository()`.
+
+        Every statement is built once, either when the repository class is generated or the first time a given set of
+        filter/update keys is used, and reused on every call: reads through SQL Alchemy baked queries, writes and counts
+        through Core statements executed with bind parameters.
+    """
+
+    __model__: Type[Base] = None
+    __bakery__ = None
+    __primary_keys__: Tuple[Tuple[str, Column], ...] = ()
+    __columns__: Dict[str, Column] = {}
+    __statements__: Dict[Any, Any] = {}
+
+    @classmethod
+    def instance(cls, context: Context, *args, **kwargs):
+        return cls(context=context, *args, **kwargs)
+
+    @property
+    def model(self) -> Type[Base]:
+        return self.__model__
+
+    def get(self, pk: Any) -> Union[Base, None]:
+        """ Gets the `model` row with primary key `pk`.
+
+        :param pk: The primary key, or a tuple of values for a composite primary key.
+        :return: The model instance, or None.
+        """
+        with self.context.span('repository.get', repository=self.__class__.__name__,
+                               model=self.__model__.__name__, operation='get'):
+            params = self.__pk_params(pk)
+            with self.__read() as session:
+                return self.__statements__['get'](session).params(**params).one_or_none()
+
+    def get_many(self, pks: Iterable[Any]) -> List[Union[Base, None]]:
+        """ Gets the `model` rows with primary keys `pks`, in the order of `pks`, in as few queries as the dialect's
+                bound parameter limit allows. Missing rows are returned as None.
+
+        :param pks: The primary keys, or tuples of values for a composite primary key.
+        :return: List of model instances (or None), one per key.
+        """
+        return self._get_objects(self.__model__, list(pks))
+
+    def list(self, limit: int = None, offset: int = None, **filters) -> List[Base]:
+        """ Gets the `model` rows whose attributes equal `filters`, ordered by primary key.
+
+        :param limit: The maximum number of rows to return.
+        :type limit: int
+        :param offset: The number of rows to skip.
+        :type offset: int
+        :param filters: Attribute name => value equality filters.
+        :return: List of model instances.
+        """
+        paging = (limit is not None, offset is not None)
+        query = self.__statement(('list', frozenset(filters.keys()), paging), self.__build_list, filters.keys(), paging)
+        params = {_VALUE_PARAM.format(key=key): value for (key, value) in filters.items()}
+        params.update({_LIMIT_PARAM: limit, _OFFSET_PARAM: offset})
+        with self.context.span('repository.list', repository=self.__class__.__name__,
+                               model=self.__model__.__name__, operation='list'):
+            with self.__read() as session:
+                return query(session).params(**params).all()
+
+    def count(self, mode: str = COUNT_EXACT, ttl: float = None, **filters) -> int:
+        """ Counts the `model` rows whose attributes equal `filters`.
+
+        :param mode: 'exact', 'cached', or 'estimated'. See :code:`RepositoryBase._count_objects()`.
+        :type mode: str
+        :param ttl: How many seconds a cached count may be reused for.
+        :type ttl: float
+        :param filters: Attribute name => value equality filters.
+        :return: Number of rows.
+        :rtype: int
+        """
+        if mode != COUNT_EXACT:
+            return self._count_objects(self.__model__, *[self.__column(key) == value
+                                                         for (key, value) in filters.items()], mode=mode, ttl=ttl)
+        statement = self.__statement(('count', frozenset(filters.keys())), self.__build_count, filters.keys())
+        params = {_VALUE_PARAM.format(key=key): value for (key, value) in filters.items()}
+        with self.context.span('repository.count', repository=self.__class__.__name__,
+                               model=self.__model__.__name__, operation='count'):
+            with self.__read() as session:
+                return session.execute(statement, params).scalar()
+
+    def create(self, obj: Base) -> Base:
+        """ Inserts `obj`, and returns it with its primary key populated.
+
+        :param obj: The model instance to insert.
+        :return: `obj`
+        """
+        with self.context.span('repository.create', repository=self.__class__.__name__,
+                               model=self.__model__.__name__, operation='create'):
+            # No expire on commit, so the returned object stays readable once its Session is closed.
+            with self.__write(BULK_PROFILE) as session:
+                session.add(obj)
+        return obj
+
+    def bulk_create(self, objs: Iterable[Union[Base, dict]]) -> int:
+        """ Inserts `objs` (model instances or attribute dictionaries) with executemany INSERTs, in one transaction.
+
+            An executemany INSERT takes its columns from its first row, so consecutive rows setting the same columns
+            share one; a row setting other columns (e.g. a model instance leaving a defaulted column unset) starts the
+            next. The rows are inserted in the order of `objs`.
+
+        :param objs: The rows to insert.
+        :return: Number of rows inserted.
+        :rtype: int
+        """
+        groups: List[List[Dict[str, Any]]] = []
+        for obj in objs:
+            row = self.__column_params(obj if isinstance(obj, dict) else self.__attributes(obj))
+            if groups and groups[-1][0].keys() == row.keys():
+                groups[-1].append(row)
+            else:
+                groups.append([row])
+        if not groups:
+            return 0
+        with self.context.span('repository.bulk_create', repository=self.__class__.__name__,
+                               model=self.__model__.__name__, operation='bulk_create'):
+            with self.__write(BULK_PROFILE) as session:
+                for rows in groups:
+                    session.execute(self.__statements__['insert'], rows)
+        return sum(len(rows) for rows in groups)
+
+    def update(self, pk: Any, **values) -> int:
+        """ Updates the attributes `values` of the `model` row with primary key `pk`.
+
+        :param pk: The primary key, or a tuple of values for a composite primary key.
+        :param values: Attribute name => new value.
+        :return: Number of rows updated.
+        :rtype: int
+        """
+        return self.bulk_update([dict(values, **self.__pk_attributes(pk))])
+
+    def bulk_update(self, rows: Sequence[dict]) -> int:
+        """ Updates many `model` rows. Every row is a dictionary of attribute values including the primary key; rows
+                updating the same set of attributes share one executemany UPDATE.
+
+        :param rows: The rows to update.
+        :return: Number of rows updated.
+        :rtype: int
+        """
+        groups: Dict[FrozenSet[str], List[dict]] = {}
+        pk_attributes = [attribute for (attribute, _) in self.__primary_keys__]
+        for row in rows:
+            for attribute in pk_attributes:
+                if attribute not in row:
+                    self.__throw_unknown_update_key_exception(key=attribute, row=row)
+            keys = frozenset(key for key in row.keys() if key not in pk_attributes)
+            params = {_PK_PARAM.format(index=index): row[attribute] for (index, attribute) in enumerate(pk_attributes)}
+            params.update({_VALUE_PARAM.format(key=key): row[key] for key in keys})
+            groups.setdefault(keys, []).append(params)
+
+        rowcount = 0
+        with self.context.span('repository.bulk_update', repository=self.__class__.__name__,
+                               model=self.__model__.__name__, operation='bulk_update'):
+            with self.__write(BULK_PROFILE) as session:
+                for (keys, params) in groups.items():
+                    statement = self.__statement(('update', keys), self.__build_update, keys)
+                    result = session.execute(statement, params)
+                    rowcount += max(result.rowcount, 0)
+        return rowcount
+
+    def delete(self, pk: Any) -> int:
+        """ Deletes the `model` row with primary key `pk`.
+
+        :param pk: The primary key, or a tuple of values for a composite primary key.
+        :return: Number of rows deleted.
+        :rtype: int
+        """
+        with self.context.span('repository.delete', repository=self.__class__.__name__,
+                               model=self.__model__.__name__, operation='delete'):
+            with self.__write(DEFAULT_PROFILE) as session:
+                return session.execute(self.__statements__['delete'], self.__pk_params(pk)).rowcount
+
+    @contextmanager
+    def __read(self):
+        """ Read-only Session scope. """
+        session = self.context.open_session(profile=READ_ONLY_PROFILE, owner=self)
+        try:
+            yield session
+        finally:
+            self.context.close_session(session)
+
+    @contextmanager
+    def __write(self, profile: str):
+        """ Transactional Session scope; rolls back and re-raises on failure. """
+        session = self.context.open_session(profile=profile, owner=self)
+        try:
+            yield session
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            raise
+        finally:
+            self.context.close_session(session)
+
+    def __pk_params(self, pk: Any) -> Dict[str, Any]:
+        values = pk if isinstance(pk, tuple) else (pk,)
+        if len(values) != len(self.__primary_keys__):
+            raise ValueError('{model} has a {n}-column primary key, got {pk}'
+                             .format(model=self.__model__.__name__, n=len(self.__primary_keys__), pk=pk))
+        return {_PK_PARAM.format(index=index): value for (index, value) in enumerate(values)}
+
+    def __pk_attributes(self, pk: Any) -> Dict[str, Any]:
+        values = pk if isinstance(pk, tuple) else (pk,)
+        return {attribute: value for ((attribute, _), value) in zip(self.__primary_keys__, values)}
+
+    def __attributes(self, obj: Base) -> Dict[str, Any]:
+        """ Gets the column attributes `obj` sets, including those explicitly set to None; attributes never set are
+                left to the columns' defaults.
+        """
+        state = instance_state(obj).dict
+        return {key: state[key] for key in self.__columns__.keys() if key in state}
+
+    def __column_params(self, attributes: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return {self.__columns__[key].key: value for (key, value) in attributes.items()}
+        except KeyError as error:
+            self.__throw_unknown_column_exception(column=error.args[0])
+
+    def __statement(self, key: Any, builder, *args):
+        """ Gets the cached statement `key`, building it with `builder(*args)` the first time. """
+        statement = self.__statements__.get(key)
+        if statement is None:
+            statement = self.__statements__[key] = builder(*args)
+        return statement
+
+    def __build_list(self, keys: Iterable[str], paging: Tuple[bool, bool]):
+        model = self.__model__
+        order_by = [column for (_, column) in self.__primary_keys__]
+        clause = self.__criteria(keys)
+        (limited, offset) = paging
+
+        def criteria(q):
+            q = (q.filter(clause) if clause is not None else q).order_by(*order_by)
+            q = q.limit(bindparam(_LIMIT_PARAM)) if limited else q
+            return q.offset(bindparam(_OFFSET_PARAM)) if offset else q
+
+        # The filter keys and paging are added to the bakery's cache key, so every variant is cached separately.
+        return self.__bakery__(lambda s: s.query(model)).add_criteria(criteria, tuple(sorted(keys)), paging)
+
+    def __build_count(self, keys: Iterable[str]):
+        statement = select([func.count()]).select_from(self.__model__.__table__)
+        criteria = self.__criteria(keys)
+        return statement.where(criteria) if criteria is not None else statement
+
+    def __build_update(self, keys: Iterable[str]):
+        return self.__model__.__table__.update()\
+            .where(self.__pk_criteria())\
+            .values({self.__column(key): bindparam(_VALUE_PARAM.format(key=key)) for key in keys})
+
+    def __criteria(self, keys: Iterable[str]):
+        clauses = [self.__column(key) == bindparam(_VALUE_PARAM.format(key=key)) for key in sorted(keys)]
+        return and_(*clauses) if clauses else None
+
+    def __pk_criteria(self):
+        return and_(*[column == bindparam(_PK_PARAM.format(index=index))
+                      for (index, (_, column)) in enumerate(self.__primary_keys__)])
+
+    def __column(self, key: str) -> Column:
+        column = self.__columns__.get(key)
+        if column is None:
+            self.__throw_unknown_column_exception(column=key)
+        return column
+
+    def __throw_unknown_column_exception(self, column: str):
+        """ Raise a :code:`UnknownColumnException <UnknownColumnException>` """
+        __errors = {
+            'repo': self.__str__(),
+            'entity': self.__model__,
+            'column': column,
+        }
+        raise UnknownColumnException(
+            message='The entity {cls} does not have a column named {column}'
+                .format(cls=self.__model__.__name__,
+                        column=column),
+            errors=__errors,
+            cls=self.__model__,
+            column=column
+        )
+
+    def __throw_unknown_update_key_exception(self, key: str, row: dict):
+        """ Raise a :code:`UnknownUpdateKeyException <UnknownUpdateKeyException>` """
+        __errors = {
+            'repo': self.__str__(),
+            'entity': self.__model__,
+            'update': row,
+        }
+        raise UnknownUpdateKeyException(
+            message='The entity {cls} cannot perform an update without its primary key attribute {key}.'
+                .format(cls=self.__model__.__name__,
+                        key=key),
+            errors=__errors,
+            cls=self.__model__,
+            key=key,
+            value=None
+        )
+
+def create_repository(model: Type[Base], name: str = None,
+                      base: Type[AutoRepositoryBase] = AutoRepositoryBase) -> Type[AutoRepositoryBase]:
+    """ Generates a repository class for `model`, with get, get_many, list, count, create, bulk_create, update,
+            bulk_update, and delete. The statements are built once, from the model's primary key and columns, and
+            reused by every instance.
+
+    Usage:
+        >>> TestRepository = create_repository(TestTable)
+        >>> repo = TestRepository.instance(context=db)
+        >>> repo.get_many([1, 2, 3])
+
+    :param model: The model class. It must inherit from `Base`.
+    :type model: Base
+    :param name: The class name of the repository.
+        Default: None => '{model}Repository'.
+    :type name: str
+    :param base: The repository base class to derive from.
+    :type base: AutoRepositoryBase
+    :raises: UnknownModelException
+    :return: The repository class.
+    """
+    metadata = model_metadata(model)
+    if metadata is None:
+        __errors = {
+            'entity': model,
+        }
+        raise UnknownModelException(
+            message='The entity {cls} does not inherit from the Declarative Base.'
+                .format(cls=getattr(model, '__name__', model)),
+            errors=__errors,
+            model=model
+        )
+
+    primary_keys = metadata.primary_keys
+    bakery = baked.bakery()
+
+    get = bakery(lambda s: s.query(model))
+    get += lambda q: q.filter(and_(*[column == bindparam(_PK_PARAM.format(index=index))
+                                     for (index, (_, column)) in enumerate(primary_keys)]))
+    statements = {
+        'get': get,
+        'insert': model.__table__.insert(),
+        'delete': model.__table__.delete().where(and_(*[column == bindparam(_PK_PARAM.format(index=index))
+                                                        for (index, (_, column)) in enumerate(primary_keys)])),
+    }
+
+    return type(name or '{model}Repository'.format(model=model.__name__), (base,), {
+        '__model__': model,
+        '__bakery__': bakery,
+        '__primary_keys__': primary_keys,
+        '__columns__': metadata.columns,
+        '__statements__': statements,
+        '__doc__': 'Generated repository for {model}.'.format(model=model.__name__),
+    })
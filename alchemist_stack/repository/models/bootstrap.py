@@ -0,0 +1,118 @@
+# System Imports
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Dict, List, Set, Union
+
+# Third-Party Imports
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.schema import MetaData, Table
+from sqlalchemy.sql.ddl import SchemaGenerator
+
+# Local Source Imports
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+def schema_fingerprint(metadata: MetaData, engine: Engine) -> str:
+    """ Gets a digest of the structure of every table of `metadata` (its columns and their types, defaults, and
+            flags, its constraints, and its indexes), and of `engine`'s dialect. Any change to the schema changes it.
+            No DDL is compiled, so it costs no more than a few milliseconds for hundreds of tables.
+
+    :rtype: str
+    """
+    digest = hashlib.sha256(engine.dialect.name.encode('utf-8'))
+    for table in sorted(metadata.tables.values(), key=lambda t: t.fullname):
+        parts = [table.fullname]
+        for column in table.columns:
+            parts.append('{name}:{type!r}:{nullable}:{primary_key}:{autoincrement}:{default!r}:{server_default!r}'
+                         .format(name=column.name, type=column.type, nullable=column.nullable,
+                                 primary_key=column.primary_key, autoincrement=column.autoincrement,
+                                 default=_default(column.default),
+                                 server_default=_default(column.server_default)))
+        for constraint in sorted(table.constraints, key=lambda c: (type(c).__name__, c.name or '')):
+            parts.append('{type}:{name}:{columns}'.format(type=type(constraint).__name__, name=constraint.name,
+                                                          columns=[column.name for column in constraint.columns]))
+        for index in sorted(table.indexes, key=lambda i: i.name or ''):
+            parts.append('index:{name}:{unique}:{columns}'.format(name=index.name, unique=index.unique,
+                                                                  columns=[column.name for column in index.columns]))
+        digest.update('\n'.join(parts).encode('utf-8'))
+    return digest.hexdigest()
+
+def existing_tables(connection, schemas: Set[Union[str, None]]) -> Set[tuple]:
+    """ Gets the (schema, name) of every table of `schemas` in the database, with one catalog query per schema. """
+    dialect = connection.dialect
+    return {(schema, name) for schema in schemas for name in dialect.get_table_names(connection, schema=schema)}
+
+def bootstrap_schema(engine: Engine, metadata: MetaData, fingerprint_path: str = None) -> List[str]:
+    """ Creates the tables of `metadata` missing from the database behind `engine`.
+
+        Instead of one existence check per table, as `MetaData.create_all()` runs, the existing tables are read with
+        one catalog query (per schema), and the missing tables and their indexes are created, in dependency order, in
+        one transaction (DDL is only transactional on some dialects, e.g. PostgreSQL and SQL Server; MySQL commits
+        every statement). Types and sequences the tables use (e.g. a PostgreSQL ENUM shared with an existing table)
+        are still checked before they are created. With a `fingerprint_path`, the schema's fingerprint is stored there, per database, once it
+        is in place, and later bootstraps of the same schema on the same database return without a query.
+
+    :param engine: The Engine of the database.
+    :type engine: Engine
+    :param metadata: The tables.
+    :type metadata: MetaData
+    :param fingerprint_path: A JSON file caching the fingerprint of the schema of every bootstrapped database.
+        Default: None => The database is always checked.
+    :type fingerprint_path: str
+    :return: The names of the tables created.
+    :rtype: List[str]
+    """
+    database = repr(engine.url)
+    fingerprint = None
+    if fingerprint_path is not None:
+        fingerprint = schema_fingerprint(metadata, engine)
+        if _read_fingerprints(fingerprint_path).get(database) == fingerprint:
+            return []
+
+    with engine.begin() as connection:
+        existing = existing_tables(connection, {table.schema for table in metadata.tables.values()})
+        missing = [table for table in metadata.sorted_tables if (table.schema, table.name) not in existing]
+        if missing:
+            connection._run_visitor(_MissingTableGenerator, metadata, checkfirst=True, tables=missing)
+
+    if fingerprint_path is not None:
+        fingerprints = _read_fingerprints(fingerprint_path)
+        fingerprints[database] = fingerprint
+        _write_fingerprints(fingerprint_path, fingerprints)
+    return [table.name for table in missing]
+
+class _MissingTableGenerator(SchemaGenerator):
+    """ Creates tables already known to be missing without checking each one again. `checkfirst` stays on for
+            everything else: `MetaData.create_all(checkfirst=False)` would also re-issue `CREATE TYPE` for a PostgreSQL
+            ENUM that exists, and `CREATE SEQUENCE` for a sequence that does.
+    """
+
+    def _can_create_table(self, table: Table) -> bool:
+        return True
+
+def _default(default) -> Any:
+    """ Gets the value of a column default; callables (e.g. `datetime.utcnow`) are only told apart by their name. """
+    value = getattr(default, 'arg', None)
+    return getattr(value, '__qualname__', 'callable') if callable(value) else value
+
+def _read_fingerprints(path: str) -> Dict[str, str]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            fingerprints = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return fingerprints if isinstance(fingerprints, dict) else {}
+
+def _write_fingerprints(path: str, fingerprints: Dict[str, str]):
+    """ Writes the fingerprints to a temporary file first, so concurrent readers never see a partial file. """
+    directory = os.path.dirname(os.path.abspath(path))
+    (handle, temporary) = tempfile.mkstemp(dir=directory, prefix='.fingerprints-')
+    try:
+        with os.fdopen(handle, 'w', encoding='utf-8') as f:
+            json.dump(fingerprints, f, indent=2, sort_keys=True)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
@@ -0,0 +1,290 @@
+# System Imports
+import json
+import threading
+import zlib
+from typing import Any, Callable, Iterable, Union
+
+# Third-Party Imports
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+# Local Source Imports
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+""" Compression codecs. zstd requires the optional `zstandard` package. """
+ZLIB = 'zlib'
+ZSTD = 'zstd'
+
+""" The first byte of every stored value: how the rest of it is encoded. `_DICTIONARY` is or'ed into the codec when the
+    value was compressed with a trained dictionary, whose 4-byte id follows the header.
+"""
+_RAW = 0x00
+_CODECS = {ZLIB: 0x01, ZSTD: 0x02}
+_DICTIONARY = 0x80
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError as error:
+        raise ImportError('zstd compression requires the zstandard package') from error
+    return zstandard
+
+def dictionary_id(dictionary: bytes) -> bytes:
+    """ Gets the 4-byte id stored with values compressed with `dictionary`. """
+    return zlib.crc32(dictionary).to_bytes(4, 'big')
+
+def train_dictionary(samples: Iterable[Union[bytes, str]], size: int = 16384, codec: str = ZLIB) -> bytes:
+    """ Trains a compression dictionary from sample payloads, for columns holding many small, similar values (e.g.
+            JSON documents sharing their keys), which compress poorly on their own.
+
+        zstd dictionaries are trained with `zstandard.train_dictionary()`. zlib only takes a preset dictionary of
+        content likely to recur, so the samples' most common fragments are packed into it, most common last (zlib
+        reaches the end of the dictionary with the shortest distances).
+
+    Usage:
+        >>> dictionary = train_dictionary(json.dumps(event).encode() for event in sample_events)
+        >>> payload = Column(CompressedJSON(threshold=0, dictionary=dictionary))
+
+    :param samples: Representative payloads.
+    :param size: The maximum dictionary size in bytes.
+    :type size: int
+    :param codec: 'zlib' or 'zstd'.
+    :type codec: str
+    :return: The dictionary. Keep it: every value compressed with it needs it to be read back.
+    :rtype: bytes
+    """
+    __samples = [sample.encode('utf-8') if isinstance(sample, str) else bytes(sample) for sample in samples]
+    if codec == ZSTD:
+        return _zstandard().train_dictionary(size, __samples).as_bytes()
+    if codec != ZLIB:
+        raise ValueError('Unknown codec {codec!r}; expected {zlib!r} or {zstd!r}.'.format(codec=codec, zlib=ZLIB,
+                                                                                          zstd=ZSTD))
+    counts = {}
+    for sample in __samples:
+        for fragment in set(sample[i:i + 32] for i in range(0, max(len(sample) - 31, 1), 8)):
+            counts[fragment] = counts.get(fragment, 0) + 1
+    common = sorted((fragment for (fragment, count) in counts.items() if count > 1), key=lambda f: counts[f])
+    dictionary = b''.join(common)
+    return dictionary[-size:]
+
+class CompressedValue(object):
+    """ A compressed column value, decompressed the first time it is used.
+
+        Returned by compressed columns created with `lazy=True`, so rows can be loaded, filtered on their other
+        columns, and copied without paying for decompression. :code:`value <value>` decompresses and caches the
+        payload; item access, iteration, `len()`, `in`, `str()`, equality and attribute access go through it. Writing
+        a value that was never decompressed back stores its compressed bytes as they are.
+    """
+
+    __slots__ = ('__data', '__load', '__value', '__loaded')
+
+    def __init__(self, data: bytes, load: Callable[[bytes], Any]):
+        self.__data = data
+        self.__load = load
+        self.__value = None
+        self.__loaded = False
+
+    @property
+    def value(self) -> Any:
+        if not self.__loaded:
+            self.__value = self.__load(self.__data)
+            self.__loaded = True
+        return self.__value
+
+    @property
+    def compressed(self) -> bytes:
+        """ Gets the value as stored, header included. """
+        return self.__data
+
+    @property
+    def loaded(self) -> bool:
+        return self.__loaded
+
+    def __repr__(self) -> str:
+        if self.__loaded:
+            return '<CompressedValue({value!r})>'.format(value=self.__value)
+        return '<CompressedValue({size} bytes, not loaded)>'.format(size=len(self.__data))
+
+    def __str__(self) -> str:
+        return str(self.value)
+
+    def __eq__(self, other) -> bool:
+        return self.value == (other.value if isinstance(other, CompressedValue) else other)
+
+    def __ne__(self, other) -> bool:
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __len__(self) -> int:
+        return len(self.value)
+
+    def __iter__(self):
+        return iter(self.value)
+
+    def __contains__(self, item) -> bool:
+        return item in self.value
+
+    def __getitem__(self, item):
+        return self.value[item]
+
+    def __getattr__(self, name: str):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.value, name)
+
+class CompressedBinary(TypeDecorator):
+    """ Binary column compressed on write, and decompressed on read (or lazily, on first use, with `lazy=True`).
+
+        Values shorter than `threshold` bytes, or that do not shrink, are stored raw; a one-byte header tells them
+        apart, so the threshold, level, and codec can change at any time without rewriting existing rows. The column
+        itself stays an ordinary binary column (`LargeBinary`).
+
+    Usage:
+        >>> class Document(Base):
+        ...     __tablename__ = 'document'
+        ...     primary_key = Column('id', Integer, primary_key=True)
+        ...     body = Column(CompressedText(threshold=256), nullable=False)
+        ...     attributes = Column(CompressedJSON(codec='zstd', lazy=True))
+    """
+
+    impl = LargeBinary
+
+    def __init__(self, threshold: int = 512, level: int = 6, codec: str = ZLIB, dictionary: bytes = None,
+                 lazy: bool = False, *args, **kwargs):
+        """ Compressed Column Type Constructor
+
+        :param threshold: Values shorter than this many bytes are stored uncompressed.
+        :type threshold: int
+        :param level: The compression level (zlib: 1-9, zstd: 1-22).
+        :type level: int
+        :param codec: 'zlib', or 'zstd' (requires the `zstandard` package).
+        :type codec: str
+        :param dictionary: A dictionary from :code:`train_dictionary()`, for small, similar values.
+        :type dictionary: bytes
+        :param lazy: Whether values are returned as :code:`CompressedValue <CompressedValue>`s, decompressed on
+            first use, instead of being decompressed as rows are loaded.
+        :type lazy: bool
+        """
+        super().__init__(*args, **kwargs)
+        if codec not in _CODECS:
+            raise ValueError('Unknown codec {codec!r}; expected {zlib!r} or {zstd!r}.'.format(codec=codec, zlib=ZLIB,
+                                                                                              zstd=ZSTD))
+        self.__threshold = threshold
+        self.__level = level
+        self.__codec = codec
+        self.__dictionary = dictionary
+        self.__dictionary_id = dictionary_id(dictionary) if dictionary else b''
+        self.__lazy = lazy
+        self.__header = bytes([_CODECS[codec] | (_DICTIONARY if dictionary else 0)]) + self.__dictionary_id
+        # zstd (de)compressor objects may not be shared between threads, so each thread builds its own.
+        self.__zstd = threading.local()
+        if codec == ZSTD:
+            _zstandard()
+
+    @property
+    def threshold(self) -> int:
+        return self.__threshold
+
+    @property
+    def codec(self) -> str:
+        return self.__codec
+
+    @property
+    def lazy(self) -> bool:
+        return self.__lazy
+
+    def dump(self, value: Any) -> bytes:
+        """ Serializes a column value to bytes. Overridden by subclasses storing other types. """
+        return bytes(value)
+
+    def load(self, data: bytes) -> Any:
+        """ Deserializes bytes to a column value. Overridden by subclasses storing other types. """
+        return data
+
+    def compress(self, payload: bytes) -> bytes:
+        """ Encodes `payload` for storage: compressed with its header, or raw if it is short or incompressible. """
+        if len(payload) >= self.__threshold:
+            if self.__codec == ZLIB:
+                if self.__dictionary:
+                    compressor = zlib.compressobj(self.__level, zdict=self.__dictionary)
+                    compressed = compressor.compress(payload) + compressor.flush()
+                else:
+                    compressed = zlib.compress(payload, self.__level)
+            else:
+                compressed = self.__zstd_codec().compressor.compress(payload)
+            if len(compressed) + len(self.__header) < len(payload) + 1:
+                return self.__header + compressed
+        return bytes([_RAW]) + payload
+
+    def decompress(self, data: bytes) -> bytes:
+        """ Decodes a stored value back to its payload, whichever codec it was written with. """
+        header = data[0]
+        if header == _RAW:
+            return data[1:]
+        body = data[1:]
+        if header & _DICTIONARY:
+            (stored_id, body) = (body[:4], body[4:])
+            if stored_id != self.__dictionary_id:
+                raise ValueError('The value was compressed with dictionary {stored}, not this column\'s ({own}).'
+                                 .format(stored=stored_id.hex(), own=self.__dictionary_id.hex() or 'none'))
+        codec = header & ~_DICTIONARY
+        if codec == _CODECS[ZLIB]:
+            if header & _DICTIONARY:
+                decompressor = zlib.decompressobj(zdict=self.__dictionary)
+                return decompressor.decompress(body) + decompressor.flush()
+            return zlib.decompress(body)
+        if codec == _CODECS[ZSTD]:
+            return self.__zstd_codec().decompressor.decompress(body)
+        raise ValueError('Unknown compression header {header:#04x}'.format(header=header))
+
+    def process_bind_param(self, value: Any, dialect) -> Union[bytes, None]:
+        if value is None:
+            return None
+        if isinstance(value, CompressedValue) and not value.loaded and self.__reusable(value.compressed):
+            return value.compressed
+        return self.compress(self.dump(value.value if isinstance(value, CompressedValue) else value))
+
+    def process_result_value(self, value: Union[bytes, None], dialect) -> Any:
+        if value is None:
+            return None
+        data = bytes(value)
+        if self.__lazy:
+            return CompressedValue(data, self.__read)
+        return self.__read(data)
+
+    def __zstd_codec(self) -> threading.local:
+        """ Gets this thread's zstd compressor and decompressor, built with the column's level and dictionary. """
+        codec = self.__zstd
+        if not hasattr(codec, 'compressor'):
+            zstandard = _zstandard()
+            dictionary = zstandard.ZstdCompressionDict(self.__dictionary) \
+                if self.__dictionary and self.__codec == ZSTD else None
+            codec.compressor = zstandard.ZstdCompressor(level=self.__level, dict_data=dictionary)
+            codec.decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+        return codec
+
+    def __read(self, data: bytes) -> Any:
+        return self.load(self.decompress(data))
+
+    def __reusable(self, data: bytes) -> bool:
+        """ Whether stored bytes from another row can be written as they are: this column can read them back. """
+        return not data[0] & _DICTIONARY or data[1:5] == self.__dictionary_id
+
+class CompressedText(CompressedBinary):
+    """ Text column, stored compressed as UTF-8. See :code:`CompressedBinary <CompressedBinary>`. """
+
+    def dump(self, value: str) -> bytes:
+        return value.encode('utf-8')
+
+    def load(self, data: bytes) -> str:
+        return data.decode('utf-8')
+
+class CompressedJSON(CompressedBinary):
+    """ JSON column, stored compressed. See :code:`CompressedBinary <CompressedBinary>`. """
+
+    def dump(self, value: Any) -> bytes:
+        return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+    def load(self, data: bytes) -> Any:
+        return json.loads(data.decode('utf-8'))
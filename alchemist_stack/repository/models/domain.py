@@ -0,0 +1,207 @@
+# System Imports
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple, Type, TypeVar
+
+# Third-Party Imports
+from sqlalchemy.schema import Column
+
+# Local Source Imports
+from . import Base
+from .registry import model_metadata
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+D = TypeVar('D', bound='DomainModel')
+
+""" Marks a constructor argument that was not passed, so a per-instance default can be computed. """
+_MISSING = object()
+
+def _column_default(default: Any) -> Tuple[bool, Any]:
+    """ Gets the value of a Python-side column default (a ColumnDefault, or None).
+
+    :return: (is_callable, value). Callable defaults (e.g. `datetime.now`) are evaluated per instance.
+    """
+    if default is None or not getattr(default, 'is_scalar', False) and not getattr(default, 'is_callable', False):
+        return (False, None)
+    if default.is_callable:
+        # ColumnDefault wraps callables to take an execution context; zero-argument callables ignore it.
+        return (True, default.arg)
+    return (False, default.arg)
+
+def _compile(name: str, source: str, scope: Dict[str, Any]) -> Callable:
+    """ Compiles the generated function `name` from `source`. """
+    exec(compile(source, '<domain model {name}>'.format(name=name), 'exec'), scope)
+    return scope[name]
+
+class DomainModelMeta(type):
+    """ Metaclass for :code:`DomainModel <DomainModel>`.
+
+        Given a `table` (a `Base` model), it declares one slot per column attribute, and generates the constructor
+        and the row/mapping converters from the table's :code:`ModelMetadata <ModelMetadata>`, so none of them loop
+        over field names at run time.
+    """
+
+    def __new__(mcs, name: str, bases: Tuple[type, ...], namespace: Dict[str, Any], table: Type[Base] = None, **kwargs):
+        if table is None:
+            namespace.setdefault('__slots__', ())
+            return super().__new__(mcs, name, bases, namespace, **kwargs)
+
+        metadata = model_metadata(table)
+        if metadata is None:
+            raise TypeError('{name}: table must be a Base model, got {table!r}'.format(name=name, table=table))
+
+        fields = tuple(metadata.columns.keys())
+        namespace['__slots__'] = fields + tuple(namespace.get('__slots__', ()))
+        namespace['__fields__'] = fields
+        namespace['__table_model__'] = table
+        namespace['__column_keys__'] = tuple(column.key for column in metadata.columns.values())
+        cls = super().__new__(mcs, name, bases, namespace, **kwargs)
+        mcs.__generate(cls, fields, [_column_default(metadata.defaults.get(field)) for field in fields])
+        return cls
+
+    def __init__(cls, name: str, bases: Tuple[type, ...], namespace: Dict[str, Any], table: Type[Base] = None,
+                 **kwargs):
+        super().__init__(name, bases, namespace, **kwargs)
+
+    @staticmethod
+    def __generate(cls, fields: Tuple[str, ...], defaults: List[Tuple[bool, Any]]):
+        """ Generates `__init__`, `_from_rows`, `_to_mappings` and `_to_column_mappings` on `cls`. """
+        scope = {'_MISSING': _MISSING, '_new': object.__new__, '_cls': cls}
+        arguments = []
+        assignments = []
+        for (index, (field, (is_callable, value))) in enumerate(zip(fields, defaults)):
+            if is_callable:
+                scope['_default_{i}'.format(i=index)] = value
+                arguments.append('{f}=_MISSING'.format(f=field))
+                assignments.append('    self.{f} = _default_{i}(None) if {f} is _MISSING else {f}'
+                                   .format(f=field, i=index))
+            else:
+                scope['_default_{i}'.format(i=index)] = value
+                arguments.append('{f}=_default_{i}'.format(f=field, i=index))
+                assignments.append('    self.{f} = {f}'.format(f=field))
+
+        cls.__init__ = _compile('__init__', 'def __init__(self, {args}):\n{body}\n'.format(
+            args=', '.join(arguments), body='\n'.join(assignments) or '    pass'), scope)
+        cls.__init__.__qualname__ = '{cls}.__init__'.format(cls=cls.__qualname__)
+
+        cls._from_rows = staticmethod(_compile('_from_rows', (
+            'def _from_rows(rows):\n'
+            '    objs = []\n'
+            '    append = objs.append\n'
+            '    for row in rows:\n'
+            '        obj = _new(_cls)\n'
+            '{body}\n'
+            '        append(obj)\n'
+            '    return objs\n'
+        ).format(body='\n'.join('        obj.{f} = row[{i}]'.format(f=f, i=i) for (i, f) in enumerate(fields))),
+            scope))
+
+        cls._to_mappings = staticmethod(_compile('_to_mappings', (
+            'def _to_mappings(objs):\n'
+            '    return [{{{items}}} for obj in objs]\n'
+        ).format(items=', '.join('{f!r}: obj.{f}'.format(f=f) for f in fields)), scope))
+
+        cls._to_column_mappings = staticmethod(_compile('_to_column_mappings', (
+            'def _to_column_mappings(objs):\n'
+            '    return [{{{items}}} for obj in objs]\n'
+        ).format(items=', '.join('{k!r}: obj.{f}'.format(k=k, f=f)
+                                 for (f, k) in zip(fields, cls.__column_keys__))), scope))
+
+class DomainModel(object, metaclass=DomainModelMeta):
+    """ Slots-based Domain Model base class.
+
+        Subclasses name their `Base` table, and get one slot per column attribute (no per-instance `__dict__`), a
+        positional/keyword constructor in column order, and vectorized converters to and from rows, mappings and ORM
+        instances. Callable column defaults (e.g. `default=datetime.now`) are evaluated per instance, not once at
+        import.
+
+    Usage:
+        >>> class Test(DomainModel, table=TestTable):
+        ...     pass
+        >>> t = Test(None, datetime.now(timezone.utc))
+        >>> tests = Test.from_rows(session.execute(select(Test.columns())))
+        >>> session.bulk_insert_mappings(TestTable, Test.to_mappings(tests))
+    """
+
+    __fields__: Tuple[str, ...] = ()
+    __column_keys__: Tuple[str, ...] = ()
+    __table_model__: Type[Base] = None
+
+    def __repr__(self) -> str:
+        """ A String representation of the object, with as much information as possible.
+
+        :returns: String representation of the Domain Model object.
+        """
+        return '<class {name}({fields}) at {hex_id}>'.format(
+            name=self.__class__.__name__,
+            fields=', '.join('{f}={v!r}'.format(f=f, v=getattr(self, f, None)) for f in self.__fields__),
+            hex_id=hex(id(self)))
+
+    def __eq__(self, other) -> bool:
+        """ Domain Model Equality Test: same class, same field values. """
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.__fields__)
+
+    def __ne__(self, other) -> bool:
+        """ Domain Model Inequality Test """
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __getstate__(self) -> Tuple[Any, ...]:
+        return tuple(getattr(self, f) for f in self.__fields__)
+
+    def __setstate__(self, state: Tuple[Any, ...]):
+        for (f, value) in zip(self.__fields__, state):
+            setattr(self, f, value)
+
+    @classmethod
+    def columns(cls) -> List[Column]:
+        """ Gets the table columns in field order, for Core selects feeding :code:`from_rows()`.
+
+        :rtype: List[Column]
+        """
+        columns = model_metadata(cls.__table_model__).columns
+        return [columns[f] for f in cls.__fields__]
+
+    @classmethod
+    def from_rows(cls: Type[D], rows: Iterable[Sequence[Any]]) -> List[D]:
+        """ Builds domain models from rows whose values are in field order (e.g. the result of a Core select of
+                :code:`columns()`).
+
+        :param rows: Iterable of tuples/rows.
+        :return: List of domain models.
+        """
+        return cls._from_rows(rows)
+
+    @classmethod
+    def from_orm(cls: Type[D], obj: Base) -> D:
+        """ Builds a domain model from an ORM instance of its table. """
+        return cls._from_rows((tuple(getattr(obj, f) for f in cls.__fields__),))[0]
+
+    @classmethod
+    def from_orms(cls: Type[D], objs: Iterable[Base]) -> List[D]:
+        """ Builds domain models from ORM instances of their table. """
+        fields = cls.__fields__
+        return cls._from_rows([tuple(getattr(obj, f) for f in fields) for obj in objs])
+
+    @classmethod
+    def to_mappings(cls, objs: Iterable['DomainModel'], by_column: bool = False) -> List[Dict[str, Any]]:
+        """ Converts domain models to dictionaries.
+
+        :param objs: The domain models.
+        :param by_column: Whether to key the dictionaries by column key (for Core statements) instead of attribute name
+            (for `Session.bulk_insert_mappings` / `bulk_update_mappings`).
+        :type by_column: bool
+        :return: List of dictionaries.
+        """
+        return cls._to_column_mappings(objs) if by_column else cls._to_mappings(objs)
+
+    def to_mapping(self, by_column: bool = False) -> Dict[str, Any]:
+        """ Converts the domain model to a dictionary. See :code:`to_mappings()`. """
+        return self.to_mappings((self,), by_column=by_column)[0]
+
+    def to_orm(self) -> Base:
+        """ Builds an ORM instance of the domain model's table. """
+        return self.__table_model__(**self._to_mappings((self,))[0])
@@ -0,0 +1,113 @@
+# System Imports
+import threading
+from typing import Any, Dict, FrozenSet, Tuple, Type, Union
+
+# Third-Party Imports
+from sqlalchemy import Column, event, inspect
+from sqlalchemy.orm.attributes import QueryableAttribute
+from sqlalchemy.orm.mapper import Mapper
+from sqlalchemy.schema import Table
+
+# Local Source Imports
+from . import Base
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+class ModelMetadata(object):
+    """ Everything the repositories and domain models need to know about a model, read from its mapper once: its
+            columns, primary key, Python-side column defaults, and the map from column names to attribute names.
+
+        Get it with :code:`model_metadata()`, never construct it directly.
+    """
+
+    __slots__ = ('model', 'mapper', 'table', 'columns', 'primary_keys', 'defaults', 'attributes', 'attribute_names',
+                 'version_column')
+
+    def __init__(self, model: Type[Base]):
+        mapper: Mapper = inspect(model)
+        self.model = model
+        self.mapper = mapper
+        self.table: Table = mapper.local_table
+        # Attribute name => Column, for every column attribute.
+        self.columns: Dict[str, Column] = {attr.key: attr.columns[0] for attr in mapper.column_attrs}
+        # (attribute name, Column) of every primary key column, in key order.
+        self.primary_keys: Tuple[Tuple[str, Column], ...] = tuple((mapper.get_property_by_column(column).key, column)
+                                                                  for column in mapper.primary_key)
+        # Attribute name => ColumnDefault, for every column with a Python-side default.
+        self.defaults: Dict[str, Any] = {key: column.default for (key, column) in self.columns.items()
+                                         if column.default is not None}
+        # Every mapped attribute name (columns, relationships, hybrids, ...).
+        self.attributes: FrozenSet[str] = frozenset(mapper.all_orm_descriptors.keys())
+        # Column name => attribute name.
+        self.attribute_names: Dict[str, str] = {column.name: key for (key, column) in self.columns.items()}
+        self.version_column: Union[Column, None] = mapper.version_id_col
+
+    def __repr__(self) -> str:
+        return '<ModelMetadata(model={model}, columns={columns})>'.format(model=self.model.__name__,
+                                                                          columns=list(self.columns.keys()))
+
+    def attribute(self, key: Any) -> Union[str, None]:
+        """ Resolves an attribute name, or an InstrumentedAttribute (`cls.attribute`), to the attribute name.
+
+        :return: The attribute name, or None if `key` is neither a mapped attribute of the model, nor an attribute name.
+        :rtype: str
+        """
+        if isinstance(key, str):
+            return key if key in self.attributes else None
+        if isinstance(key, QueryableAttribute):
+            return key.key if key.key in self.attributes else None
+        return None
+
+    def column(self, key: Any) -> Union[Column, None]:
+        """ Resolves an attribute name, or an InstrumentedAttribute, to its Column.
+
+        :return: The Column, or None if `key` is not a column attribute of the model.
+        :rtype: Column
+        """
+        if isinstance(key, QueryableAttribute):
+            key = key.key
+        return self.columns.get(key) if isinstance(key, str) else None
+
+""" Model class => ModelMetadata. Models are added when their mapper is configured, or on their first lookup. """
+_REGISTRY: Dict[type, ModelMetadata] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+def model_metadata(model: Any) -> Union[ModelMetadata, None]:
+    """ Gets the :code:`ModelMetadata <ModelMetadata>` of `model`, building it on first use.
+
+        Models declared after startup are picked up either way: their metadata is registered as soon as SQL Alchemy
+        configures their mapper, or the first time they are looked up.
+
+    Usage:
+        >>> metadata = model_metadata(Record)
+        >>> metadata.primary_keys
+        (('primary_key', Column('id', Integer(), table=<record>, primary_key=True, nullable=False)),)
+        >>> model_metadata(object) is None
+        True
+
+    :param model: The model class.
+    :return: The metadata, or None if `model` is not a class inheriting from `Base`.
+    :rtype: ModelMetadata
+    """
+    try:
+        return _REGISTRY[model]
+    except KeyError:
+        pass
+    except TypeError:
+        # Unhashable, so certainly not a model class.
+        return None
+    if not (isinstance(model, type) and issubclass(model, Base)) or inspect(model, raiseerr=False) is None:
+        return None
+    return _register(model)
+
+def _register(model: Type[Base]) -> ModelMetadata:
+    metadata = ModelMetadata(model)
+    with _REGISTRY_LOCK:
+        return _REGISTRY.setdefault(model, metadata)
+
+@event.listens_for(Base, 'mapper_configured', propagate=True)
+def _mapper_configured(mapper: Mapper, cls: type):
+    """ Registers every model as SQL Alchemy finishes configuring its mapper. """
+    if not mapper.non_primary:
+        with _REGISTRY_LOCK:
+            _REGISTRY[cls] = ModelMetadata(cls)
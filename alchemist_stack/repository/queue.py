@@ -0,0 +1,303 @@
+# System Imports
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Type
+
+# Third-Party Imports
+from sqlalchemy import Column, Float, Integer, String, and_, bindparam, func, inspect, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.declarative import declared_attr
+from sqlalchemy.orm.attributes import set_committed_value
+
+# Local Source Imports
+from alchemist_stack.context import Context, BULK_PROFILE
+from . import RepositoryBase, UnknownModelException
+from .models import Base
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+""" Dialects whose `SELECT ... FOR UPDATE SKIP LOCKED` lets concurrent claimers pass over each other's rows. """
+_SKIP_LOCKED_DIALECTS = ('postgresql', 'mysql', 'oracle')
+
+class QueueItem(object):
+    """ Declarative mixin adding the columns a :code:`QueueRepositoryBase <QueueRepositoryBase>` needs to a table.
+
+        `visible_at` is the time (seconds since the epoch) from which the row may be claimed; `claim_token`
+        identifies the claim currently holding it; `attempts` counts how many times it has been claimed.
+
+    Usage:
+        >>> class Job(QueueItem, Base):
+        ...     __tablename__ = 'job'
+        ...     primary_key = Column('id', Integer, primary_key=True)
+        ...     payload = Column(String(255), nullable=False)
+    """
+
+    @declared_attr
+    def visible_at(cls):
+        return Column(Float, nullable=False, default=0.0, index=True)
+
+    @declared_attr
+    def claim_token(cls):
+        return Column(String(32), nullable=True, index=True)
+
+    @declared_attr
+    def attempts(cls):
+        return Column(Integer, nullable=False, default=0)
+
+class QueueRepositoryBase(RepositoryBase):
+    """ Queue Repository Base class for using a table as a work queue.
+
+        :code:`claim()` atomically takes up to N visible rows, and hides them from other workers for a visibility
+        timeout. Workers :code:`ack()` the rows they finished (deleting them), or :code:`nack()` the ones they could
+        not process (making them visible again); rows whose worker died reappear once their timeout expires.
+
+        On PostgreSQL, MySQL and Oracle, rows are claimed with `SELECT ... FOR UPDATE SKIP LOCKED`, so concurrent
+        workers skip each other's rows instead of waiting on them. Elsewhere (e.g. SQLite, which serializes writers)
+        a single `UPDATE ... WHERE pk IN (SELECT ... LIMIT n)` stamps the rows with a claim token, and the claimed
+        rows are selected back by that token.
+
+    Usage:
+        >>> class JobQueue(QueueRepositoryBase):
+        ...     @classmethod
+        ...     def instance(cls, context, *args, **kwargs):
+        ...         return cls(context=context, model=Job, *args, **kwargs)
+        >>> queue = JobQueue.instance(context=db, visibility_timeout=30)
+        >>> jobs = queue.claim(10)
+        >>> queue.ack([job for job in jobs if run(job)])
+    """
+
+    def __init__(self, context: Context, model: Type[QueueItem], *args, visibility_timeout: float = 30.0,
+                 **kwargs):
+        """ Queue Repository Base Constructor
+
+        :param context: The Database :code:`Context <Context>`
+        :type context: Context
+        :param model: The queue table. It must inherit from `Base` and :code:`QueueItem <QueueItem>`.
+        :type model: Type[QueueItem]
+        :param visibility_timeout: How many seconds a claimed row stays hidden from other workers.
+        :type visibility_timeout: float
+        """
+        super().__init__(context, *args, **kwargs)
+        if not (isinstance(model, type) and issubclass(model, Base) and issubclass(model, QueueItem)):
+            self.__throw_unknown_model_exception(cls=model)
+        self.__model = model
+        self.__visibility_timeout = visibility_timeout
+        mapper = inspect(model)
+        if len(mapper.primary_key) != 1:
+            # Claims, acks and nacks address rows by a single primary key column.
+            self.__throw_unknown_model_exception(cls=model, reason='its primary key must be a single column')
+        self.__table = mapper.local_table
+        self.__primary_key: Column = mapper.primary_key[0]
+        self.__skip_locked = context.engine.dialect.name in _SKIP_LOCKED_DIALECTS
+
+    @classmethod
+    def instance(cls, context: Context, *args, **kwargs):
+        return cls(context=context, *args, **kwargs)
+
+    @property
+    def model(self) -> Type[QueueItem]:
+        return self.__model
+
+    @property
+    def visibility_timeout(self) -> float:
+        return self.__visibility_timeout
+
+    @property
+    def skip_locked(self) -> bool:
+        """ Gets whether rows are claimed with `FOR UPDATE SKIP LOCKED` on this Context's dialect.
+
+        :rtype: bool
+        """
+        return self.__skip_locked
+
+    def enqueue(self, objs: Iterable[QueueItem], delay: float = 0.0) -> int:
+        """ Adds `objs` to the queue, visible after `delay` seconds, in one transaction.
+
+        :param objs: The rows to enqueue.
+        :type objs: Iterable[QueueItem]
+        :param delay: How many seconds to wait before the rows may be claimed.
+        :type delay: float
+        :raises: SQLAlchemyError
+        :return: Number of rows enqueued.
+        :rtype: int
+        """
+        with self.context.span('repository.enqueue', repository=self.__class__.__name__,
+                               model=self.__model.__name__, operation='enqueue'):
+            __objs = list(objs)
+            visible_at = time.time() + delay
+            for obj in __objs:
+                obj.visible_at = visible_at
+                obj.claim_token = None
+                obj.attempts = 0
+            with self.__transaction() as session:
+                session.bulk_save_objects(__objs)
+            return len(__objs)
+
+    def claim(self, n: int = 1, visibility_timeout: float = None) -> List[QueueItem]:
+        """ Atomically claims up to `n` visible rows, oldest (lowest primary key) first, and hides them from other
+                workers for `visibility_timeout` seconds.
+
+        :param n: The maximum number of rows to claim.
+        :type n: int
+        :param visibility_timeout: How many seconds the rows stay hidden.
+            Default: None => The repository's :code:`visibility_timeout <visibility_timeout>`.
+        :type visibility_timeout: float
+        :raises: SQLAlchemyError
+        :return: The claimed rows (detached), each carrying its `claim_token`. May be empty.
+        :rtype: List[QueueItem]
+        """
+        with self.context.span('repository.claim', repository=self.__class__.__name__,
+                               model=self.__model.__name__, operation='claim'):
+            now = time.time()
+            timeout = self.__visibility_timeout if visibility_timeout is None else visibility_timeout
+            token = uuid.uuid4().hex
+            values = {
+                'claim_token': token,
+                'visible_at': now + timeout,
+                'attempts': self.__model.attempts + 1,
+            }
+            visible = self.__model.visible_at <= now
+
+            with self.__transaction() as session:
+                if self.__skip_locked:
+                    objs = session.query(self.__model)\
+                        .filter(visible)\
+                        .order_by(self.__primary_key)\
+                        .limit(n)\
+                        .with_for_update(skip_locked=True)\
+                        .all()
+                    if not objs:
+                        return []
+                    pks = [inspect(obj).identity[0] for obj in objs]
+                    session.query(self.__model)\
+                        .filter(self.__primary_key.in_(pks))\
+                        .update(values, synchronize_session=False)
+                    for obj in objs:
+                        set_committed_value(obj, 'claim_token', token)
+                        set_committed_value(obj, 'visible_at', values['visible_at'])
+                        set_committed_value(obj, 'attempts', obj.attempts + 1)
+                else:
+                    candidates = select([self.__primary_key])\
+                        .where(visible)\
+                        .order_by(self.__primary_key)\
+                        .limit(n)
+                    rowcount = session.query(self.__model)\
+                        .filter(self.__primary_key.in_(candidates))\
+                        .update(values, synchronize_session=False)
+                    if rowcount == 0:
+                        return []
+                    objs = session.query(self.__model)\
+                        .filter(self.__model.claim_token == token)\
+                        .order_by(self.__primary_key)\
+                        .all()
+            return objs
+
+    def ack(self, objs: Iterable[QueueItem]) -> int:
+        """ Deletes the finished rows `objs`, in one statement per claim. Rows whose claim was lost (their visibility
+                timeout expired, and another worker claimed them) are left alone.
+
+        :param objs: Rows returned by :code:`claim()`.
+        :type objs: Iterable[QueueItem]
+        :raises: SQLAlchemyError
+        :return: Number of rows deleted.
+        :rtype: int
+        """
+        with self.context.span('repository.ack', repository=self.__class__.__name__,
+                               model=self.__model.__name__, operation='ack'):
+            statement = self.__table.delete()\
+                .where(and_(self.__primary_key.in_(bindparam('_pks', expanding=True)),
+                            self.__table.c.claim_token == bindparam('_token')))
+            return self.__by_claim(objs, statement)
+
+    def nack(self, objs: Iterable[QueueItem], delay: float = 0.0) -> int:
+        """ Releases the rows `objs` back to the queue, visible again after `delay` seconds. Rows whose claim was lost
+                are left alone.
+
+        :param objs: Rows returned by :code:`claim()`.
+        :type objs: Iterable[QueueItem]
+        :param delay: How many seconds to wait before the rows may be claimed again.
+        :type delay: float
+        :raises: SQLAlchemyError
+        :return: Number of rows released.
+        :rtype: int
+        """
+        with self.context.span('repository.nack', repository=self.__class__.__name__,
+                               model=self.__model.__name__, operation='nack'):
+            statement = self.__table.update()\
+                .where(and_(self.__primary_key.in_(bindparam('_pks', expanding=True)),
+                            self.__table.c.claim_token == bindparam('_token')))\
+                .values(claim_token=None, visible_at=time.time() + delay)
+            return self.__by_claim(objs, statement)
+
+    def extend(self, objs: Iterable[QueueItem], visibility_timeout: float = None) -> int:
+        """ Keeps the claimed rows `objs` hidden for another `visibility_timeout` seconds from now, for work that runs
+                longer than the timeout it was claimed with.
+
+        :param objs: Rows returned by :code:`claim()`.
+        :type objs: Iterable[QueueItem]
+        :param visibility_timeout: How many seconds the rows stay hidden.
+            Default: None => The repository's :code:`visibility_timeout <visibility_timeout>`.
+        :type visibility_timeout: float
+        :raises: SQLAlchemyError
+        :return: Number of rows extended (rows whose claim was lost are not).
+        :rtype: int
+        """
+        timeout = self.__visibility_timeout if visibility_timeout is None else visibility_timeout
+        statement = self.__table.update()\
+            .where(and_(self.__primary_key.in_(bindparam('_pks', expanding=True)),
+                        self.__table.c.claim_token == bindparam('_token')))\
+            .values(visible_at=time.time() + timeout)
+        return self.__by_claim(objs, statement)
+
+    def depth(self) -> int:
+        """ Gets the number of rows that may be claimed now.
+
+        :rtype: int
+        """
+        statement = select([func.count()]).select_from(self.__table).where(self.__table.c.visible_at <= time.time())
+        with self.__transaction() as session:
+            return session.execute(statement).scalar()
+
+    def __by_claim(self, objs: Iterable[QueueItem], statement) -> int:
+        """ Executes `statement` once per claim token in `objs`, in one transaction, with the claim's primary keys.
+
+        :return: Number of rows affected.
+        """
+        claims: Dict[str, List[Any]] = {}
+        for obj in objs:
+            claims.setdefault(obj.claim_token, []).append(inspect(obj).identity[0])
+        if not claims:
+            return 0
+        rowcount = 0
+        with self.__transaction() as session:
+            for (token, pks) in claims.items():
+                rowcount += session.execute(statement, {'_pks': pks, '_token': token}).rowcount
+        return rowcount
+
+    @contextmanager
+    def __transaction(self):
+        """ Yields a Session that is committed on exit, or rolled back (and the error raised) on failure. """
+        session = self.context.open_session(profile=BULK_PROFILE, owner=self)
+        try:
+            yield session
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            raise
+        finally:
+            self.context.close_session(session)
+
+    def __throw_unknown_model_exception(self, cls: Any, reason: str = 'it must inherit from Base and QueueItem'):
+        """ Raise a :code:`UnknownModelException <UnknownModelException>` """
+        __errors = {
+            'repo': self.__str__(),
+            'entity': cls,
+            'reason': reason,
+        }
+        raise UnknownModelException(
+            message='The entity {cls} is not a queue table ({reason}).'
+                .format(cls=getattr(cls, '__name__', cls), reason=reason),
+            errors=__errors,
+            model=cls
+        )
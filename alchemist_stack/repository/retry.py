@@ -0,0 +1,68 @@
+# System Imports
+import random
+import time
+
+# Third-Party Imports
+
+# Local Source Imports
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+class RetryPolicy(object):
+    """ Retry policy for optimistic (version column) updates that lose a race.
+
+        Before retry `n` (counting from 0), the writer sleeps a random time in [0, min(max_delay, base_delay * 2^n)]
+        ("full jitter"), so writers that collided once do not collide again in lockstep.
+
+    Usage:
+        >>> repo = CounterRepository.instance(context=db, retry_policy=RetryPolicy(retries=5, base_delay=0.002))
+    """
+
+    def __init__(self, retries: int = 3, base_delay: float = 0.005, max_delay: float = 0.1, jitter: bool = True):
+        """ Retry Policy Constructor
+
+        :param retries: The number of times a conflicting update is reloaded and retried before giving up.
+        :type retries: int
+        :param base_delay: The backoff before the first retry, in seconds.
+        :type base_delay: float
+        :param max_delay: The longest backoff, in seconds.
+        :type max_delay: float
+        :param jitter: Whether to randomize the backoff.
+        :type jitter: bool
+        """
+        self.__retries = retries
+        self.__base_delay = base_delay
+        self.__max_delay = max_delay
+        self.__jitter = jitter
+
+    def __repr__(self) -> str:
+        """ A String representation of the :class:`RetryPolicy <RetryPolicy>`.
+
+        :returns: String representation of :class:`RetryPolicy <RetryPolicy>` object.
+        :rtype: str
+        """
+        return '<class RetryPolicy(retries={retries}, base_delay={base_delay}) at {hex_id}>'\
+            .format(retries=self.__retries,
+                    base_delay=self.__base_delay,
+                    hex_id=hex(id(self)))
+
+    @property
+    def retries(self) -> int:
+        return self.__retries
+
+    def delay(self, attempt: int) -> float:
+        """ Gets the backoff before retry `attempt` (counting from 0), in seconds.
+
+        :rtype: float
+        """
+        ceiling = min(self.__max_delay, self.__base_delay * (2 ** attempt))
+        return random.uniform(0, ceiling) if self.__jitter else ceiling
+
+    def sleep(self, attempt: int):
+        """ Sleeps for the backoff before retry `attempt`. """
+        delay = self.delay(attempt)
+        if delay > 0:
+            time.sleep(delay)
+
+""" The policy for a single, non-retried attempt. """
+NO_RETRY = RetryPolicy(retries=0)
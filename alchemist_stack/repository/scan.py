@@ -0,0 +1,197 @@
+# System Imports
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, List, Sequence, Tuple, Type, Union
+
+# Third-Party Imports
+from sqlalchemy import Integer, and_, create_engine, func, inspect, select
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.engine.interfaces import Dialect
+from sqlalchemy.engine.url import URL
+from sqlalchemy.pool import NullPool
+
+# Local Source Imports
+from alchemist_stack.context import Context
+from .models import Base
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+""" Split the primary key space evenly between its minimum and maximum. Fast; needs integer, evenly spread keys. """
+SPLIT_MINMAX = 'minmax'
+
+""" Split at the primary key quantiles, so every range holds the same number of rows, whatever gaps the keys have. """
+SPLIT_QUANTILE = 'quantile'
+
+""" A primary key range: [low, high), or [low, ...) when `high` is None. """
+KeyRange = Tuple[Any, Any]
+
+""" The Engine of a scan worker process, built by :code:`_initialize_worker()` in the worker itself. """
+_worker_engine: Union[Engine, None] = None
+
+def _initialize_worker(settings: dict):
+    """ Process pool initializer: builds the worker's own Engine from the Context settings. Nothing is inherited from
+            the parent's pool, so forked workers never share a connection with it.
+    """
+    global _worker_engine
+    _worker_engine = create_engine(URL(**settings), poolclass=NullPool)
+
+def _scan_range(model: Type[Base], key_range: KeyRange, batch_size: int, map_batch: Callable[[List[Any]], Any],
+                reduce: Union[Callable[[Any, Any], Any], None], initial: Any) -> Any:
+    """ Streams the rows of `model` in `key_range` in batches of `batch_size`, and maps every batch. With `reduce`,
+            the mapped batches are folded into one result, otherwise they are returned as a list.
+    """
+    statement = _range_statement(model, key_range)
+    results = [] if reduce is None else None
+    accumulator = initial
+    with _worker_engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(statement)
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            mapped = map_batch([tuple(row) for row in rows])
+            if reduce is None:
+                results.append(mapped)
+            else:
+                accumulator = reduce(accumulator, mapped)
+        result.close()
+    return results if reduce is None else accumulator
+
+def _primary_key(model: Type[Base]):
+    """ Gets the single primary key column of `model`. """
+    primary_key = inspect(model).primary_key
+    if len(primary_key) != 1:
+        raise ValueError('{model} has a composite primary key; scans split on a single primary key column'
+                         .format(model=model.__name__))
+    return primary_key[0]
+
+def _range_statement(model: Type[Base], key_range: KeyRange):
+    """ Builds the SELECT of the rows of `model` in `key_range`, in primary key order. """
+    table = inspect(model).local_table
+    column = _primary_key(model)
+    (low, high) = key_range
+    criteria = column >= low if high is None else and_(column >= low, column < high)
+    return select([table]).where(criteria).order_by(column)
+
+def partition_key_ranges(connection: Any, model: Type[Base], partitions: int,
+                         split: str = SPLIT_MINMAX) -> List[KeyRange]:
+    """ Splits the primary key space of `model` into at most `partitions` contiguous ranges covering every row.
+
+    :param connection: The Connection, or Session, to read the key space with.
+    :param model: The model to split. It must have a single primary key column.
+    :type model: Type[Base]
+    :param partitions: The number of ranges wanted.
+    :type partitions: int
+    :param split: 'minmax' (even split of [min, max], for integer keys), or 'quantile' (even split of the rows, read
+        in one pass with `ntile()` where the database has window functions).
+    :type split: str
+    :raises: ValueError
+    :return: The ranges, in key order. Empty if the table is empty.
+    :rtype: List[KeyRange]
+    """
+    column = _primary_key(model)
+    table = inspect(model).local_table
+    if split == SPLIT_MINMAX:
+        if not isinstance(column.type, Integer):
+            raise ValueError('{model} has a {type} primary key; a {minmax!r} split needs integer keys, use {quantile!r}'
+                             .format(model=model.__name__, type=column.type, minmax=SPLIT_MINMAX,
+                                     quantile=SPLIT_QUANTILE))
+        (low, high) = connection.execute(select([func.min(column), func.max(column)]).select_from(table)).first()
+        if low is None:
+            return []
+        step = max(1, -(-(high - low + 1) // partitions))
+        boundaries = list(range(low, high + 1, step))
+    elif split == SPLIT_QUANTILE:
+        dialect = connection.dialect if hasattr(connection, 'dialect') else connection.get_bind().dialect
+        if _supports_window_functions(dialect):
+            # One pass: the lowest key of every ntile.
+            bucket = func.ntile(partitions).over(order_by=column).label('bucket')
+            buckets = select([column.label('boundary'), bucket]).select_from(table).alias('buckets')
+            statement = select([func.min(buckets.c.boundary)]).group_by(buckets.c.bucket).order_by(buckets.c.bucket)
+            boundaries = [row[0] for row in connection.execute(statement)]
+        else:
+            count = connection.execute(select([func.count()]).select_from(table)).scalar()
+            if not count:
+                return []
+            offsets = sorted({(count * i) // partitions for i in range(partitions)})
+            boundaries = [connection.execute(select([column]).order_by(column).limit(1).offset(offset)).scalar()
+                          for offset in offsets]
+    else:
+        raise ValueError('Unknown split {split!r}; expected {minmax!r} or {quantile!r}.'
+                         .format(split=split, minmax=SPLIT_MINMAX, quantile=SPLIT_QUANTILE))
+    return [(low, boundaries[i + 1] if i + 1 < len(boundaries) else None) for (i, low) in enumerate(boundaries)]
+
+def _supports_window_functions(dialect: Dialect) -> bool:
+    """ Gets whether `dialect`'s database runs window functions (SQLite 3.25+, MySQL 8.0+, MariaDB 10.2+, and every
+            other dialect).
+    """
+    if dialect.name == 'sqlite':
+        return dialect.dbapi.sqlite_version_info >= (3, 25)
+    if dialect.name == 'mysql' and dialect.server_version_info is not None:
+        return dialect.server_version_info >= ((10, 2) if getattr(dialect, '_is_mariadb', False) else (8, 0))
+    return True
+
+def parallel_scan(context: Context, model: Type[Base], map_batch: Callable[[List[Tuple[Any, ...]]], Any],
+                  reduce: Callable[[Any, Any], Any] = None, initial: Any = None, partitions: int = None,
+                  max_workers: int = None, batch_size: int = 1000, split: str = SPLIT_MINMAX,
+                  key_ranges: Sequence[KeyRange] = None, mp_context: Any = None) -> Any:
+    """ Scans the whole table of `model` in parallel worker processes, map-reduce style.
+
+        The primary key space is split into ranges (see :code:`partition_key_ranges()`), and every range is streamed by
+        a :code:`ProcessPoolExecutor <ProcessPoolExecutor>` worker over its own Engine, built from the Context's
+        settings. Workers call `map_batch` on every batch of rows (plain tuples, in column order), and fold the mapped
+        batches with `reduce`, so each range sends one pickled result back to the parent, not one message per row.
+        The parent folds the ranges' results with `reduce`, starting from `initial`.
+
+        `map_batch` and `reduce` run in other processes, so they must be picklable (module-level functions), and
+        `initial` must be an identity of `reduce` (e.g. 0 for addition), as every worker starts from it too.
+
+    Usage:
+        >>> def total_value(rows):
+        ...     return sum(row[2] for row in rows)
+        >>> parallel_scan(db, Record, map_batch=total_value, reduce=operator.add, initial=0, max_workers=8)
+
+    :param context: The Database :code:`Context <Context>`.
+    :type context: Context
+    :param model: The model to scan. It must have a single primary key column.
+    :type model: Type[Base]
+    :param map_batch: Function mapping a list of rows to a result.
+    :param reduce: Function folding two results into one.
+        Default: None => The mapped batches of every range are returned, in key order.
+    :param initial: The starting value of every fold.
+    :param partitions: The number of key ranges.
+        Default: None => 4 per worker, so a slow range does not hold the scan up.
+    :type partitions: int
+    :param max_workers: The number of worker processes.
+        Default: None => The number of CPUs.
+    :type max_workers: int
+    :param batch_size: The number of rows fetched and mapped at a time.
+    :type batch_size: int
+    :param split: 'minmax' or 'quantile'. See :code:`partition_key_ranges()`.
+    :type split: str
+    :param key_ranges: Explicit key ranges to scan, instead of splitting the table.
+    :param mp_context: The multiprocessing context to start workers with (e.g. `multiprocessing.get_context('spawn')`).
+    :return: The folded result, or (without `reduce`) the list of mapped batches.
+    """
+    workers = max_workers if max_workers is not None else multiprocessing.cpu_count()
+    with context.span('repository.parallel_scan', model=model.__name__, operation='parallel_scan'):
+        if key_ranges is None:
+            with context.engine.connect() as connection:
+                key_ranges = partition_key_ranges(connection, model,
+                                                  partitions=partitions if partitions is not None else workers * 4,
+                                                  split=split)
+        if not key_ranges:
+            return [] if reduce is None else initial
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(key_ranges)), mp_context=mp_context,
+                                 initializer=_initialize_worker, initargs=(context.settings,)) as pool:
+            futures = [pool.submit(_scan_range, model, key_range, batch_size, map_batch, reduce, initial)
+                       for key_range in key_ranges]
+            results = [future.result() for future in futures]
+
+    if reduce is None:
+        return [batch for result in results for batch in result]
+    accumulator = initial
+    for result in results:
+        accumulator = reduce(accumulator, result)
+    return accumulator
@@ -0,0 +1,293 @@
+# System Imports
+import contextvars
+import heapq
+import zlib
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Union
+
+# Third-Party Imports
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.query import Query
+from sqlalchemy.orm.session import Session
+
+# Local Source Imports
+from alchemist_stack.context import Context, BULK_PROFILE, DEFAULT_PROFILE, READ_ONLY_PROFILE
+from . import RepositoryBase
+from .models import Base
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+class ShardStrategy(ABC):
+    """ Shard Strategy Abstract Base Class for mapping shard keys to shard indexes """
+
+    @abstractmethod
+    def shard_for(self, key: Any, shard_count: int) -> int:
+        """ Gets the index of the shard holding `key`.
+
+        :param key: The shard key.
+        :param shard_count: The number of shards.
+        :type shard_count: int
+        :return: Shard index, in [0, shard_count).
+        :rtype: int
+        """
+        raise NotImplementedError
+
+class HashShardStrategy(ShardStrategy):
+    """ Spreads keys evenly over the shards by a stable (CRC32) hash of their string form. """
+
+    def shard_for(self, key: Any, shard_count: int) -> int:
+        return zlib.crc32(str(key).encode('utf-8')) % shard_count
+
+class RangeShardStrategy(ShardStrategy):
+    """ Assigns contiguous key ranges to shards.
+
+        `boundaries` holds the lowest key of every shard but the first, so shard 0 holds keys below `boundaries[0]`,
+        shard 1 holds keys in [boundaries[0], boundaries[1]), and so on.
+
+    Usage:
+        >>> strategy = RangeShardStrategy(boundaries=[1000000, 2000000])  # 3 shards
+    """
+
+    def __init__(self, boundaries: Sequence[Any]):
+        self.__boundaries = sorted(boundaries)
+
+    @property
+    def boundaries(self) -> List[Any]:
+        return list(self.__boundaries)
+
+    def shard_for(self, key: Any, shard_count: int) -> int:
+        if len(self.__boundaries) != shard_count - 1:
+            raise ValueError('{count} range boundaries cannot split {shards} shards'
+                             .format(count=len(self.__boundaries), shards=shard_count))
+        return bisect_right(self.__boundaries, key)
+
+class LookupShardStrategy(ShardStrategy):
+    """ Assigns keys to shards through an explicit lookup table (e.g. tenant => shard). Keys missing from the table go
+        to `default`, or raise an UnknownShardKeyException if there is no default.
+    """
+
+    def __init__(self, table: Dict[Any, int], default: int = None):
+        self.__table = dict(table)
+        self.__default = default
+
+    @property
+    def table(self) -> Dict[Any, int]:
+        return self.__table
+
+    def assign(self, key: Any, shard: int):
+        """ Adds (or moves) `key` to `shard`. """
+        self.__table[key] = shard
+
+    def shard_for(self, key: Any, shard_count: int) -> int:
+        shard = self.__table.get(key, self.__default)
+        if shard is None:
+            __errors = {
+                'key': key,
+                'shards': shard_count,
+            }
+            raise UnknownShardKeyException(
+                message='The shard key {key} is not in the lookup table, and there is no default shard.'
+                    .format(key=key),
+                errors=__errors,
+                key=key
+            )
+        return shard
+
+class ShardedRepositoryBase(RepositoryBase, ABC):
+    """ Sharded Repository Base Abstract Base Class for implementing model repositories spread over several
+            :code:`Contexts <Context>`.
+
+        Operations with a shard key are routed to the one Context the :code:`ShardStrategy <ShardStrategy>` maps the key
+        to. Queries without a shard key fan out to every shard in parallel and their results are merged; bulk creates
+        are partitioned per shard and committed concurrently.
+
+        The first Context is also handed to :code:`RepositoryBase <RepositoryBase>`, so the unsharded helpers keep
+        working against shard 0.
+    """
+
+    def __init__(self, contexts: Sequence[Context], strategy: ShardStrategy, *args,
+                 shard_attribute: str = None, **kwargs):
+        """ Sharded Repository Base Constructor
+
+        :param contexts: The Database :code:`Contexts <Context>`, one per shard, in shard index order.
+        :type contexts: Sequence[Context]
+        :param strategy: The strategy used to map shard keys to shards.
+        :type strategy: ShardStrategy
+        :param shard_attribute: The model attribute holding the shard key, used to route created objects.
+        :type shard_attribute: str
+        """
+        if not contexts:
+            raise ValueError('A sharded repository needs at least one Context')
+        super().__init__(contexts[0], *args, **kwargs)
+        self.__contexts = tuple(contexts)
+        self.__strategy = strategy
+        self.__shard_attribute = shard_attribute
+
+    @property
+    def contexts(self) -> Sequence[Context]:
+        return self.__contexts
+
+    @property
+    def strategy(self) -> ShardStrategy:
+        return self.__strategy
+
+    @property
+    def shard_attribute(self) -> Union[str, None]:
+        return self.__shard_attribute
+
+    def shard_index(self, key: Any) -> int:
+        """ Gets the index of the shard holding `key`.
+
+        :rtype: int
+        """
+        return self.__strategy.shard_for(key, len(self.__contexts))
+
+    def shard_for(self, key: Any) -> Context:
+        """ Gets the :code:`Context <Context>` of the shard holding `key`.
+
+        :rtype: Context
+        """
+        return self.__contexts[self.shard_index(key)]
+
+    def shard_key_of(self, obj: Base) -> Any:
+        """ Gets the shard key of `obj` from its :code:`shard_attribute <shard_attribute>`. """
+        if self.__shard_attribute is None:
+            raise ValueError('{repo} has no shard_attribute; pass a shard key explicitly'.format(repo=str(self)))
+        return getattr(obj, self.__shard_attribute)
+
+    @contextmanager
+    def shard_scope(self, key: Any, profile: str = DEFAULT_PROFILE):
+        """ Transactional scope on the shard holding `key`. The Session is committed on success, rolled back and
+                re-raised on failure, and always closed.
+
+        :param key: The shard key.
+        :param profile: The name of the :code:`Context <Context>` Session profile to open the Session with.
+        :type profile: str
+        """
+        __context = self.shard_for(key)
+        __session = __context.open_session(profile=profile, owner=self)
+        try:
+            yield __session
+            __session.commit()
+        except SQLAlchemyError:
+            __session.rollback()
+            raise
+        finally:
+            __context.close_session(__session)
+
+    def _create_sharded_object(self, obj: Base, shard_key: Any = None, profile: str = DEFAULT_PROFILE):
+        """ CREATE (Crud) operation on the shard holding `obj`.
+
+        :param obj: The entity model to be created (inserted). This entity model must inherit from `Base`.
+        :type obj: Base
+        :param shard_key: The shard key of `obj`.
+            Default: None => Read from :code:`shard_attribute <shard_attribute>`.
+        :param profile: The name of the :code:`Context <Context>` Session profile to open the Session with.
+        :type profile: str
+        """
+        __key = self.shard_key_of(obj) if shard_key is None else shard_key
+        with self.shard_scope(__key, profile=profile) as s:
+            s.add(obj)
+
+    def _bulk_create_objects(self, objs: Iterable[Base], shard_key: Callable[[Base], Any] = None,
+                             profile: str = BULK_PROFILE) -> Dict[int, int]:
+        """ Bulk CREATE (Crud) operation. `objs` are partitioned per shard, and every shard's partition is inserted
+                and committed concurrently, in one transaction per shard.
+
+        :param objs: The entity models to be created (inserted).
+        :type objs: Iterable[Base]
+        :param shard_key: Function returning the shard key of an object.
+            Default: None => Read from :code:`shard_attribute <shard_attribute>`.
+        :param profile: The name of the :code:`Context <Context>` Session profile to open the Sessions with.
+        :type profile: str
+        :raises: SQLAlchemyError
+        :return: Dictionary of shard index to the number of objects inserted on that shard.
+        :rtype: Dict[int, int]
+        """
+        __key = self.shard_key_of if shard_key is None else shard_key
+        partitions: Dict[int, List[Base]] = {}
+        for obj in objs:
+            partitions.setdefault(self.shard_index(__key(obj)), []).append(obj)
+
+        def insert(index: int) -> int:
+            context = self.__contexts[index]
+            session = context.open_session(profile=profile, owner=self)
+            try:
+                session.bulk_save_objects(partitions[index])
+                session.commit()
+            except SQLAlchemyError:
+                session.rollback()
+                raise
+            finally:
+                context.close_session(session)
+            return len(partitions[index])
+
+        indexes = sorted(partitions.keys())
+        with ThreadPoolExecutor(max_workers=max(len(indexes), 1)) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, insert, index) for index in indexes]
+            return dict(zip(indexes, [future.result() for future in futures]))
+
+    def _read_all_shards(self, query: Query, order_by: Sequence[Any] = (), descending: bool = False,
+                         limit: int = None, profile: str = READ_ONLY_PROFILE) -> List[Any]:
+        """ READ (cRud) operation across every shard.
+
+            `query` (e.g. from :code:`_read_object()`) is run on every shard in parallel. With `order_by`, every shard
+            sorts its own rows and the sorted streams are merged; with `limit`, every shard returns at most `limit`
+            rows, and the merged result is cut to `limit`.
+
+        :param query: The unbound SQL Alchemy Query to run on every shard.
+        :type query: Query
+        :param order_by: Mapped attributes (e.g. `Model.timestamp`) to order the results by.
+        :param descending: Whether to order the results in descending order.
+        :type descending: bool
+        :param limit: The maximum number of rows to return.
+        :type limit: int
+        :param profile: The name of the :code:`Context <Context>` Session profile to open the Sessions with.
+        :type profile: str
+        :return: The merged rows.
+        :rtype: list
+        """
+        __query = query
+        if order_by:
+            __query = __query.order_by(*[attr.desc() if descending else attr for attr in order_by])
+        if limit is not None:
+            __query = __query.limit(limit)
+
+        def fetch(context: Context) -> List[Any]:
+            session: Session = context.open_session(profile=profile, owner=self)
+            try:
+                return __query.with_session(session).all()
+            finally:
+                context.close_session(session)
+
+        # Every shard runs in a copy of the caller's context, so its deadline, span and loader scope apply there too.
+        with ThreadPoolExecutor(max_workers=len(self.__contexts)) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, fetch, context) for context in self.__contexts]
+            results = [future.result() for future in futures]
+
+        if order_by:
+            keys = [attr.key for attr in order_by]
+            merged = heapq.merge(*results, key=lambda row: tuple(getattr(row, k) for k in keys), reverse=descending)
+        else:
+            merged = (row for rows in results for row in rows)
+        return list(islice(merged, limit))
+
+class UnknownShardKeyException(Exception):
+    """ Exception for Sharded Repositories: Unknown Shard Key """
+
+    def __init__(self, message: str, errors: dict, key: Any, *args):
+        super().__init__(message, *args)
+        self.__errors = errors
+        self.__key = key
+
+    @property
+    def errors(self) -> dict:
+        return self.__errors
+
+    @property
+    def key(self) -> Any:
+        return self.__key
@@ -0,0 +1,169 @@
+# System Imports
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import Future, TimeoutError
+from typing import Any, Callable, Dict, Hashable, Tuple, Union
+
+# Third-Party Imports
+
+# Local Source Imports
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+def statement_key(statement: Any, dialect: Any = None) -> Union[Tuple[str, tuple], None]:
+    """ Gets a hashable key for a statement: its compiled SQL and parameters, or None if a parameter is not hashable.
+
+    :param statement: The SQL Alchemy statement.
+    :param dialect: The Dialect to compile it with. Default: None => The default dialect.
+    :rtype: tuple
+    """
+    compiled = statement.compile(dialect=dialect)
+    key = (str(compiled), tuple(sorted(compiled.params.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+class SingleFlight(object):
+    """ Deduplicates identical concurrent calls: while a call for a key is in flight, other calls for the same key, from
+            any thread or asyncio task, wait for it and share its result (or exception) instead of running again.
+
+        A caller waiting longer than its timeout gives up with a
+        :code:`SingleFlightTimeoutException <SingleFlightTimeoutException>`; the call itself runs on, for the others.
+        Nothing is cached: once a call returns, the next one for its key runs again.
+
+    Usage:
+        >>> flights = SingleFlight(timeout=5, on_coalesced=lambda key: metrics.increment('db.coalesced'))
+        >>> repo = FlagRepository.instance(context=db, single_flight=flights)
+        >>> rows = flights.do(('flags', tenant), lambda: load_flags(tenant))
+    """
+
+    def __init__(self, timeout: float = None, on_coalesced: Callable[[Hashable], Any] = None):
+        """ Single Flight Constructor
+
+        :param timeout: How many seconds a caller waits for another's call, by default.
+            Default: None => As long as it takes.
+        :type timeout: float
+        :param on_coalesced: Called with the key of every call that waits for another instead of running.
+        """
+        self.__timeout = timeout
+        self.__on_coalesced = on_coalesced
+        self.__calls: Dict[Hashable, Future] = {}
+        self.__lock = threading.Lock()
+        self.__executed = 0
+        self.__coalesced = 0
+        self.__timed_out = 0
+
+    def __len__(self) -> int:
+        """ Gets how many calls are in flight. """
+        return len(self.__calls)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """ Gets how many calls ran, how many shared another's result, and how many gave up waiting.
+
+        :rtype: dict
+        """
+        return {'executed': self.__executed, 'coalesced': self.__coalesced, 'timed_out': self.__timed_out}
+
+    def do(self, key: Hashable, call: Callable[[], Any], timeout: float = None) -> Any:
+        """ Gets the result of `call()`, or of the call already in flight for `key`.
+
+        :param key: What makes two calls identical. Default: None => The call is never shared.
+        :param call: The call.
+        :param timeout: How many seconds to wait for another caller's call.
+            Default: None => The SingleFlight's timeout.
+        :type timeout: float
+        :raises: SingleFlightTimeoutException
+        """
+        if key is None:
+            return call()
+        (future, leader) = self.__join(key)
+        if leader:
+            self.__run(key, future, call)
+            return future.result()
+        try:
+            return future.result(timeout=self.__timeout if timeout is None else timeout)
+        except TimeoutError:
+            self.__throw_timeout_exception(key, self.__timeout if timeout is None else timeout)
+
+    async def do_async(self, key: Hashable, call: Callable[[], Any], timeout: float = None) -> Any:
+        """ :code:`do()` for asyncio code: `call()` runs in the event loop's default executor (with the caller's
+                context variables), and the shared result is awaited, for up to `timeout` seconds.
+
+        :raises: SingleFlightTimeoutException
+        """
+        loop = asyncio.get_running_loop()
+        if key is None:
+            return await loop.run_in_executor(None, contextvars.copy_context().run, call)
+        (future, leader) = self.__join(key)
+        if leader:
+            loop.run_in_executor(None, contextvars.copy_context().run, self.__run, key, future, call)
+        __timeout = self.__timeout if timeout is None else timeout
+        try:
+            # Shielded, so a caller giving up does not cancel the call the others wait for.
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=__timeout)
+        except asyncio.TimeoutError:
+            self.__throw_timeout_exception(key, __timeout)
+
+    def __join(self, key: Hashable) -> Tuple[Future, bool]:
+        """ Gets the Future of the call in flight for `key`, and whether the caller must run it. """
+        with self.__lock:
+            future = self.__calls.get(key)
+            if future is None:
+                future = self.__calls[key] = Future()
+                self.__executed += 1
+                return (future, True)
+            self.__coalesced += 1
+        if self.__on_coalesced is not None:
+            self.__on_coalesced(key)
+        return (future, False)
+
+    def __run(self, key: Hashable, future: Future, call: Callable[[], Any]):
+        try:
+            result = call()
+        except BaseException as error:
+            self.__land(key, future)
+            future.set_exception(error)
+        else:
+            self.__land(key, future)
+            future.set_result(result)
+
+    def __land(self, key: Hashable, future: Future):
+        """ Removes the call from flight, so calls arriving from now on run again. """
+        with self.__lock:
+            if self.__calls.get(key) is future:
+                del self.__calls[key]
+
+    def __throw_timeout_exception(self, key: Hashable, timeout: float):
+        """ Raise a :code:`SingleFlightTimeoutException <SingleFlightTimeoutException>` """
+        with self.__lock:
+            self.__timed_out += 1
+        __errors = {
+            'key': key,
+            'timeout': timeout,
+        }
+        raise SingleFlightTimeoutException(
+            message='Gave up after {timeout}s waiting for the call in flight for {key!r}.'.format(timeout=timeout,
+                                                                                                   key=key),
+            errors=__errors,
+            key=key
+        )
+
+class SingleFlightTimeoutException(Exception):
+    """ A caller gave up waiting for the identical call in flight. """
+
+    def __init__(self, message: str, errors: dict, key: Hashable, *args):
+        super().__init__(message, *args)
+        self.__errors = errors
+        self.__key = key
+
+    @property
+    def errors(self) -> dict:
+        return self.__errors
+
+    @property
+    def key(self) -> Hashable:
+        return self.__key
@@ -0,0 +1,172 @@
+# System Imports
+import copy
+import datetime
+import decimal
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterable, List, Tuple, Type
+
+# Third-Party Imports
+from sqlalchemy import and_, bindparam
+from sqlalchemy.orm.session import Session
+
+# Local Source Imports
+from alchemist_stack.utils import dict_diff
+from .models import Base
+from .models.registry import model_metadata
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+""" Prefixes for UPDATE bind parameters, which may not share a name with the columns being updated. """
+_PK_PARAM = '_pk_'
+_VALUE_PARAM = '_v_'
+
+""" Column value types that cannot change in place, so a snapshot can keep the value itself instead of a copy. """
+_IMMUTABLE_TYPES = (type(None), bool, int, float, complex, str, bytes, decimal.Decimal, datetime.date,
+                    datetime.time, datetime.timedelta, uuid.UUID, frozenset)
+
+class ChangeTracker(object):
+    """ Change Tracker for domain models.
+
+        Domain models (objects with a :code:`to_orm()` method, or `Base` instances themselves) are snapshotted when
+        they are tracked, usually right after they are loaded. Mutable values (e.g. the lists and dictionaries of JSON
+        columns) are deep-copied into the snapshot, so changes made to them in place are detected. On save, each
+        object's column values are compared against its snapshot, without building ORM instances, and only the
+        columns that actually changed are written. Objects of the same model with the same set of changed
+        columns share one UPDATE statement, executed once with every object's parameters (executemany).
+
+    Usage:
+        >>> tracker = ChangeTracker()
+        >>> test = tracker.track(repo.get_test_by_id(test_id=1))
+        >>> test.timestamp = datetime.now(timezone.utc)
+        >>> with repo.session_scope() as session:
+        ...     tracker.save(session)
+        >>> tracker.mark_saved()
+    """
+
+    def __init__(self):
+        self.__snapshots: Dict[int, Tuple[Any, Type[Base], dict]] = OrderedDict()
+        self.__unconfirmed: List[Any] = []
+
+    def __len__(self) -> int:
+        return len(self.__snapshots)
+
+    def __contains__(self, obj: Any) -> bool:
+        return id(obj) in self.__snapshots
+
+    def track(self, obj: Any) -> Any:
+        """ Snapshots the current column values of `obj`.
+
+        :param obj: The domain model (or `Base` instance) to track.
+        :return: `obj`, so loads can be wrapped in place.
+        """
+        model = self.__model(obj)
+        values = self.__column_values(obj, model)
+        self.__snapshots[id(obj)] = (obj, model, {key: _snapshot(value) for (key, value) in values.items()})
+        return obj
+
+    def track_all(self, objs: Iterable[Any]) -> List[Any]:
+        """ Snapshots every object in `objs`.
+
+        :return: List of the tracked objects.
+        """
+        return [self.track(obj) for obj in objs]
+
+    def forget(self, obj: Any):
+        """ Stops tracking `obj`. """
+        self.__snapshots.pop(id(obj), None)
+
+    def clear(self):
+        """ Stops tracking every object. """
+        self.__snapshots.clear()
+
+    def changes(self, obj: Any) -> dict:
+        """ Gets the columns of `obj` that changed since it was tracked.
+
+        :param obj: A tracked domain model.
+        :return: Dictionary of attribute name to new value. Empty if nothing changed.
+        :rtype: dict
+        """
+        (_, model, snapshot) = self.__snapshots[id(obj)]
+        return dict_diff(snapshot, self.__column_values(obj, model), identity=False)
+
+    def pending(self) -> Dict[Tuple[Type[Base], FrozenSet[str]], List[Any]]:
+        """ Groups the changed tracked objects by model and changed column set.
+
+        :return: Dictionary of (model, changed attribute names) to the objects sharing them.
+        """
+        return OrderedDict((key, [obj for (obj, _, _) in group]) for (key, group) in self.__pending().items())
+
+    def save(self, session: Session) -> int:
+        """ Issues the minimal UPDATE statements for every changed tracked object on `session`.
+            The caller is responsible for committing `session`, then calling :code:`mark_saved()` so the saved objects
+            are re-snapshotted. If the transaction is rolled back instead, the objects keep their old snapshots and
+            will be saved again on the next call.
+
+        :param session: The SQL Alchemy Session to execute the UPDATE statements on.
+        :type session: Session
+        :return: Number of rows updated.
+        :rtype: int
+        """
+        rowcount = 0
+        saved = []
+        for ((model, keys), group) in self.__pending().items():
+            metadata = model_metadata(model)
+            primary_keys = metadata.primary_keys
+            keys = sorted(keys)
+
+            statement = metadata.table.update()\
+                .where(and_(*[column == bindparam(_PK_PARAM + key) for (key, column) in primary_keys]))\
+                .values({metadata.columns[key]: bindparam(_VALUE_PARAM + key) for key in keys})
+
+            parameters = []
+            for (obj, snapshot, current) in group:
+                params = {_PK_PARAM + key: snapshot.get(key) for (key, _) in primary_keys}
+                params.update({_VALUE_PARAM + key: current.get(key) for key in keys})
+                parameters.append(params)
+
+            result = session.execute(statement, parameters)
+            rowcount += result.rowcount if result.rowcount > 0 else 0
+            saved.extend(obj for (obj, _, _) in group)
+
+        self.__unconfirmed = saved
+        return rowcount
+
+    def mark_saved(self):
+        """ Re-snapshots the objects written by the last :code:`save()`, once its transaction has committed. """
+        for obj in self.__unconfirmed:
+            if id(obj) in self.__snapshots:
+                self.track(obj)
+        self.__unconfirmed = []
+
+    def __pending(self) -> Dict[Tuple[Type[Base], FrozenSet[str]], List[Tuple[Any, dict, dict]]]:
+        """ Groups the changed tracked objects by model and changed column set, keeping each object's snapshot and
+            current column values so they are only computed once per save.
+        """
+        groups = OrderedDict()
+        for (obj, model, snapshot) in self.__snapshots.values():
+            current = self.__column_values(obj, model)
+            diff = dict_diff(snapshot, current, identity=False)
+            if diff:
+                groups.setdefault((model, frozenset(diff.keys())), []).append((obj, snapshot, current))
+        return groups
+
+    @staticmethod
+    def __model(obj: Any) -> Type[Base]:
+        """ Gets the `Base` model of a tracked object. """
+        if isinstance(obj, Base):
+            return type(obj)
+        model = getattr(obj, '__table_model__', None)
+        return model if model is not None else type(obj.to_orm())
+
+    @staticmethod
+    def __column_values(obj: Any, model: Type[Base]) -> dict:
+        """ Gets the column attribute values of a tracked object, keyed by attribute name. `Base` instances and
+                :code:`DomainModel <DomainModel>`s are read directly; other domain models go through :code:`to_orm()`.
+        """
+        source = obj if isinstance(obj, Base) or getattr(obj, '__table_model__', None) is model else obj.to_orm()
+        return {key: getattr(source, key) for key in model_metadata(model).columns}
+
+def _snapshot(value: Any) -> Any:
+    """ Gets a copy of `value` that changes to `value` made in place do not reach. """
+    return value if isinstance(value, _IMMUTABLE_TYPES) else copy.deepcopy(value)
@@ -0,0 +1,313 @@
+# System Imports
+import json
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, Union
+
+# Third-Party Imports
+from sqlalchemy import event
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.orm.mapper import Mapper
+
+# Local Source Imports
+from .explain import SlowQuery, SlowQueryLog, fingerprint
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+class Span(object):
+    """ A timed unit of work (a repository operation, a Session, ...) and the database work done inside it.
+
+        Statement count, rows affected, and execution time are recorded by :code:`instrument_engine()`, rows loaded as
+        ORM objects by a mapper `load` listener, and pool wait time by the :code:`Context <Context>` when a Session's
+        connection is checked out. A finished Span adds its figures to its parent, so an outer span always covers the
+        work of its children.
+    """
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent', 'attributes', 'start', 'duration', 'statements', 'rows',
+                 'pool_wait', 'execute_time', 'error', '_started', '_token')
+
+    def __init__(self, name: str, parent: 'Span' = None, attributes: Dict[str, Any] = None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else '{:032x}'.format(random.getrandbits(128))
+        self.span_id = '{:016x}'.format(random.getrandbits(64))
+        self.attributes = attributes if attributes is not None else {}
+        self.start = time.time()
+        self.duration = None
+        self.statements = 0
+        self.rows = 0
+        self.pool_wait = 0.0
+        self.execute_time = 0.0
+        self.error = None
+        self._started = time.perf_counter()
+        self._token = None
+
+    def __repr__(self) -> str:
+        """ A String representation of the :class:`Span <Span>`.
+
+        :returns: String representation of :class:`Span <Span>` object.
+        :rtype: str
+        """
+        return '<class Span(name={name}, span_id={span_id}) at {hex_id}>'.format(name=self.name,
+                                                                                 span_id=self.span_id,
+                                                                                 hex_id=hex(id(self)))
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def finish(self):
+        """ Stops the Span's clock, and rolls its database figures up into its parent. """
+        self.duration = time.perf_counter() - self._started
+        if self.parent is not None:
+            self.parent.statements += self.statements
+            self.parent.rows += self.rows
+            self.parent.pool_wait += self.pool_wait
+            self.parent.execute_time += self.execute_time
+
+    def to_dict(self) -> Dict[str, Any]:
+        """ Gets a JSON-serializable representation of the Span.
+
+        :rtype: dict
+        """
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent.span_id if self.parent is not None else None,
+            'start': self.start,
+            'duration': self.duration,
+            'attributes': self.attributes,
+            'statements': self.statements,
+            'rows': self.rows,
+            'pool_wait': self.pool_wait,
+            'execute_time': self.execute_time,
+            'error': self.error,
+        }
+
+""" The Span active in the current thread, asyncio task, or greenlet. `_UNSAMPLED` marks a trace that was not sampled,
+        so its children are not sampled either.
+"""
+_UNSAMPLED = object()
+_current_span: ContextVar = ContextVar('alchemist_stack_current_span', default=None)
+
+def current_span() -> Union[Span, None]:
+    """ Gets the Span active in the current execution context, if it is being recorded.
+
+    :rtype: Span
+    """
+    span = _current_span.get()
+    return span if span is not _UNSAMPLED else None
+
+class SpanExporter(ABC):
+    """ Span Exporter Abstract Base Class for shipping finished spans """
+
+    @abstractmethod
+    def export(self, span: Span):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class InMemoryExporter(SpanExporter):
+    """ Keeps the last `capacity` finished spans in a ring buffer. """
+
+    def __init__(self, capacity: int = 1024):
+        self.__spans: deque = deque(maxlen=capacity)
+
+    def __len__(self) -> int:
+        return len(self.__spans)
+
+    @property
+    def spans(self) -> List[Span]:
+        return list(self.__spans)
+
+    def export(self, span: Span):
+        self.__spans.append(span)
+
+    def clear(self):
+        self.__spans.clear()
+
+class JsonLinesExporter(SpanExporter):
+    """ Appends every finished span to `path`, one JSON object per line. """
+
+    def __init__(self, path: str):
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.__file = open(path, 'a', encoding='utf-8')
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self.__lock:
+            self.__file.write(line + os.linesep)
+            self.__file.flush()
+
+    def close(self):
+        with self.__lock:
+            self.__file.close()
+
+class OpenTelemetryExporter(SpanExporter):
+    """ Replays finished spans through an OpenTelemetry tracer. Requires the optional `opentelemetry-api` package. """
+
+    def __init__(self, tracer_name: str = 'alchemist_stack'):
+        try:
+            from opentelemetry import trace
+        except ImportError as error:
+            raise ImportError('OpenTelemetryExporter requires the opentelemetry-api package') from error
+        self.__tracer = trace.get_tracer(tracer_name)
+
+    def export(self, span: Span):
+        attributes = {key: value if isinstance(value, (bool, int, float, str)) else str(value)
+                      for (key, value) in span.attributes.items()}
+        attributes.update({
+            'db.statements': span.statements,
+            'db.rows': span.rows,
+            'db.pool_wait': span.pool_wait,
+            'db.execute_time': span.execute_time,
+        })
+        start = int(span.start * 1e9)
+        otel_span = self.__tracer.start_span(span.name, start_time=start, attributes=attributes)
+        otel_span.end(end_time=start + int((span.duration or 0.0) * 1e9))
+
+class _SpanScope(object):
+    """ Context manager that activates a Span in the current execution context, and exports it on exit. """
+
+    __slots__ = ('_tracer', '_span')
+
+    def __init__(self, tracer: 'Tracer', span: Span):
+        self._tracer = tracer
+        self._span = span
+
+    def __enter__(self) -> Span:
+        self._span._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        span = self._span
+        if exc_type is not None:
+            span.error = '{name}: {error}'.format(name=exc_type.__name__, error=exc_val)
+        span.finish()
+        _current_span.reset(span._token)
+        self._tracer.exporter.export(span)
+
+class _UnsampledScope(object):
+    """ Context manager that marks the current trace as not sampled. """
+
+    __slots__ = ('_token',)
+
+    def __enter__(self):
+        self._token = _current_span.set(_UNSAMPLED)
+        return None
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _current_span.reset(self._token)
+
+class _NoOpScope(object):
+    """ Context manager that does nothing. Shared, since it holds no state. """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+_NOOP = _NoOpScope()
+
+class Tracer(object):
+    """ Tracer for repository operations and Sessions.
+
+        New traces are sampled with probability `sample_rate`; spans started inside a sampled span are always recorded,
+        and spans started inside an unsampled trace never are. With a sample rate of 0, starting a span costs one
+        context variable lookup.
+
+    Usage:
+        >>> tracer = Tracer(exporter=InMemoryExporter(), sample_rate=0.01)
+        >>> db = Context(settings={...}, tracer=tracer)
+        >>> with tracer.span('checkout', cart=cart_id):
+        ...     repo.create_order(obj=order)
+    """
+
+    def __init__(self, exporter: SpanExporter = None, sample_rate: float = 1.0):
+        """ Tracer Constructor
+
+        :param exporter: Where finished spans are sent.
+            Default: None => An :code:`InMemoryExporter <InMemoryExporter>`.
+        :type exporter: SpanExporter
+        :param sample_rate: The fraction of new traces to record, in [0, 1].
+        :type sample_rate: float
+        """
+        self.__exporter = exporter if exporter is not None else InMemoryExporter()
+        self.__sample_rate = sample_rate
+
+    @property
+    def exporter(self) -> SpanExporter:
+        return self.__exporter
+
+    @property
+    def sample_rate(self) -> float:
+        return self.__sample_rate
+
+    @sample_rate.setter
+    def sample_rate(self, value: float):
+        self.__sample_rate = value
+
+    def span(self, name: str, **attributes):
+        """ Starts a Span named `name`, as a child of the current span.
+
+        :param name: The span name (e.g. 'repository.create').
+        :type name: str
+        :param attributes: Span attributes (e.g. repository, model, operation).
+        :return: A context manager yielding the Span, or None if it is not being recorded.
+        """
+        parent = _current_span.get()
+        if parent is None:
+            if self.__sample_rate <= 0.0:
+                return _NOOP
+            if self.__sample_rate < 1.0 and random.random() >= self.__sample_rate:
+                return _UnsampledScope()
+        elif parent is _UNSAMPLED:
+            return _NOOP
+        return _SpanScope(self, Span(name, parent=parent, attributes=attributes))
+
+def instrument_engine(engine: Engine):
+    """ Records statement count, rows affected, and execution time of every statement executed on `engine` into the
+            current Span. Statements executed outside of a recorded Span cost one context variable lookup.
+
+    :param engine: The Engine to instrument.
+    :type engine: Engine
+    """
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if current_span() is not None:
+            conn.info.setdefault('alchemist_trace_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = current_span()
+        if span is None:
+            return
+        starts = conn.info.get('alchemist_trace_start')
+        if starts:
+            span.execute_time += time.perf_counter() - starts.pop()
+        span.statements += 1
+        # Rows returned by a query are counted as the mapper loads them; some drivers (e.g. psycopg2) also report them
+        # in `rowcount`, so the cursor's figure is only taken for statements that return no rows.
+        if cursor.description is None and cursor.rowcount is not None and cursor.rowcount > 0:
+            span.rows += cursor.rowcount
+
+@event.listens_for(Mapper, 'load')
+def _count_loaded_row(target, context):
+    """ Counts every ORM object loaded inside a recorded Span as a row. """
+    span = current_span()
+    if span is not None:
+        span.rows += 1
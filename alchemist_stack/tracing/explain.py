@@ -0,0 +1,296 @@
+# System Imports
+import hashlib
+import json
+import logging
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Union
+
+# Third-Party Imports
+from sqlalchemy import event
+from sqlalchemy.engine.base import Engine
+
+# Local Source Imports
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+logger = logging.getLogger('Alchemist Stack')
+
+""" Key of the running statement's start time kept in `Connection.info`. """
+_STARTED = 'alchemist_slow_query_start'
+
+""" The EXPLAIN prefix of each dialect; other dialects get a plain `EXPLAIN`. """
+_EXPLAIN = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN (FORMAT JSON) ',
+    'mysql': 'EXPLAIN FORMAT=JSON ',
+}
+
+""" Statements whose plan can be explained without running them. """
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b', re.IGNORECASE)
+
+""" Fingerprinting: literals and placeholders become `?`, and lists of them collapse, so a statement's fingerprint is
+    the same whatever its values (and however many of them an `IN (...)` holds).
+"""
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s|:\w+|\$\d+|\?')
+_LIST = re.compile(r'\?(?:\s*,\s*\?)+')
+_SPACE = re.compile(r'\s+')
+
+def fingerprint(statement: str) -> str:
+    """ Gets the fingerprint of a SQL statement: a digest of its text with every value replaced by a placeholder.
+
+    Usage:
+        >>> a = fingerprint('SELECT * FROM record WHERE id IN (1, 2, 3)')
+        >>> a == fingerprint('SELECT * FROM record WHERE id IN (?)')
+        True
+
+    :param statement: The SQL statement.
+    :type statement: str
+    :rtype: str
+    """
+    normalized = _STRING.sub('?', statement)
+    normalized = _NUMBER.sub('?', normalized)
+    normalized = _PLACEHOLDER.sub('?', normalized)
+    normalized = _LIST.sub('?', normalized)
+    normalized = _SPACE.sub(' ', normalized).strip().lower()
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+def parameters_shape(parameters: Any, executemany: bool = False) -> Any:
+    """ Gets the shape of a statement's parameters, their type names, without their values (which may be sensitive).
+
+    :rtype: Any
+    """
+    if executemany:
+        parameters = list(parameters)
+        return {'executemany': len(parameters), 'shape': parameters_shape(parameters[0]) if parameters else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for (key, value) in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return None if parameters is None else type(parameters).__name__
+
+class SlowQuery(object):
+    """ A slow statement and the plan captured for it. """
+
+    __slots__ = ('fingerprint', 'statement', 'parameters', 'duration', 'captured_at', 'dialect', 'plan', 'error')
+
+    def __init__(self, fingerprint: str, statement: str, parameters: Any, duration: float, dialect: str):
+        self.fingerprint = fingerprint
+        self.statement = statement
+        self.parameters = parameters
+        self.duration = duration
+        self.captured_at = time.time()
+        self.dialect = dialect
+        self.plan: Union[List[List[Any]], None] = None
+        self.error: Union[str, None] = None
+
+    def __repr__(self) -> str:
+        return '<SlowQuery {fingerprint} {duration:.3f}s>'.format(fingerprint=self.fingerprint, duration=self.duration)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'fingerprint': self.fingerprint,
+            'statement': self.statement,
+            'parameters': self.parameters,
+            'duration': self.duration,
+            'captured_at': self.captured_at,
+            'dialect': self.dialect,
+            'plan': self.plan,
+            'error': self.error,
+        }
+
+class SlowQueryLog(object):
+    """ Captures the query plan of statements slower than `threshold` seconds.
+
+        Statements are only timed on the hot path; a slow one is queued (or dropped, when `max_pending` are already
+        waiting), and a background thread runs the dialect's `EXPLAIN` (`EXPLAIN QUERY PLAN` on SQLite) of it on a
+        connection of its own, with the statement's first set of parameters. Each fingerprint is explained at most once
+        every `interval` seconds. The last `capacity` captures are kept, and :code:`dump()` writes them as JSON, so two
+        captures of the same fingerprint can be compared.
+
+    Usage:
+        >>> slow_queries = SlowQueryLog(threshold=0.2)
+        >>> db = Context(settings={...}, slow_query_log=slow_queries)
+        >>> ...
+        >>> slow_queries.dump('slow_queries.json')
+    """
+
+    def __init__(self, threshold: float = 0.5, capacity: int = 256, interval: float = 300.0, max_pending: int = 64):
+        """ Slow Query Log Constructor
+
+        :param threshold: How many seconds a statement may take before its plan is captured.
+        :type threshold: float
+        :param capacity: How many captures are kept.
+        :type capacity: int
+        :param interval: How many seconds pass before the same fingerprint is explained again.
+        :type interval: float
+        :param max_pending: How many slow statements may wait to be explained before new ones are dropped.
+        :type max_pending: int
+        """
+        self.__threshold = threshold
+        self.__interval = interval
+        self.__queries: deque = deque(maxlen=capacity)
+        self.__explained_at: OrderedDict = OrderedDict()
+        self.__max_fingerprints = capacity * 4
+        self.__pending: queue.Queue = queue.Queue(maxsize=max_pending)
+        self.__lock = threading.Lock()
+        self.__thread: Union[threading.Thread, None] = None
+        self.__closed = False
+        self.__dropped = 0
+
+    @property
+    def threshold(self) -> float:
+        return self.__threshold
+
+    @property
+    def queries(self) -> List[SlowQuery]:
+        """ Gets the captures, oldest first.
+
+        :rtype: List[SlowQuery]
+        """
+        with self.__lock:
+            return list(self.__queries)
+
+    @property
+    def dropped(self) -> int:
+        """ Gets how many slow statements were not explained because too many were already waiting.
+
+        :rtype: int
+        """
+        return self.__dropped
+
+    def history(self, fingerprint: str) -> List[SlowQuery]:
+        """ Gets the captures of one fingerprint, oldest first, e.g. to see how its plan changed.
+
+        :rtype: List[SlowQuery]
+        """
+        return [query for query in self.queries if query.fingerprint == fingerprint]
+
+    def watch(self, engine: Engine):
+        """ Times every statement executed on `engine`. Called by the :code:`Context <Context>` given this log. """
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info[_STARTED] = time.perf_counter()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info.pop(_STARTED, None)
+            if started is None:
+                return
+            duration = time.perf_counter() - started
+            if duration >= self.__threshold:
+                self.__offer(engine, statement, parameters, executemany, duration)
+
+    def drain(self, timeout: float = None) -> bool:
+        """ Waits until every queued statement is explained.
+
+        :param timeout: How many seconds to wait, at most. Default: None => As long as it takes.
+        :type timeout: float
+        :return: Whether nothing is left to explain.
+        :rtype: bool
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.__pending.all_tasks_done:
+            while self.__pending.unfinished_tasks:
+                left = None if deadline is None else deadline - time.monotonic()
+                if left is not None and left <= 0:
+                    return False
+                self.__pending.all_tasks_done.wait(timeout=left)
+        return True
+
+    def dump(self, path: str = None) -> str:
+        """ Gets the captures as a JSON array, and writes it to `path`, if given.
+
+        :param path: The file to write.
+        :type path: str
+        :rtype: str
+        """
+        dumped = json.dumps([query.to_dict() for query in self.queries], default=str, indent=2)
+        if path is not None:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(dumped)
+        return dumped
+
+    def clear(self):
+        with self.__lock:
+            self.__queries.clear()
+            self.__explained_at.clear()
+
+    def close(self):
+        """ Stops the background thread, once the queued statements are explained. """
+        with self.__lock:
+            self.__closed = True
+            thread = self.__thread
+        if thread is not None:
+            self.__pending.put(None)
+            thread.join()
+
+    def __offer(self, engine: Engine, statement: str, parameters: Any, executemany: bool, duration: float):
+        if not _EXPLAINABLE.match(statement):
+            return
+        key = fingerprint(statement)
+        now = time.monotonic()
+        with self.__lock:
+            if self.__closed:
+                return
+            explained_at = self.__explained_at.get(key)
+            if explained_at is not None and now - explained_at < self.__interval:
+                return
+            self.__explained_at[key] = now
+            self.__explained_at.move_to_end(key)
+            while len(self.__explained_at) > self.__max_fingerprints:
+                self.__explained_at.popitem(last=False)
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name='alchemist-slow-query-explain', daemon=True)
+                self.__thread.start()
+        first = (parameters[0] if parameters else None) if executemany else parameters
+        query = SlowQuery(fingerprint=key, statement=statement, parameters=parameters_shape(parameters, executemany),
+                          duration=duration, dialect=engine.dialect.name)
+        try:
+            self.__pending.put_nowait((engine, query, first))
+        except queue.Full:
+            self.__dropped += 1
+            with self.__lock:
+                self.__explained_at.pop(key, None)
+
+    def __run(self):
+        while True:
+            item = self.__pending.get()
+            try:
+                if item is None:
+                    return
+                (engine, query, parameters) = item
+                self.__explain(engine, query, parameters)
+                with self.__lock:
+                    self.__queries.append(query)
+            except Exception as error:
+                logger.error('Slow query log failed to explain a statement: {error}'.format(error=error))
+            finally:
+                self.__pending.task_done()
+
+    @staticmethod
+    def __explain(engine: Engine, query: SlowQuery, parameters: Any):
+        """ Runs the EXPLAIN of `query` on a raw connection, so it is neither timed nor seen by the engine's other
+                listeners.
+        """
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            explain = _EXPLAIN.get(query.dialect, 'EXPLAIN ') + query.statement
+            if parameters is None:
+                cursor.execute(explain)
+            else:
+                cursor.execute(explain, parameters)
+            query.plan = [list(row) for row in cursor.fetchall()]
+            cursor.close()
+            connection.rollback()
+        except Exception as error:
+            query.error = '{type}: {error}'.format(type=type(error).__name__, error=error)
+        finally:
+            connection.close()
@@ -1,17 +1,23 @@
 __author__ = 'H.D. "Chip" McCullough IV'
 
-def dict_diff(expected: dict, actual: dict) -> dict:
-    """
+def dict_diff(expected: dict, actual: dict, identity: bool = True) -> dict:
+    """ Gets the keys of `actual` whose values differ from `expected`.
 
-    :param expected:
-    :param actual:
-    :return:
+    :param expected: The reference dictionary.
+    :param actual: The dictionary to compare against `expected`.
+    :param identity: Whether values are compared by identity (`is not`) or by value (`!=`).
+        Default: True => Values must be the same object to be considered unchanged.
+    :return: Dictionary of the keys of `actual` that differ, with their values in `actual`.
     """
 
     diff = {}
 
     for key in actual.keys():
-        if expected.get(key) is not actual.get(key):
+        if identity:
+            changed = expected.get(key) is not actual.get(key)
+        else:
+            changed = key not in expected or expected.get(key) != actual.get(key)
+        if changed:
             diff.update({key: actual.get(key)})
 
     return diff
\ No newline at end of file
@@ -0,0 +1,138 @@
+""" Compares compressed JSON columns with an uncompressed one: bytes sent to and read from the database, and insert,
+    load, and load-then-use times, for large documents and for small ones (with and without a trained dictionary).
+
+    Usage:
+        $ python -m benchmarks.compressed_columns --count 20000
+        $ python -m benchmarks.compressed_columns --settings '{"drivername": "postgresql", "host": "localhost", ...}'
+"""
+
+# System Imports
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+# Third-Party Imports
+from sqlalchemy import Column, Integer, LargeBinary, event, func, select
+from sqlalchemy.types import TypeDecorator
+
+# Local Source Imports
+from alchemist_stack.context import Context
+from alchemist_stack.repository.models import Base, CompressedJSON, train_dictionary, ZSTD
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+class PlainJSON(TypeDecorator):
+    """ The uncompressed baseline: JSON stored in a binary column, as is. """
+
+    impl = LargeBinary
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else json.loads(bytes(value).decode('utf-8'))
+
+def large_document(i: int) -> dict:
+    return {
+        'id': i,
+        'title': 'Document {i}'.format(i=i),
+        'sections': [{'heading': 'Section {n}'.format(n=n), 'body': 'The quick brown fox jumps over the lazy dog. '
+                      * random.randint(5, 15), 'tags': ['alpha', 'beta', 'gamma'][:n % 3 + 1]} for n in range(8)],
+    }
+
+def small_document(i: int) -> dict:
+    return {'type': 'page_view', 'path': '/items/{n}'.format(n=random.randint(1, 10000)), 'session': i,
+            'user_agent': 'Mozilla/5.0 (X11; Linux x86_64)', 'referrer': 'https://example.com/search?q=item'}
+
+def table(name: str, column_type) -> type:
+    return type('Benchmark{name}'.format(name=name), (Base,), {
+        '__tablename__': 'benchmark_compression_{name}'.format(name=name.lower()),
+        'primary_key': Column('id', Integer, primary_key=True),
+        'payload': Column(column_type),
+    })
+
+def run(settings: dict, model: type, documents: list) -> dict:
+    """ Inserts and reads back `documents` through `model`, and gets the bytes and times. """
+    context = Context(settings=settings)
+    model.__table__.drop(bind=context.engine, checkfirst=True)
+    model.__table__.create(bind=context.engine)
+    sent = [0]
+
+    @event.listens_for(context.engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, execution_context, executemany):
+        for params in (parameters if executemany else [parameters]):
+            sent[0] += sum(len(value) for value in params if isinstance(value, (bytes, memoryview)))
+
+    started = time.perf_counter()
+    session = context()
+    session.bulk_insert_mappings(model, [{'payload': document} for document in documents])
+    session.commit()
+    session.close()
+    inserted = time.perf_counter() - started
+
+    stored = context.engine.execute(select([func.sum(func.length(model.__table__.c.payload))])).scalar()
+
+    started = time.perf_counter()
+    session = context()
+    rows = session.query(model).all()
+    loaded = time.perf_counter() - started
+    for row in rows:
+        row.payload['id' if 'id' in row.payload else 'session']
+    used = time.perf_counter() - started
+    session.close()
+
+    model.__table__.drop(bind=context.engine)
+    context.engine.dispose()
+    return {'sent': sent[0], 'stored': stored, 'insert': inserted, 'load': loaded, 'use': used}
+
+def main(settings: dict, count: int):
+    random.seed(0)
+    zstd = True
+    try:
+        CompressedJSON(codec=ZSTD)
+    except ImportError:
+        zstd = False
+
+    large = [large_document(i) for i in range(count)]
+    small = [small_document(i) for i in range(count)]
+    dictionary = train_dictionary(json.dumps(document) for document in small[:1000])
+    cases = [
+        ('large', 'Plain', PlainJSON(), large),
+        ('large', 'Zlib', CompressedJSON(), large),
+        ('large', 'ZlibLazy', CompressedJSON(lazy=True), large),
+        ('small', 'SmallPlain', PlainJSON(), small),
+        ('small', 'SmallZlib', CompressedJSON(threshold=0), small),
+        ('small', 'SmallDictionary', CompressedJSON(threshold=0, dictionary=dictionary), small),
+    ]
+    if zstd:
+        cases.insert(3, ('large', 'Zstd', CompressedJSON(codec=ZSTD), large))
+        cases.append(('small', 'SmallZstdDictionary',
+                      CompressedJSON(codec=ZSTD, threshold=0,
+                                     dictionary=train_dictionary((json.dumps(d) for d in small[:1000]),
+                                                                 codec=ZSTD)), small))
+
+    print('{count} documents per case, {driver}{note}'.format(count=count, driver=settings['drivername'],
+                                                               note='' if zstd else ' (zstandard not installed)'))
+    print('{:>6}{:>22}{:>14}{:>14}{:>12}{:>12}{:>12}'.format('size', 'column', 'bytes sent', 'bytes stored',
+                                                             'insert s', 'load s', 'use s'))
+    for (size, name, column_type, documents) in cases:
+        result = run(settings=settings, model=table(name, column_type), documents=documents)
+        print('{:>6}{:>22}{:>14}{:>14}{:>12.3f}{:>12.3f}{:>12.3f}'.format(size, name, result['sent'], result['stored'],
+                                                                          result['insert'], result['load'],
+                                                                          result['use']))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=20000)
+    parser.add_argument('--settings', type=json.loads, default=None,
+                        help='Context settings as JSON. Default: a temporary SQLite database.')
+    arguments = parser.parse_args()
+    if arguments.settings is None:
+        with tempfile.TemporaryDirectory() as directory:
+            main(settings={'drivername': 'sqlite', 'database': os.path.join(directory, 'compression.db')},
+                 count=arguments.count)
+    else:
+        main(settings=arguments.settings, count=arguments.count)
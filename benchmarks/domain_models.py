@@ -0,0 +1,103 @@
+""" Compares the hand-written domain models (as in test/models) with DomainModel subclasses: memory per object, and
+    construction / row / mapping conversion time.
+
+    Usage:
+        $ python -m benchmarks.domain_models --count 1000000
+"""
+
+# System Imports
+import argparse
+import gc
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+# Third-Party Imports
+from sqlalchemy import Column, DateTime, Integer, String
+
+# Local Source Imports
+from alchemist_stack.repository.models import Base
+from alchemist_stack.repository.models.domain import DomainModel
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+class BenchmarkTable(Base):
+    __tablename__ = 'benchmark_domain_model'
+
+    primary_key = Column('id', Integer, primary_key=True)
+    name = Column(String(64), nullable=False)
+    value = Column(Integer, nullable=False, default=0)
+    timestamp = Column(DateTime(timezone=True), nullable=False)
+
+class HandWritten(object):
+    """ The hand-written style: private attributes in a per-instance __dict__, and unused *args/**kwargs storage. """
+
+    def __init__(self, primary_key: int = None, name: str = None, value: int = 0, timestamp: datetime = None,
+                 *args, **kwargs):
+        self.__pk = primary_key
+        self.__name = name
+        self.__value = value
+        self.__timestamp = timestamp
+        self.__args = args
+        self.__kwargs = kwargs
+
+    def to_mapping(self) -> dict:
+        return {'primary_key': self.__pk, 'name': self.__name, 'value': self.__value, 'timestamp': self.__timestamp}
+
+    @classmethod
+    def from_row(cls, row) -> 'HandWritten':
+        return cls(primary_key=row[0], name=row[1], value=row[2], timestamp=row[3])
+
+class Slotted(DomainModel, table=BenchmarkTable):
+    pass
+
+def measure_memory(factory, count: int) -> float:
+    """ Gets the bytes allocated per object while building `count` objects. """
+    gc.collect()
+    tracemalloc.start()
+    objs = [factory(i) for i in range(count)]
+    (current, _) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objs
+    return current / count
+
+def measure_time(fn, repeat: int = 3) -> float:
+    """ Gets the best wall-clock time of `repeat` runs of `fn`. """
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main(count: int):
+    now = datetime.now(timezone.utc)
+    rows = [(i, str(i), i, now) for i in range(count)]
+    hand_written = [HandWritten.from_row(row) for row in rows]
+    slotted = Slotted.from_rows(rows)
+
+    results = [
+        ('bytes / object',
+         measure_memory(lambda i: HandWritten(i, 'name', i, now), count),
+         measure_memory(lambda i: Slotted(i, 'name', i, now), count)),
+        ('construct (s)',
+         measure_time(lambda: [HandWritten(i, 'name', i, now) for i in range(count)]),
+         measure_time(lambda: [Slotted(i, 'name', i, now) for i in range(count)])),
+        ('from rows (s)',
+         measure_time(lambda: [HandWritten.from_row(row) for row in rows]),
+         measure_time(lambda: Slotted.from_rows(rows))),
+        ('to mappings (s)',
+         measure_time(lambda: [obj.to_mapping() for obj in hand_written]),
+         measure_time(lambda: Slotted.to_mappings(slotted))),
+    ]
+
+    print('{count} objects'.format(count=count))
+    print('{:<18}{:>14}{:>14}{:>10}'.format('', 'hand-written', 'DomainModel', 'ratio'))
+    for (label, before, after) in results:
+        print('{:<18}{:>14.4f}{:>14.4f}{:>9.2f}x'.format(label, before, after, before / after))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=200000)
+    main(count=parser.parse_args().count)
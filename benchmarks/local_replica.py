@@ -0,0 +1,97 @@
+""" Measures primary-key lookups on a small reference table from several threads, with and without a LocalReplica,
+    and reports their latency percentiles.
+
+    Usage:
+        $ python -m benchmarks.local_replica --lookups 20000 --threads 8
+        $ python -m benchmarks.local_replica --settings '{"drivername": "postgresql", "host": "localhost", ...}'
+"""
+
+# System Imports
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Third-Party Imports
+from sqlalchemy import Column, Integer, String
+
+# Local Source Imports
+from alchemist_stack.context import Context, LocalReplica
+from alchemist_stack.repository.models import Base
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+class BenchmarkFlag(Base):
+    __tablename__ = 'benchmark_replica_flag'
+
+    primary_key = Column('id', Integer, primary_key=True)
+    name = Column(String(64), nullable=False)
+    enabled = Column(Integer, nullable=False, default=0)
+
+def run(settings: dict, replicated: bool, rows: int, lookups: int, threads: int) -> list:
+    """ Looks up `lookups` random flags across `threads` threads, and gets every lookup's latency in seconds. """
+    replica = LocalReplica(models=[BenchmarkFlag], refresh_interval=60) if replicated else None
+    context = Context(settings=settings, replica=replica)
+    if replica is not None:
+        replica.refresh()
+
+    def lookup(n: int) -> list:
+        latencies = []
+        for _ in range(n):
+            key = random.randint(1, rows)
+            started = time.perf_counter()
+            session = context()
+            session.query(BenchmarkFlag).filter(BenchmarkFlag.primary_key == key).one()
+            session.close()
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = [latency for result in pool.map(lookup, [lookups // threads] * threads) for latency in result]
+    if replica is not None:
+        replica.close()
+    context.engine.dispose()
+    return sorted(latencies)
+
+def percentile(latencies: list, p: float) -> float:
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+def main(settings: dict, rows: int, lookups: int, threads: int):
+    context = Context(settings=settings)
+    BenchmarkFlag.__table__.drop(bind=context.engine, checkfirst=True)
+    BenchmarkFlag.__table__.create(bind=context.engine)
+    session = context()
+    session.bulk_insert_mappings(BenchmarkFlag, [{'name': 'flag-{i}'.format(i=i), 'enabled': i % 2}
+                                                 for i in range(rows)])
+    session.commit()
+    session.close()
+
+    print('{lookups} lookups of {rows} rows, {threads} threads, {driver}'.format(lookups=lookups, rows=rows,
+                                                                                 threads=threads,
+                                                                                 driver=settings['drivername']))
+    print('{:>10}{:>12}{:>12}{:>12}'.format('reads', 'p50 ms', 'p99 ms', 'max ms'))
+    for (name, replicated) in (('primary', False), ('replica', True)):
+        latencies = run(settings=settings, replicated=replicated, rows=rows, lookups=lookups, threads=threads)
+        print('{:>10}{:>12.3f}{:>12.3f}{:>12.3f}'.format(name, percentile(latencies, 0.5),
+                                                         percentile(latencies, 0.99), latencies[-1] * 1000))
+
+    BenchmarkFlag.__table__.drop(bind=context.engine)
+    context.engine.dispose()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=500)
+    parser.add_argument('--lookups', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--settings', type=json.loads, default=None,
+                        help='Context settings as JSON. Default: a temporary SQLite database.')
+    arguments = parser.parse_args()
+    if arguments.settings is None:
+        with tempfile.TemporaryDirectory() as directory:
+            main(settings={'drivername': 'sqlite', 'database': os.path.join(directory, 'primary.db')},
+                 rows=arguments.rows, lookups=arguments.lookups, threads=arguments.threads)
+    else:
+        main(settings=arguments.settings, rows=arguments.rows, lookups=arguments.lookups, threads=arguments.threads)
@@ -0,0 +1,75 @@
+""" Compares schema bootstrap times on an up-to-date database with many tables: `MetaData.create_all()` (one existence
+    check per table), a single catalog query, and a cached schema fingerprint.
+
+    Usage:
+        $ python -m benchmarks.schema_bootstrap --tables 300
+        $ python -m benchmarks.schema_bootstrap --settings '{"drivername": "postgresql", "host": "localhost", ...}'
+"""
+
+# System Imports
+import argparse
+import json
+import os
+import tempfile
+import time
+
+# Third-Party Imports
+from sqlalchemy import Column, Index, Integer, MetaData, String, Table
+
+# Local Source Imports
+from alchemist_stack.context import Context
+from alchemist_stack.repository.models import bootstrap_schema
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+def schema(tables: int) -> MetaData:
+    metadata = MetaData()
+    for i in range(tables):
+        table = Table('benchmark_bootstrap_{i}'.format(i=i), metadata,
+                      Column('id', Integer, primary_key=True),
+                      Column('name', String(64), nullable=False),
+                      Column('value', Integer, nullable=False, default=0))
+        Index('ix_benchmark_bootstrap_{i}_name'.format(i=i), table.c.name)
+    return metadata
+
+def timed(call, runs: int) -> float:
+    best = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        call()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main(settings: dict, tables: int, runs: int, directory: str):
+    context = Context(settings=settings)
+    metadata = schema(tables)
+    metadata.drop_all(bind=context.engine)
+    fingerprints = os.path.join(directory, 'fingerprints.json')
+
+    cold = timed(lambda: bootstrap_schema(context.engine, metadata), 1)
+    cases = [
+        ('create_all', lambda: metadata.create_all(bind=context.engine)),
+        ('catalog', lambda: bootstrap_schema(context.engine, metadata)),
+        ('fingerprint', lambda: bootstrap_schema(context.engine, metadata, fingerprint_path=fingerprints)),
+    ]
+    print('{tables} tables, {driver}; creating them: {cold:.3f}s'.format(tables=tables, cold=cold,
+                                                                         driver=settings['drivername']))
+    print('{:>12}{:>12}'.format('bootstrap', 'best s'))
+    for (name, call) in cases:
+        print('{:>12}{:>12.4f}'.format(name, timed(call, runs)))
+
+    metadata.drop_all(bind=context.engine)
+    context.engine.dispose()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tables', type=int, default=300)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--settings', type=json.loads, default=None,
+                        help='Context settings as JSON. Default: a temporary SQLite database.')
+    arguments = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        settings = arguments.settings if arguments.settings is not None else \
+            {'drivername': 'sqlite', 'database': os.path.join(directory, 'schema.db')}
+        main(settings=settings, tables=arguments.tables, runs=arguments.runs, directory=directory)
@@ -0,0 +1,86 @@
+""" Measures how fast 1, 4 and 16 worker threads drain a QueueRepositoryBase table, claiming and acknowledging jobs
+    in batches, and checks that no job is processed twice.
+
+    Usage:
+        $ python -m benchmarks.work_queue --jobs 20000 --batch 50
+        $ python -m benchmarks.work_queue --settings '{"drivername": "postgresql", "host": "localhost", ...}'
+"""
+
+# System Imports
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Third-Party Imports
+from sqlalchemy import Column, Integer, String
+
+# Local Source Imports
+from alchemist_stack.context import Context
+from alchemist_stack.repository.models import Base
+from alchemist_stack.repository.queue import QueueItem, QueueRepositoryBase
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+class BenchmarkJob(QueueItem, Base):
+    __tablename__ = 'benchmark_job'
+
+    primary_key = Column('id', Integer, primary_key=True)
+    payload = Column(String(64), nullable=False)
+
+class BenchmarkQueue(QueueRepositoryBase):
+
+    @classmethod
+    def instance(cls, context: Context, *args, **kwargs):
+        return cls(context=context, model=BenchmarkJob, *args, **kwargs)
+
+def run(settings: dict, jobs: int, batch: int, workers: int) -> float:
+    """ Fills the queue with `jobs` rows, drains it with `workers` threads, and gets the throughput in jobs/second. """
+    context = Context(settings=settings)
+    BenchmarkJob.__table__.drop(bind=context.engine, checkfirst=True)
+    BenchmarkJob.__table__.create(bind=context.engine)
+    queue = BenchmarkQueue.instance(context=context)
+    queue.enqueue(BenchmarkJob(payload=str(i)) for i in range(jobs))
+
+    def drain(_):
+        processed = []
+        while True:
+            claimed = queue.claim(batch)
+            if not claimed:
+                return processed
+            processed.extend(job.primary_key for job in claimed)
+            queue.ack(claimed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        processed = [pk for worker in pool.map(drain, range(workers)) for pk in worker]
+    elapsed = time.perf_counter() - started
+
+    if len(processed) != jobs or len(set(processed)) != jobs:
+        raise AssertionError('{workers} workers processed {count} jobs ({unique} unique), expected {jobs}'
+                             .format(workers=workers, count=len(processed), unique=len(set(processed)), jobs=jobs))
+    BenchmarkJob.__table__.drop(bind=context.engine)
+    context.engine.dispose()
+    return jobs / elapsed
+
+def main(settings: dict, jobs: int, batch: int):
+    print('{jobs} jobs, batches of {batch}, {driver}'.format(jobs=jobs, batch=batch, driver=settings['drivername']))
+    print('{:>8}{:>14}'.format('workers', 'jobs / s'))
+    for workers in (1, 4, 16):
+        print('{:>8}{:>14.0f}'.format(workers, run(settings=settings, jobs=jobs, batch=batch, workers=workers)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=50)
+    parser.add_argument('--settings', type=json.loads, default=None,
+                        help='Context settings as JSON. Default: a temporary SQLite database.')
+    arguments = parser.parse_args()
+    if arguments.settings is None:
+        with tempfile.TemporaryDirectory() as directory:
+            main(settings={'drivername': 'sqlite', 'database': os.path.join(directory, 'queue.db')},
+                 jobs=arguments.jobs, batch=arguments.batch)
+    else:
+        main(settings=arguments.settings, jobs=arguments.jobs, batch=arguments.batch)
@@ -34,7 +34,7 @@ setup(
     author_email='hdmccullough.work@gmail.com',
 
     # Packages:
-    packages=find_packages(exclude=['models', 'repos', 'tables', 'tests']),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*', 'models', 'repos', 'tables', 'tests']),
 
     # Details:
     url='https://github.com/mcculloh213/alchemist-stack',
@@ -0,0 +1,150 @@
+from alchemist_stack.changes import ChangeStream, UnixSocketPublisher, UnixSocketSubscriber, INSERT, UPDATE, DELETE
+from alchemist_stack.context import Context
+from alchemist_stack.repository.models import create_tables
+from alchemist_stack.repository.models.autotable import create_repository
+from test.repository import JobQueue, JobTable, RecordRepository, RecordTable
+
+from os import path
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from tempfile import TemporaryDirectory
+import threading
+import time
+import unittest
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+class TestChangeStream(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.changes = ChangeStream(max_queue=16)
+        self.context = Context(settings={
+            'drivername': 'sqlite',
+            'database': path.join(self.directory.name, 'changes.db'),
+        }, change_stream=self.changes)
+        create_tables(engine=self.context.engine)
+        self.subscription = self.changes.subscribe()
+        self.repo = create_repository(RecordTable).instance(context=self.context)
+
+    def test_orm_commit_is_published(self):
+        RecordRepository.instance(context=self.context).create_record(RecordTable(name='a', value=1))
+        (change,) = self.subscription.drain()
+        self.assertEqual(('record', 'RecordTable', INSERT), (change.table, change.model, change.operation))
+        self.assertEqual([1], change.primary_keys)
+        self.assertEqual(frozenset({'name', 'value'}), change.columns)
+
+    def test_bulk_write_is_one_event(self):
+        self.repo.bulk_create([{'name': str(i), 'value': i} for i in range(1000)])
+        self.assertEqual(2, self.repo.bulk_update([{'primary_key': 1, 'value': 10}, {'primary_key': 2, 'value': 20}]))
+        (insert, update) = self.subscription.drain()
+        self.assertEqual((INSERT, 1000), (insert.operation, insert.count))
+        self.assertEqual((UPDATE, [1, 2], frozenset({'value'})), (update.operation, update.primary_keys,
+                                                                  update.columns))
+
+        self.repo.delete(3)
+        (delete,) = self.subscription.drain()
+        self.assertEqual((DELETE, [3], 1), (delete.operation, delete.primary_keys, delete.count))
+
+    def test_rollback_is_not_published(self):
+        session = self.context()
+        session.add(RecordTable(name='a', value=1))
+        session.flush()
+        session.rollback()
+        session.close()
+        self.assertEqual([], self.subscription.drain())
+
+    def test_closed_session_is_not_published(self):
+        # A pooled engine, so the next Session checks out the connection the closed one used.
+        engine = create_engine('sqlite:///{path}'.format(path=path.join(self.directory.name, 'changes.db')),
+                               poolclass=QueuePool, pool_size=1)
+        factory = sessionmaker(bind=engine)
+        self.changes.watch(engine)
+        self.changes.watch_sessions(factory)
+
+        session = factory()
+        session.add(RecordTable(name='a', value=1))
+        session.flush()
+        session.close()
+        # Sessions are reusable after a close (e.g. a scoped Session).
+        session.add(RecordTable(name='b', value=2))
+        session.commit()
+        session.close()
+        (change,) = self.subscription.drain()
+        self.assertEqual((INSERT, 1), (change.operation, change.count),
+                         msg='The writes of a Session closed without a commit leaked into the next one.')
+        with engine.connect() as connection:
+            self.assertNotIn('alchemist_staged_changes', connection.info)
+        engine.dispose()
+
+    def test_failing_callback_does_not_fail_commit(self):
+        received = []
+
+        def fail(change):
+            raise RuntimeError('subscriber failed')
+
+        failing = self.changes.subscribe(callback=fail)
+        working = self.changes.subscribe(callback=received.append)
+        with self.assertLogs('Alchemist Stack', level='ERROR'):
+            self.repo.create(RecordTable(name='a', value=1))
+        self.assertEqual([INSERT], [change.operation for change in received])
+        self.assertEqual(1, len(self.subscription.drain()))
+        failing.close()
+        working.close()
+
+    def test_claimed_rows_are_named(self):
+        queue = JobQueue.instance(context=self.context)
+        queue.enqueue(JobTable(payload=str(i)) for i in range(3))
+        jobs = queue.claim(3)
+        queue.ack(jobs)
+        (enqueue, claim, ack) = self.subscription.drain()
+        self.assertEqual((UPDATE, None, 3), (claim.operation, claim.primary_keys, claim.count),
+                         msg='A claim by sub-select was reported with primary keys.')
+        self.assertEqual((DELETE, [job.primary_key for job in jobs]), (ack.operation, ack.primary_keys))
+
+    def test_full_subscriber_drops(self):
+        for i in range(20):
+            self.repo.create(RecordTable(name=str(i)))
+        self.assertEqual(16, len(self.subscription.drain()))
+        self.assertEqual(4, self.subscription.dropped)
+        self.assertEqual(20, self.changes.published)
+
+    def test_closing_a_full_subscription_ends_iteration(self):
+        for i in range(20):
+            self.repo.create(RecordTable(name=str(i)))
+        self.subscription.close()
+        received = []
+        consumer = threading.Thread(target=lambda: received.extend(self.subscription), daemon=True)
+        consumer.start()
+        consumer.join(timeout=5)
+        self.assertFalse(consumer.is_alive(), msg='Iterating a closed, full subscription never ended.')
+        self.assertEqual(16, len(received), msg='The events queued before close() were not handed out.')
+        self.assertIsNone(self.subscription.get(timeout=5), msg='get() waited on a closed subscription.')
+
+    def test_unix_socket_fan_out(self):
+        publisher = UnixSocketPublisher(self.changes, path=path.join(self.directory.name, 'changes.sock'))
+        subscriber = UnixSocketSubscriber(path=publisher.path, timeout=5)
+        deadline = time.monotonic() + 5
+        while publisher.clients == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.repo.update(self.repo.create(RecordTable(name='a')).primary_key, value=5)
+        self.assertEqual(INSERT, subscriber.get().operation)
+        change = subscriber.get()
+        self.assertEqual((UPDATE, [1], frozenset({'value'})), (change.operation, change.primary_keys,
+                                                               change.columns))
+        subscriber.close()
+        publisher.close()
+
+    def tearDown(self):
+        self.subscription.close()
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.repo
+        del self.subscription
+        del self.context
+        del self.changes
+        del self.directory
+
+if __name__ == '__main__':
+    unittest.main()
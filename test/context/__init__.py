@@ -1,12 +1,26 @@
 from alchemist_stack.context import UnsupportedDriverException, UnsupportedDialectException,\
-    set_connection_string_settings, create_context, __settings__
+    UnknownSessionProfileException, ContextDrainingException, ContextSaturatedException, AdmissionController,\
+    AIMDLimit, set_connection_string_settings, create_context, __settings__,\
+    DEFAULT_PROFILE, READ_ONLY_PROFILE, BULK_PROFILE, THREAD_SCOPING, CONTEXT_SCOPING
+from alchemist_stack.changes import ChangeStream
+from alchemist_stack.context import LocalReplica, DeadlineQueuePool, DeadlineExceededException, deadline,\
+    current_deadline
 from alchemist_stack.context.context import Context
+from alchemist_stack.repository.models import create_tables
 from alchemist_stack.utils import dict_diff
 
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
+from os import path
+from tempfile import TemporaryDirectory
+from threading import Thread, Timer
+from time import monotonic, sleep
+from sqlalchemy import event
 from sqlalchemy.engine import create_engine
 from sqlalchemy.engine.base import Engine
 from sqlalchemy.engine.url import URL
+import asyncio
+import sqlite3
 import unittest
 
 __author__ = 'H.D. "Chip" McCullough IV'
@@ -97,10 +111,388 @@ class TestContextCreation(unittest.TestCase):
 
 class TestContextClass(unittest.TestCase):
     def setUp(self):
-        pass
+        self.context = Context(settings={'drivername': 'sqlite', 'database': ':memory:'})
+
+    def test_default_session_profiles(self):
+        for profile in (DEFAULT_PROFILE, READ_ONLY_PROFILE, BULK_PROFILE):
+            self.assertIn(profile, self.context.session_profiles,
+                          msg='The {profile} Session profile is not registered.'.format(profile=profile))
+
+        session = self.context()
+        self.assertTrue(session.autoflush, msg='The default profile does not autoflush.')
+        self.assertTrue(session.expire_on_commit, msg='The default profile does not expire on commit.')
+        session.close()
+
+        session = self.context(profile=READ_ONLY_PROFILE)
+        self.assertFalse(session.autoflush, msg='The read-only profile autoflushes.')
+        self.assertFalse(session.expire_on_commit, msg='The read-only profile expires on commit.')
+        session.close()
+
+    def test_register_session_profile(self):
+        self.context.register_session_profile('reporting', autoflush=False)
+        session = self.context(profile='reporting')
+        self.assertFalse(session.autoflush, msg='The registered profile options were not applied.')
+        session.close()
+
+    def test_unknown_session_profile(self):
+        with self.assertRaises(UnknownSessionProfileException,
+                               msg='The function did not raise the correct Exception') as cm:
+            self.context(profile='lionfish')
+        self.assertEqual('lionfish', cm.exception.profile,
+                         msg='The profile names do not match.')
+
+    def test_warmup(self):
+        self.assertEqual(3, self.context.warmup(3),
+                         msg='Not every warmup connection was opened and validated.')
+
+    def test_warmup_timeout(self):
+        checkins = []
+        event.listen(self.context.engine, 'connect', lambda *args: sleep(0.5))
+        event.listen(self.context.engine, 'checkin', lambda *args: checkins.append(args))
+        started = monotonic()
+        self.assertEqual(0, self.context.warmup(3, timeout=0.05),
+                         msg='Connections slower than the timeout were counted.')
+        self.assertLess(monotonic() - started, 0.4, msg='The warmup waited past its timeout.')
+
+        expires_at = monotonic() + 5
+        while len(checkins) < 3 and monotonic() < expires_at:
+            sleep(0.01)
+        self.assertEqual(3, len(checkins), msg='The connections opened late were not closed.')
+
+    def test_drain_waits_for_sessions(self):
+        session = self.context.open_session(owner='worker')
+        self.assertEqual(1, self.context.active_sessions)
+        closer = Timer(0.05, self.context.close_session, args=(session,))
+        closer.start()
+
+        in_flight = self.context.drain(timeout=5)
+        closer.join()
+        self.assertEqual([], in_flight, msg='The drain did not wait for the open Session.')
+        with self.assertRaises(ContextDrainingException,
+                               msg='The draining Context handed out a new Session.'):
+            self.context.open_session()
+
+    def test_drain_reports_in_flight_sessions(self):
+        session = self.context.open_session(owner='worker')
+        in_flight = self.context.drain(timeout=0.01)
+        self.assertEqual(1, len(in_flight))
+        self.assertEqual('worker', in_flight[0]['owner'])
+        self.context.close_session(session)
+        self.assertEqual(0, self.context.active_sessions)
+
+    def tearDown(self):
+        self.context.engine.dispose()
+        del self.context
+
+class TestAdmissionController(unittest.TestCase):
+    def setUp(self):
+        self.admission = AdmissionController(limit=2, max_queue=1, queue_timeout=0.05)
+        self.context = Context(settings={'drivername': 'sqlite', 'database': ':memory:'}, admission=self.admission)
+
+    def test_saturated_context_rejects(self):
+        sessions = [self.context.open_session(), self.context.open_session()]
+        with self.assertRaises(ContextSaturatedException,
+                               msg='The saturated Context handed out a new Session.'):
+            self.context.open_session()
+        self.assertEqual(1, self.admission.metrics['rejected'])
+        self.assertEqual(2, self.admission.metrics['in_flight'])
+
+        self.context.close_session(sessions.pop())
+        sessions.append(self.context.open_session())
+        for session in sessions:
+            self.context.close_session(session)
+        self.assertEqual(0, self.admission.in_flight)
+
+    def test_failed_open_frees_its_slot(self):
+        for _ in range(3):
+            with self.assertRaises(UnknownSessionProfileException):
+                self.context.open_session(profile='nope')
+        self.assertEqual(0, self.admission.in_flight, msg='A failed open_session kept its admission slot.')
+
+    def test_queued_request_is_admitted_on_release(self):
+        sessions = [self.context.open_session(), self.context.open_session()]
+        closer = Timer(0.01, self.context.close_session, args=(sessions.pop(),))
+        closer.start()
+        sessions.append(self.context.open_session(timeout=5))
+        closer.join()
+        for session in sessions:
+            self.context.close_session(session)
+        self.assertEqual(0, self.admission.metrics['rejected'])
+
+    def test_release_reports_query_latency_and_drops(self):
+        observations = []
+
+        class RecordingLimit(AIMDLimit):
+            def update(self, latency: float, in_flight: int, dropped: bool) -> int:
+                observations.append((latency, dropped))
+                return super().update(latency=latency, in_flight=in_flight, dropped=dropped)
+
+        context = Context(settings={'drivername': 'sqlite', 'database': ':memory:'},
+                          admission=AdmissionController(algorithm=RecordingLimit(initial=10)))
+        session = context.open_session()
+        session.execute('SELECT 1')
+        sleep(0.2)  # Think time: not a query.
+        context.close_session(session)
+        ((latency, dropped),) = observations
+        self.assertFalse(dropped)
+        self.assertLess(latency, 0.1, msg='The time the caller held the Session was fed to the limit.')
+
+        session = context.open_session()
+        with self.assertRaises(Exception):
+            session.execute('SELECT * FROM missing_table')
+        context.close_session(session)
+        session = context.open_session()
+        session.execute('SELECT 1')
+        session.rollback()
+        context.close_session(session)
+        self.assertEqual([True, True], [dropped for (_, dropped) in observations[1:]],
+                         msg='A failed or rolled back Session was not reported as dropped.')
+
+        context.close_session(context.open_session())
+        self.assertEqual(3, len(observations), msg='A Session that executed nothing was fed to the limit.')
+        context.engine.dispose()
+
+    def test_aimd_limit(self):
+        algorithm = AIMDLimit(initial=10, latency_threshold=0.1, backoff=0.5)
+        self.assertEqual(5, algorithm.update(latency=1.0, in_flight=5, dropped=False))
+        self.assertEqual(6, algorithm.update(latency=0.01, in_flight=5, dropped=False))
+
+    def tearDown(self):
+        self.context.engine.dispose()
+        del self.context
+        del self.admission
+
+class TestSessionRegistry(unittest.TestCase):
+    def setUp(self):
+        self.context = Context(settings={'drivername': 'sqlite', 'database': ':memory:'},
+                               session_scoping=CONTEXT_SCOPING)
+        self.registry = self.context.session_registry()
+
+    def test_registry_is_shared_per_profile(self):
+        self.assertIs(self.registry, self.context.session_registry(DEFAULT_PROFILE))
+        self.assertIsNot(self.registry, self.context.session_registry(BULK_PROFILE))
+        with self.assertRaises(UnknownSessionProfileException):
+            self.context.session_registry('lionfish')
+        with self.assertRaises(ValueError):
+            Context(settings={'drivername': 'sqlite', 'database': ':memory:'}, session_scoping='lionfish')
+
+    def test_one_session_per_thread(self):
+        session = self.registry()
+        self.assertIs(session, self.registry())
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            other = pool.submit(lambda: (self.registry(), self.registry.remove())[0]).result()
+        self.assertIsNot(session, other)
+        self.registry.remove()
+        self.assertFalse(self.registry.has())
+        self.assertEqual(0, self.context.active_sessions)
+
+    def test_one_session_per_task(self):
+        async def handle():
+            with self.registry.scope() as session:
+                await asyncio.sleep(0)
+                self.assertIs(session, self.registry())
+                return session
+
+        async def serve():
+            outer = self.registry()
+            sessions = await asyncio.gather(*(handle() for _ in range(8)))
+            self.assertIs(outer, self.registry(), msg='The scopes replaced the enclosing Session.')
+            self.registry.remove()
+            return sessions
+
+        sessions = asyncio.run(serve())
+        self.assertEqual(8, len({id(session) for session in sessions}), msg='Tasks shared a Session.')
+        self.assertEqual(0, self.context.active_sessions, msg='A scoped Session was not closed.')
+
+    def test_inherited_session_is_not_reused(self):
+        async def child():
+            return self.registry()
+
+        async def parent():
+            session = self.registry()
+            inherited = await asyncio.create_task(child())
+            self.registry.remove()
+            return session, inherited
+
+        (session, inherited) = asyncio.run(parent())
+        self.assertIsNot(session, inherited, msg='A task reused the Session of the task that created it.')
+        self.context.close_session(inherited)
+        self.assertEqual(0, self.context.active_sessions)
+
+    def test_unremoved_session_is_closed_when_its_owner_ends(self):
+        thread = Thread(target=self.registry)
+        thread.start()
+        thread.join()
+        self.assertEqual(0, self.context.active_sessions, msg='A finished thread kept its Session open.')
+
+        async def handle():
+            return self.registry()
+
+        async def serve():
+            session = await asyncio.create_task(handle())
+            await asyncio.sleep(0)  # The task's done callbacks run after the awaiting task is woken.
+            self.assertEqual(0, self.context.active_sessions, msg='A finished task kept its Session open.')
+            return session
+
+        asyncio.run(serve())
+        self.assertEqual([], self.context.drain(timeout=1), msg='Sessions of finished owners blocked drain().')
+
+    def test_thread_scoping_shares_session_across_tasks(self):
+        context = Context(settings={'drivername': 'sqlite', 'database': ':memory:'}, session_scoping=THREAD_SCOPING)
+        registry = context.session_registry()
+
+        async def serve():
+            return await asyncio.gather(*(asyncio.sleep(0, result=registry()) for _ in range(4)))
+
+        self.assertEqual(1, len({id(session) for session in asyncio.run(serve())}))
+        self.assertEqual(1, context.active_sessions, msg='The thread\'s Session was closed when a task ended.')
+        registry.remove()
+        self.assertEqual(0, context.active_sessions)
+        thread = Thread(target=registry)
+        thread.start()
+        thread.join()
+        self.assertEqual(0, context.active_sessions, msg='A finished thread kept its Session open.')
+        context.engine.dispose()
+
+    def tearDown(self):
+        self.context.engine.dispose()
+        del self.registry
+        del self.context
+
+class TestLocalReplica(unittest.TestCase):
+    def setUp(self):
+        from test.repository import EventTable, RecordTable
+        self.model = RecordTable
+        self.directory = TemporaryDirectory()
+        self.replica = LocalReplica(models=[RecordTable], refresh_interval=60)
+        self.context = Context(settings={
+            'drivername': 'sqlite',
+            'database': path.join(self.directory.name, 'primary.db'),
+        }, replica=self.replica, change_stream=ChangeStream())
+        create_tables(engine=self.context.engine)
+        session = self.context()
+        session.add_all([RecordTable(name=str(i), value=i) for i in range(10)] + [EventTable()])
+        session.commit()
+        session.close()
+        self.replica.refresh()
+
+    def insert_behind_the_context(self):
+        connection = sqlite3.connect(path.join(self.directory.name, 'primary.db'))
+        connection.execute("INSERT INTO record (name, value) VALUES ('behind', 0)")
+        connection.commit()
+        connection.close()
+
+    def count(self, session) -> int:
+        return session.query(self.model).count()
+
+    def test_reads_are_served_locally(self):
+        self.insert_behind_the_context()
+        session = self.context()
+        self.assertEqual(10, self.count(session), msg='The read was not served by the replica.')
+        self.assertEqual('3', session.query(self.model).filter_by(value=3).one().name)
+        session.close()
+        self.assertEqual(2, self.replica.stats['local'])
+
+        self.replica.refresh()
+        session = self.context()
+        self.assertEqual(11, self.count(session))
+        session.close()
+
+    def test_stale_tables_fall_back_to_the_primary(self):
+        self.insert_behind_the_context()
+        self.replica.invalidate('record', primary_keys=[11])
+        session = self.context()
+        self.assertEqual(11, self.count(session))
+        session.close()
+
+        self.replica.refresh()
+        self.assertTrue(self.replica.is_fresh('record'))
+        session = self.context()
+        self.assertEqual(11, self.count(session))
+        session.close()
+        self.assertEqual({'local': 1, 'primary': 1}, self.replica.stats)
+
+    def test_committed_writes_are_read_back(self):
+        session = self.context()
+        session.add(self.model(name='new'))
+        session.flush()
+        self.assertEqual(11, self.count(session), msg='A Session did not read its own write.')
+        session.commit()
+        session.close()
+
+        self.assertFalse(self.replica.is_fresh('record'), msg='The commit did not mark the table stale.')
+        session = self.context()
+        self.assertEqual(11, self.count(session))
+        session.close()
+
+    def test_unreplicated_tables_use_the_primary(self):
+        from test.repository import EventTable
+        session = self.context()
+        self.assertEqual(1, session.query(EventTable).count())
+        session.close()
+        self.assertEqual(0, self.replica.stats['local'])
+
+    def tearDown(self):
+        self.replica.close()
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.context
+        del self.replica
+        del self.directory
+
+class TestDeadlines(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.context = Context(settings={
+            'drivername': 'sqlite',
+            'database': path.join(self.directory.name, 'deadline.db'),
+        })
+        self.slow_query = 'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT count(*) FROM n'
+
+    def test_slow_statement_is_cancelled(self):
+        started = monotonic()
+        with self.assertRaises(DeadlineExceededException, msg='The statement outlived its deadline.'):
+            with deadline(0.05):
+                self.context.engine.execute(self.slow_query)
+        self.assertLess(monotonic() - started, 5)
+        self.assertEqual(1, self.context.engine.execute('SELECT 1').scalar(),
+                         msg='A statement without a deadline was cancelled.')
+
+    def test_expired_deadline_fails_before_executing(self):
+        session = self.context()
+        with deadline(0):
+            with self.assertRaises(DeadlineExceededException):
+                session.execute('SELECT 1')
+            with self.assertRaises(DeadlineExceededException):
+                self.context.open_session()
+        session.close()
+
+    def test_nested_deadline_does_not_extend(self):
+        with deadline(1):
+            outer = current_deadline()
+            with deadline(10):
+                self.assertEqual(outer, current_deadline())
+            with deadline(0.5):
+                self.assertLess(current_deadline(), outer)
+        self.assertIsNone(current_deadline())
+
+    def test_pool_checkout_is_bounded(self):
+        engine = create_engine('sqlite:///' + path.join(self.directory.name, 'pool.db'), poolclass=DeadlineQueuePool,
+                               pool_size=1, max_overflow=0, pool_timeout=30)
+        held = engine.connect()
+        started = monotonic()
+        with self.assertRaises(DeadlineExceededException, msg='The checkout outlived its deadline.'):
+            with deadline(0.05):
+                engine.connect()
+        self.assertLess(monotonic() - started, 5)
+        held.close()
+        engine.dispose()
 
     def tearDown(self):
-        pass
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.context
+        del self.directory
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -10,10 +10,10 @@ class Example(object):
         Example Model class.
     """
 
-    def __init__(self, timestamp: datetime = datetime.now(timezone.utc).astimezone(), primary_key: int = None,
+    def __init__(self, timestamp: datetime = None, primary_key: int = None,
                  *args, **kwargs):
         self.__pk = primary_key
-        self.__timestamp = timestamp
+        self.__timestamp = timestamp if timestamp is not None else datetime.now(timezone.utc).astimezone()
         self.__args = args
         self.__kwargs = kwargs
 
@@ -0,0 +1,1177 @@
+from alchemist_stack.context import Context, AdmissionController, ContextSaturatedException, DeadlineExceededException,\
+    deadline
+from alchemist_stack.repository import RepositoryBase, WriteBuffer, WriteBufferClosedException, StaleObjectException,\
+    UnknownColumnException, UnknownModelException, UnknownUpdateKeyException, IndexAdvisor, WorkloadRecorder,\
+    analyze_statement, DataLoader, loader_scope, SingleFlight, SingleFlightTimeoutException, BatchSession,\
+    BATCH_COMMIT
+from alchemist_stack.repository.counting import COUNT_CACHED, COUNT_ESTIMATED, COUNT_EXACT
+from alchemist_stack.repository.queue import QueueItem, QueueRepositoryBase
+from alchemist_stack.repository.scan import partition_key_ranges, SPLIT_MINMAX, SPLIT_QUANTILE
+from alchemist_stack.repository.retry import RetryPolicy
+from alchemist_stack.repository.sharding import ShardedRepositoryBase, HashShardStrategy, RangeShardStrategy,\
+    LookupShardStrategy, UnknownShardKeyException
+from alchemist_stack.repository.tracking import ChangeTracker
+from alchemist_stack.repository.models import Base, CompressedBinary, CompressedJSON, CompressedText, CompressedValue,\
+    create_tables, train_dictionary
+from alchemist_stack.repository.models.autotable import create_repository
+from alchemist_stack.repository.models.bootstrap import bootstrap_schema
+from alchemist_stack.repository.models.domain import DomainModel
+from alchemist_stack.repository.models.registry import model_metadata
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from os import path
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, event, select, text
+from sqlalchemy.exc import IntegrityError
+from tempfile import TemporaryDirectory
+import asyncio
+import json
+import operator
+import sqlite3
+import threading
+import time
+import unittest
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+class RecordTable(Base):
+    __tablename__ = 'record'
+
+    primary_key = Column('id', Integer, primary_key=True)
+    name = Column(String(64), nullable=False)
+    value = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return '<Record(name={name}, value={value})>'.format(name=self.name, value=self.value)
+
+class EventTable(Base):
+    __tablename__ = 'event'
+
+    primary_key = Column('id', Integer, primary_key=True)
+    timestamp = Column(DateTime, nullable=False, default=datetime.now)
+
+class CounterTable(Base):
+    __tablename__ = 'counter'
+
+    primary_key = Column('id', Integer, primary_key=True)
+    hits = Column(Integer, nullable=False, default=0)
+    version = Column(Integer, nullable=False)
+
+    __mapper_args__ = {'version_id_col': version}
+
+class NoteTable(Base):
+    __tablename__ = 'note'
+
+    primary_key = Column('id', Integer, primary_key=True)
+    title = Column(String(64))
+    body = Column(String(64))
+
+SAMPLE_EVENTS = [{'type': 'page_view', 'user_agent': 'Mozilla/5.0 (X11; Linux x86_64)', 'path': '/items/{0}'.format(i),
+                  'referrer': 'https://example.com/search?q=item', 'session': i} for i in range(200)]
+EVENT_DICTIONARY = train_dictionary(json.dumps(event, separators=(',', ':')) for event in SAMPLE_EVENTS)
+
+class DocumentTable(Base):
+    __tablename__ = 'document'
+
+    primary_key = Column('id', Integer, primary_key=True)
+    body = Column(CompressedText(threshold=64))
+    attributes = Column(CompressedJSON(threshold=64, lazy=True))
+    event = Column(CompressedJSON(threshold=0, dictionary=EVENT_DICTIONARY))
+    blob = Column(CompressedBinary())
+
+class JobTable(QueueItem, Base):
+    __tablename__ = 'job'
+
+    primary_key = Column('id', Integer, primary_key=True)
+    payload = Column(String(64), nullable=False)
+
+class ShiftJobTable(QueueItem, Base):
+    __tablename__ = 'shift_job'
+
+    shift = Column(Integer, primary_key=True)
+    sequence = Column(Integer, primary_key=True)
+
+class JobQueue(QueueRepositoryBase):
+
+    @classmethod
+    def instance(cls, context: Context, *args, **kwargs):
+        return cls(context=context, model=JobTable, *args, **kwargs)
+
+def sum_values(rows):
+    return sum(row[2] for row in rows)
+
+def primary_keys(rows):
+    return [row[0] for row in rows]
+
+class Record(DomainModel, table=RecordTable):
+    pass
+
+class Event(DomainModel, table=EventTable):
+    pass
+
+class RecordRepository(RepositoryBase):
+
+    @classmethod
+    def instance(cls, context: Context, *args, **kwargs):
+        return cls(context=context, *args, **kwargs)
+
+    def create_record(self, obj: RecordTable):
+        return self._create_object(obj=obj)
+
+    def get_records(self, keys: list):
+        return self._get_objects(RecordTable, keys)
+
+    def load_record(self, key: int):
+        return self._loader(RecordTable).load(key)
+
+class ShardedRecordRepository(ShardedRepositoryBase):
+
+    @classmethod
+    def instance(cls, context: Context, *args, **kwargs):
+        return cls(contexts=[context], *args, **kwargs)
+
+def create_sqlite_context(directory: str, name: str = 'records.db') -> Context:
+    context = Context(settings={
+        'drivername': 'sqlite',
+        'database': path.join(directory, name),
+    })
+    create_tables(engine=context.engine)
+    return context
+
+class TestWriteBuffer(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.context = create_sqlite_context(self.directory.name)
+
+    def test_buffered_creates_are_committed(self):
+        buffer = WriteBuffer(context=self.context, max_rows=50, flush_interval=0.01)
+        repo = RecordRepository.instance(context=self.context, write_buffer=buffer)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = list(pool.map(lambda i: repo.create_record(RecordTable(name=str(i), value=i)), range(200)))
+        for future in futures:
+            self.assertIsInstance(future.result(timeout=5), RecordTable)
+        buffer.close()
+
+        session = self.context()
+        self.assertEqual(200, session.query(RecordTable).count(),
+                         msg='Not every buffered object was committed.')
+        session.close()
+        self.assertLess(buffer.flushed_batches, 200,
+                        msg='The buffer did not group objects into batches.')
+
+    def test_close_drains_and_rejects(self):
+        buffer = WriteBuffer(context=self.context, max_rows=1000, flush_interval=60)
+        futures = [buffer.submit(RecordTable(name='drain', value=i)) for i in range(10)]
+        buffer.close()
+
+        self.assertTrue(all(future.done() for future in futures),
+                        msg='Closing the buffer did not flush the pending objects.')
+        with self.assertRaises(WriteBufferClosedException):
+            buffer.submit(RecordTable(name='late', value=0))
+
+    def test_close_racing_submits_leaves_nothing_behind(self):
+        buffer = WriteBuffer(context=self.context, max_rows=20, flush_interval=0.01, max_pending=5)
+        futures = []
+        started = threading.Event()
+
+        def submit_until_closed():
+            started.set()
+            while True:
+                try:
+                    futures.append(buffer.submit(RecordTable(name='race', value=0), timeout=1))
+                except WriteBufferClosedException:
+                    return
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            submitters = [pool.submit(submit_until_closed) for _ in range(4)]
+            started.wait()
+            time.sleep(0.05)
+            buffer.close(timeout=1)
+            for submitter in submitters:
+                submitter.result(timeout=5)
+        self.assertTrue(all(future.done() for future in futures),
+                        msg='An object submitted while the buffer closed was never flushed.')
+
+    def test_failed_batch_sets_exception(self):
+        buffer = WriteBuffer(context=self.context, max_rows=10, flush_interval=0.01)
+        future = buffer.submit(RecordTable(name=None, value=0))
+        buffer.close()
+
+        self.assertIsNotNone(future.exception(timeout=5),
+                             msg='A failed flush did not propagate its error to the caller.')
+
+    def test_flush_thread_survives_admission_failure(self):
+        context = Context(settings={'drivername': 'sqlite', 'database': path.join(self.directory.name, 'records.db')},
+                          admission=AdmissionController(limit=1, max_queue=0, queue_timeout=0))
+        buffer = WriteBuffer(context=context, max_rows=10, flush_interval=0.01)
+        session = context.open_session()
+        rejected = buffer.submit(RecordTable(name='rejected', value=0))
+        self.assertIsInstance(rejected.exception(timeout=5), ContextSaturatedException)
+
+        context.close_session(session)
+        accepted = buffer.submit(RecordTable(name='accepted', value=0))
+        self.assertIsInstance(accepted.result(timeout=5), RecordTable,
+                              msg='The flush thread died with the failed batch.')
+        buffer.close()
+        context.engine.dispose()
+
+    def tearDown(self):
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.context
+        del self.directory
+
+class TestChangeTracker(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.context = create_sqlite_context(self.directory.name)
+        self.repo = RecordRepository.instance(context=self.context)
+        session = self.context()
+        session.add_all([RecordTable(primary_key=i, name=str(i), value=i) for i in range(1, 11)])
+        session.commit()
+        session.close()
+
+    def load(self):
+        session = self.context()
+        records = session.query(RecordTable).order_by(RecordTable.primary_key).all()
+        session.close()
+        return records
+
+    def test_unchanged_objects_are_not_saved(self):
+        self.repo.change_tracker.track_all(self.load())
+        self.assertEqual({}, self.repo.change_tracker.pending(),
+                         msg='Unchanged objects were reported as changed.')
+        self.assertEqual(0, self.repo._save_tracked())
+
+    def test_changes_are_grouped_and_saved(self):
+        tracker = ChangeTracker()
+        records = tracker.track_all(self.load())
+        for record in records[:4]:
+            record.value += 100
+        records[9].name = 'ten'
+
+        groups = tracker.pending()
+        self.assertEqual(2, len(groups), msg='The changed objects were not grouped by changed columns.')
+        self.assertEqual({frozenset({'value'}), frozenset({'name'})}, {keys for (_, keys) in groups.keys()})
+        self.assertEqual(5, self.repo._save_tracked(tracker=tracker))
+        self.assertEqual({}, tracker.pending(), msg='Saved objects were not re-snapshotted.')
+
+        values = {record.primary_key: (record.name, record.value) for record in self.load()}
+        self.assertEqual(('1', 101), values[1])
+        self.assertEqual(('5', 5), values[5])
+        self.assertEqual(('ten', 10), values[10])
+
+    def test_in_place_changes_are_detected(self):
+        session = self.context()
+        session.add(DocumentTable(primary_key=1, event={'tags': ['a']}))
+        session.commit()
+        document = session.query(DocumentTable).get(1)
+        session.close()
+
+        tracker = ChangeTracker()
+        tracker.track(document)
+        document.event['tags'].append('b')
+        self.assertEqual([(DocumentTable, frozenset({'event'}))], list(tracker.pending().keys()),
+                         msg='A JSON value changed in place was not detected.')
+        self.assertEqual(1, self.repo._save_tracked(tracker=tracker))
+        session = self.context()
+        self.assertEqual({'tags': ['a', 'b']}, session.query(DocumentTable).get(1).event)
+        session.close()
+
+    def test_domain_models_are_diffed_without_orm_instances(self):
+        built = []
+
+        class TrackedRecord(Record):
+            def to_orm(self):
+                built.append(self)
+                return super().to_orm()
+
+        tracker = ChangeTracker()
+        tracker.track_all(TrackedRecord(row.primary_key, row.name, row.value) for row in self.load())
+        self.assertEqual({}, tracker.pending())
+        self.assertEqual([], built, msg='ORM instances were built to diff unchanged domain models.')
+
+    def tearDown(self):
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.repo
+        del self.context
+        del self.directory
+
+class TestShardedRepository(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.contexts = [create_sqlite_context(self.directory.name, name='shard{i}.db'.format(i=i)) for i in range(3)]
+        self.repo = ShardedRecordRepository(contexts=self.contexts, strategy=HashShardStrategy(),
+                                            shard_attribute='name')
+
+    def test_strategies(self):
+        hashed = HashShardStrategy()
+        self.assertEqual(hashed.shard_for('tenant-a', 3), hashed.shard_for('tenant-a', 3),
+                         msg='The hash strategy is not stable.')
+        ranged = RangeShardStrategy(boundaries=[100, 200])
+        self.assertEqual([0, 1, 1, 2], [ranged.shard_for(k, 3) for k in (99, 100, 199, 200)])
+        lookup = LookupShardStrategy(table={'a': 2})
+        self.assertEqual(2, lookup.shard_for('a', 3))
+        with self.assertRaises(UnknownShardKeyException):
+            lookup.shard_for('b', 3)
+
+    def test_bulk_create_and_fan_out(self):
+        records = [RecordTable(primary_key=i, name='tenant-{i}'.format(i=i % 7), value=i) for i in range(1, 61)]
+        counts = self.repo._bulk_create_objects(records)
+        self.assertEqual(60, sum(counts.values()))
+        self.assertGreater(len(counts), 1, msg='Every object was routed to the same shard.')
+
+        rows = self.repo._read_all_shards(self.repo._read_object(RecordTable),
+                                          order_by=[RecordTable.value], descending=True, limit=5)
+        self.assertEqual([60, 59, 58, 57, 56], [row.value for row in rows],
+                         msg='The shard results were not merged in order.')
+
+    def test_fan_out_keeps_the_deadline(self):
+        records = [RecordTable(primary_key=i, name='tenant-{i}'.format(i=i), value=i) for i in range(1, 7)]
+        with self.assertRaises(DeadlineExceededException, msg='The shard inserts ran without the deadline.'):
+            with deadline(0):
+                self.repo._bulk_create_objects(records)
+        with self.assertRaises(DeadlineExceededException, msg='The shard reads ran without the deadline.'):
+            with deadline(0):
+                self.repo._read_all_shards(self.repo._read_object(RecordTable))
+
+    def test_create_routes_to_one_shard(self):
+        self.repo._create_sharded_object(RecordTable(name='tenant-x', value=1))
+        index = self.repo.shard_index('tenant-x')
+        for (i, context) in enumerate(self.contexts):
+            session = context()
+            self.assertEqual(1 if i == index else 0, session.query(RecordTable).count())
+            session.close()
+
+    def tearDown(self):
+        for context in self.contexts:
+            context.engine.dispose()
+        self.directory.cleanup()
+        del self.repo
+        del self.contexts
+        del self.directory
+
+class TestAutoRepository(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.context = create_sqlite_context(self.directory.name)
+        self.repo = create_repository(RecordTable).instance(context=self.context)
+        self.repo.bulk_create([{'name': 'a', 'value': 1}, {'name': 'b', 'value': 2}, {'name': 'a', 'value': 3}])
+
+    def test_generated_class(self):
+        self.assertEqual('RecordTableRepository', type(self.repo).__name__)
+        self.assertIsInstance(self.repo, RepositoryBase)
+
+    def test_reads(self):
+        self.assertEqual(1, self.repo.get(1).value)
+        self.assertIsNone(self.repo.get(99))
+        self.assertEqual([3, None, 1], [row.value if row is not None else None
+                                        for row in self.repo.get_many([3, 99, 1])])
+        self.assertEqual([1, 3], [row.value for row in self.repo.list(name='a')])
+        self.assertEqual([2], [row.value for row in self.repo.list(limit=1, offset=1)])
+        self.assertEqual(3, self.repo.count())
+        self.assertEqual(2, self.repo.count(name='a'))
+
+    def test_writes(self):
+        created = self.repo.create(RecordTable(name='c', value=4))
+        self.assertEqual(4, created.primary_key)
+        self.assertEqual(1, self.repo.update(1, value=10))
+        self.assertEqual(2, self.repo.bulk_update([{'primary_key': 2, 'value': 20}, {'primary_key': 3, 'name': 'z'}]))
+        self.assertEqual(1, self.repo.delete(4))
+        self.assertEqual([('a', 10), ('b', 20), ('z', 3)], [(row.name, row.value) for row in self.repo.list()])
+
+    def test_get_many_past_the_parameter_limit(self):
+        self.repo.bulk_create([{'name': str(i), 'value': i} for i in range(2000)])
+        selects = []
+
+        @event.listens_for(self.context.engine, 'before_cursor_execute')
+        def count_selects(conn, cursor, statement, *args):
+            if statement.startswith('SELECT'):
+                selects.append(statement)
+
+        keys = list(range(2003, 0, -1))
+        self.assertEqual(keys, [row.primary_key for row in self.repo.get_many(keys)])
+        self.assertEqual(3, len(selects), msg='The IN list was not split to the SQLite parameter limit.')
+
+    def test_bulk_create_mixed_columns(self):
+        notes = create_repository(NoteTable).instance(context=self.context)
+        self.assertEqual(5, notes.bulk_create([NoteTable(title='A'), NoteTable(body='B'), {'title': 'C', 'body': 'C'},
+                                               {'body': 'D', 'title': 'D'}, NoteTable()]))
+        self.assertEqual([('A', None), (None, 'B'), ('C', 'C'), ('D', 'D'), (None, None)],
+                         [(row.title, row.body) for row in notes.list()])
+
+        value = create_repository(RecordTable).instance(context=self.context)
+        value.bulk_create([RecordTable(name='d'), RecordTable(name='e', value=5)])
+        self.assertEqual([0, 5], [row.value for row in value.list(name='d') + value.list(name='e')])
+
+    def test_explicit_none_is_inserted(self):
+        with self.assertRaises(IntegrityError, msg='An explicit None was replaced by the column default.'):
+            self.repo.bulk_create([RecordTable(name='f', value=None)])
+
+    def test_update_without_primary_key(self):
+        with self.assertRaises(UnknownUpdateKeyException):
+            self.repo.bulk_update([{'primary_key': 1, 'value': 10}, {'value': 20}])
+        self.assertEqual(1, self.repo.list(name='a')[0].value, msg='A row was updated anyway.')
+
+    def tearDown(self):
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.repo
+        del self.context
+        del self.directory
+
+class TestVersionedUpdates(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.context = create_sqlite_context(self.directory.name)
+        self.repo = RecordRepository.instance(context=self.context,
+                                              retry_policy=RetryPolicy(retries=100, base_delay=0.001))
+        session = self.context()
+        session.add_all([CounterTable(primary_key=i) for i in (1, 2, 3)])
+        session.commit()
+        session.close()
+
+    def current(self, key: int):
+        session = self.context()
+        try:
+            counter = session.query(CounterTable).get(key)
+            return (counter.hits, counter.version)
+        finally:
+            session.close()
+
+    def test_concurrent_increments_are_not_lost(self):
+        def increment(_):
+            return self.repo._update_versioned(CounterTable, key=1, values=lambda row: {'hits': row['hits'] + 1})
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(increment, range(40)))
+        self.assertEqual((40, 41), self.current(1))
+
+    def test_stale_version_is_reported(self):
+        self.assertEqual(2, self.repo._update_versioned(CounterTable, key=2, values={'hits': 5}, version=1))
+        with self.assertRaises(StaleObjectException) as cm:
+            self.repo._update_versioned(CounterTable, key=2, values={'hits': 7}, version=1)
+        self.assertEqual([{'key': 2, 'expected': 1, 'actual': 2}], cm.exception.conflicts)
+        self.assertEqual((5, 2), self.current(2))
+
+    def test_bulk_update_conflicts_roll_back(self):
+        self.assertEqual(2, self.repo._bulk_update_versioned(CounterTable, [
+            {'primary_key': 1, 'version': 1, 'hits': 10},
+            {'primary_key': 2, 'version': 1, 'hits': 20},
+        ]))
+        with self.assertRaises(StaleObjectException) as cm:
+            self.repo._bulk_update_versioned(CounterTable, [
+                {'primary_key': 1, 'version': 1, 'hits': 11},
+                {'primary_key': 3, 'version': 1, 'hits': 30},
+            ])
+        self.assertEqual([{'key': 1, 'expected': 1, 'actual': 2}], cm.exception.conflicts)
+        self.assertEqual((0, 1), self.current(3), msg='The conflicting batch was partially applied.')
+        self.assertEqual((10, 2), self.current(1))
+
+    def tearDown(self):
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.repo
+        del self.context
+        del self.directory
+
+class TestCountModes(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.context = create_sqlite_context(self.directory.name)
+        self.repo = create_repository(RecordTable).instance(context=self.context)
+        self.repo.bulk_create([{'name': 'a' if i % 2 else 'b', 'value': i} for i in range(10)])
+
+    def insert_behind_the_context(self, name: str):
+        connection = sqlite3.connect(path.join(self.directory.name, 'records.db'))
+        connection.execute("INSERT INTO record (name, value) VALUES (?, 0)", (name,))
+        connection.commit()
+        connection.close()
+
+    def test_cached_count(self):
+        self.assertEqual(5, self.repo.count(mode=COUNT_CACHED, name='a'))
+        self.insert_behind_the_context('a')
+        self.assertEqual(5, self.repo.count(mode=COUNT_CACHED, name='a'), msg='The cached count was not reused.')
+        self.assertEqual(6, self.repo.count(mode=COUNT_EXACT, name='a'))
+        self.assertEqual(6, self.repo.count(mode=COUNT_CACHED, ttl=0, name='a'), msg='The expired count was reused.')
+
+        self.repo.create(RecordTable(name='a', value=1))
+        self.assertEqual(7, self.repo.count(mode=COUNT_CACHED, name='a'),
+                         msg='A write through the Context did not invalidate the cached count.')
+        self.assertEqual(12, self.repo._count_objects(RecordTable, mode=COUNT_CACHED))
+
+    def test_cached_hit_opens_no_session(self):
+        self.repo.count(mode=COUNT_CACHED, name='a')
+        opened = []
+        open_session = self.context.open_session
+        self.context.open_session = lambda *args, **kwargs: opened.append(1) or open_session(*args, **kwargs)
+        self.assertEqual(5, self.repo.count(mode=COUNT_CACHED, name='a'))
+        self.assertEqual([], opened, msg='A cached count opened a Session.')
+
+    def test_estimated_count(self):
+        self.assertEqual(10, self.repo.count(mode=COUNT_ESTIMATED), msg='The unanalyzed table did not fall back.')
+        self.insert_behind_the_context('c')
+        with self.context.engine.connect() as connection:
+            connection.execute('ANALYZE')
+        self.insert_behind_the_context('c')
+        self.assertEqual(11, self.repo.count(mode=COUNT_ESTIMATED), msg='The statistics were not read.')
+        self.assertEqual(12, self.repo.count(mode=COUNT_EXACT))
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            self.repo.count(mode='lionfish')
+
+    def tearDown(self):
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.repo
+        del self.context
+        del self.directory
+
+class TestParallelScan(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.context = create_sqlite_context(self.directory.name)
+        self.repo = RecordRepository.instance(context=self.context)
+        session = self.context()
+        # Sparse keys: 100 rows from 1 to 10, then 1000 onwards.
+        session.bulk_insert_mappings(RecordTable, [{'primary_key': pk, 'name': str(pk), 'value': pk}
+                                                   for pk in list(range(1, 11)) + list(range(1000, 1090))])
+        session.commit()
+        session.close()
+
+    def test_partition_key_ranges(self):
+        with self.context.engine.connect() as connection:
+            minmax = partition_key_ranges(connection, RecordTable, partitions=4, split=SPLIT_MINMAX)
+            quantile = partition_key_ranges(connection, RecordTable, partitions=4, split=SPLIT_QUANTILE)
+        self.assertEqual([(1, 274), (274, 547), (547, 820), (820, None)], minmax)
+        self.assertEqual([(1, 1015), (1015, 1040), (1040, 1065), (1065, None)], quantile)
+
+    def test_quantiles_in_one_query(self):
+        statements = []
+        event.listen(self.context.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        with self.context.engine.connect() as connection:
+            quantile = partition_key_ranges(connection, RecordTable, partitions=20, split=SPLIT_QUANTILE)
+        self.assertEqual(20, len(quantile))
+        self.assertEqual(1, len(statements), msg='Every quantile boundary was read with a query of its own.')
+
+    def test_minmax_needs_integer_keys(self):
+        class TagTable(Base):
+            __tablename__ = 'scan_tag'
+
+            name = Column(String(16), primary_key=True)
+
+        with self.context.engine.connect() as connection:
+            with self.assertRaises(ValueError):
+                partition_key_ranges(connection, TagTable, partitions=4, split=SPLIT_MINMAX)
+
+    def test_map_reduce(self):
+        expected = sum(range(1, 11)) + sum(range(1000, 1090))
+        self.assertEqual(expected, self.repo._scan_objects(RecordTable, map_batch=sum_values, reduce=operator.add,
+                                                           initial=0, max_workers=2, batch_size=7))
+        self.assertEqual(expected, self.repo._scan_objects(RecordTable, map_batch=sum_values, reduce=operator.add,
+                                                           initial=0, max_workers=3, split=SPLIT_QUANTILE))
+
+    def test_batches_in_key_order(self):
+        batches = self.repo._scan_objects(RecordTable, map_batch=primary_keys, max_workers=2, batch_size=16)
+        self.assertTrue(all(len(batch) <= 16 for batch in batches))
+        self.assertEqual(list(range(1, 11)) + list(range(1000, 1090)), [pk for batch in batches for pk in batch])
+
+    def tearDown(self):
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.repo
+        del self.context
+        del self.directory
+
+class TestQueueRepository(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.context = create_sqlite_context(self.directory.name)
+        self.queue = JobQueue.instance(context=self.context, visibility_timeout=60)
+        self.queue.enqueue(JobTable(payload=str(i)) for i in range(100))
+
+    def test_claims_do_not_overlap(self):
+        def drain(_):
+            claimed = []
+            while True:
+                jobs = self.queue.claim(7)
+                if not jobs:
+                    return claimed
+                claimed.extend(job.payload for job in jobs)
+                self.assertEqual(len(jobs), self.queue.ack(jobs))
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            claimed = [payload for worker in pool.map(drain, range(4)) for payload in worker]
+        self.assertEqual(sorted(str(i) for i in range(100)), sorted(claimed), msg='A job was claimed twice or lost.')
+        self.assertEqual(0, self.queue.depth())
+
+    def test_visibility_timeout(self):
+        jobs = self.queue.claim(10, visibility_timeout=0)
+        self.assertEqual(['0', '1'], [job.payload for job in jobs[:2]])
+        self.assertEqual(1, jobs[0].attempts)
+        reclaimed = self.queue.claim(10)
+        self.assertEqual([job.primary_key for job in jobs], [job.primary_key for job in reclaimed],
+                         msg='Rows whose visibility timeout expired were not reclaimed.')
+        self.assertEqual(2, reclaimed[0].attempts)
+        self.assertEqual(0, self.queue.ack(jobs), msg='A lost claim acknowledged rows it no longer holds.')
+        self.assertEqual(10, self.queue.ack(reclaimed))
+
+    def test_composite_primary_key_is_refused(self):
+        with self.assertRaises(UnknownModelException):
+            QueueRepositoryBase(context=self.context, model=ShiftJobTable)
+        with self.assertRaises(UnknownModelException):
+            QueueRepositoryBase(context=self.context, model=RecordTable)
+
+    def test_nack(self):
+        jobs = self.queue.claim(5)
+        self.assertEqual(95, self.queue.depth())
+        self.assertEqual(5, self.queue.nack(jobs))
+        self.assertEqual(100, self.queue.depth())
+        self.assertEqual(5, self.queue.nack(self.queue.claim(5), delay=60))
+        self.assertEqual(95, self.queue.depth())
+
+    def tearDown(self):
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.queue
+        del self.context
+        del self.directory
+
+class TestDomainModel(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.context = create_sqlite_context(self.directory.name)
+
+    def test_slots(self):
+        record = Record(1, 'a', 2)
+        self.assertEqual(('primary_key', 'name', 'value'), Record.__fields__)
+        self.assertFalse(hasattr(record, '__dict__'), msg='Domain models carry a per-instance __dict__.')
+        with self.assertRaises(AttributeError):
+            record.other = 1
+        self.assertEqual(Record(primary_key=1, name='a', value=2), record)
+        self.assertEqual(0, Record(name='b').value, msg='The scalar column default was not applied.')
+
+    def test_callable_default_is_per_instance(self):
+        first = Event()
+        second = Event()
+        self.assertIsInstance(first.timestamp, datetime)
+        self.assertIsNot(first.timestamp, second.timestamp)
+
+    def test_conversions(self):
+        records = [Record(None, str(i), i) for i in range(10)]
+        session = self.context()
+        session.bulk_insert_mappings(RecordTable, Record.to_mappings(records))
+        session.execute(RecordTable.__table__.insert(), Record.to_mappings([Record(None, 'core', 10)],
+                                                                           by_column=True))
+        session.commit()
+        rows = session.execute(select(Record.columns()).order_by(RecordTable.primary_key)).fetchall()
+        loaded = Record.from_rows(rows)
+        self.assertEqual([str(i) for i in range(10)] + ['core'], [record.name for record in loaded])
+        self.assertEqual(11, loaded[-1].primary_key)
+
+        orm = session.query(RecordTable).get(3)
+        self.assertEqual(loaded[2], Record.from_orm(orm))
+        self.assertEqual(loaded, Record.from_orms(session.query(RecordTable).order_by(RecordTable.primary_key)))
+        self.assertEqual({'primary_key': 3, 'name': '2', 'value': 2}, loaded[2].to_mapping())
+        self.assertEqual({'id': 3, 'name': '2', 'value': 2}, loaded[2].to_mapping(by_column=True))
+        session.close()
+
+        copy = loaded[2].to_orm()
+        self.assertIsInstance(copy, RecordTable)
+        self.assertEqual((3, '2', 2), (copy.primary_key, copy.name, copy.value))
+
+    def tearDown(self):
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.context
+        del self.directory
+
+class TestModelRegistry(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.context = create_sqlite_context(self.directory.name)
+        self.repo = RecordRepository.instance(context=self.context)
+
+    def test_metadata(self):
+        metadata = model_metadata(RecordTable)
+        self.assertIs(metadata, model_metadata(RecordTable), msg='The metadata was rebuilt on lookup.')
+        self.assertEqual(['primary_key', 'name', 'value'], list(metadata.columns.keys()))
+        self.assertEqual((('primary_key', RecordTable.__table__.c.id),), metadata.primary_keys)
+        self.assertEqual({'id': 'primary_key', 'name': 'name', 'value': 'value'}, metadata.attribute_names)
+        self.assertEqual(['value'], list(metadata.defaults.keys()))
+        self.assertIs(RecordTable.__table__.c.name, metadata.column(RecordTable.name))
+        self.assertIsNone(metadata.column('other'))
+        self.assertIs(CounterTable.__table__.c.version, model_metadata(CounterTable).version_column)
+        self.assertIsNone(model_metadata(object))
+        self.assertIsNone(model_metadata(RecordTable(name='a')))
+        self.assertIsNone(model_metadata([]))
+
+    def test_late_model(self):
+        class LateTable(Base):
+            __tablename__ = 'late_record'
+
+            primary_key = Column('id', Integer, primary_key=True)
+            label = Column('label_text', String(16), default='none')
+
+        metadata = model_metadata(LateTable)
+        self.assertEqual({'id': 'primary_key', 'label_text': 'label'}, metadata.attribute_names)
+
+        class Late(DomainModel, table=LateTable):
+            pass
+
+        self.assertEqual(('primary_key', 'label'), Late.__fields__)
+        self.assertEqual({'id': 1, 'label_text': 'none'}, Late(1).to_mapping(by_column=True))
+        self.assertIsNotNone(self.repo._read_object(LateTable))
+        self.assertIsNotNone(self.repo._update_object(LateTable, {'label': 'a', LateTable.primary_key: 1}))
+
+    def test_validation(self):
+        with self.assertRaises(UnknownColumnException):
+            self.repo._update_object(RecordTable, {'other': 1})
+        with self.assertRaises(UnknownUpdateKeyException):
+            self.repo._update_object(RecordTable, {EventTable.timestamp: 1})
+        with self.assertRaises(UnknownModelException):
+            self.repo._read_object(object)
+        with self.assertRaises(UnknownModelException):
+            self.repo._create_object(object())
+
+    def tearDown(self):
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.repo
+        del self.context
+        del self.directory
+
+class TestCompressedColumns(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.context = create_sqlite_context(self.directory.name)
+
+    def stored(self, column: str) -> bytes:
+        return self.context.engine.execute(text('SELECT {column} FROM document'.format(column=column))).scalar()
+
+    def test_round_trip(self):
+        body = 'lorem ipsum dolor sit amet ' * 100
+        session = self.context()
+        session.add(DocumentTable(body=body, attributes={'tags': ['a'] * 100}, event=SAMPLE_EVENTS[0],
+                                  blob=bytes(2000)))
+        session.commit()
+        session.close()
+
+        self.assertLess(len(self.stored('body')), len(body) // 10, msg='The text was not compressed.')
+        self.assertEqual(0x01, self.stored('body')[0])
+        session = self.context()
+        document = session.query(DocumentTable).one()
+        self.assertEqual(body, document.body)
+        self.assertEqual(SAMPLE_EVENTS[0], document.event)
+        self.assertEqual(bytes(2000), document.blob)
+        session.close()
+
+    def test_threshold(self):
+        session = self.context()
+        session.add(DocumentTable(body='short', blob=b'\x00' * 10))
+        session.commit()
+        session.close()
+        self.assertEqual(b'\x00short', self.stored('body'), msg='A value under the threshold was compressed.')
+        self.assertEqual(11, len(self.stored('blob')))
+
+    def test_lazy(self):
+        attributes = {'tags': ['tag'] * 100, 'owner': 'a'}
+        session = self.context()
+        session.add(DocumentTable(attributes=attributes))
+        session.commit()
+        session.close()
+
+        session = self.context()
+        document = session.query(DocumentTable).one()
+        self.assertIsInstance(document.attributes, CompressedValue)
+        self.assertFalse(document.attributes.loaded)
+        session.add(DocumentTable(attributes=document.attributes))
+        session.commit()
+        self.assertFalse(document.attributes.loaded, msg='The compressed value was decompressed to be copied.')
+        self.assertEqual('a', document.attributes['owner'])
+        self.assertEqual(attributes, document.attributes)
+        self.assertEqual(['a', 'a'], [row.attributes.get('owner') for row in session.query(DocumentTable)])
+        session.close()
+
+    def test_dictionary(self):
+        event = dict(SAMPLE_EVENTS[0], session=1000)
+        session = self.context()
+        session.add(DocumentTable(event=event))
+        session.commit()
+        session.close()
+
+        plain = CompressedJSON(threshold=0).compress(json.dumps(event, separators=(',', ':')).encode('utf-8'))
+        self.assertLess(len(self.stored('event')), len(plain), msg='The dictionary did not help a small payload.')
+        session = self.context()
+        self.assertEqual(event, session.query(DocumentTable).one().event)
+        session.close()
+        with self.assertRaises(ValueError):
+            CompressedJSON(dictionary=b'other').decompress(self.stored('event'))
+
+    def tearDown(self):
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.context
+        del self.directory
+
+class TestIndexAdvisor(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.context = create_sqlite_context(self.directory.name)
+        session = self.context()
+        session.bulk_insert_mappings(RecordTable, [{'name': 'record-{i}'.format(i=i), 'value': i % 100}
+                                                   for i in range(20000)])
+        session.commit()
+        session.close()
+        self.workload = WorkloadRecorder()
+        self.workload.watch(self.context.engine)
+
+    def test_analyze_statement(self):
+        session = self.context()
+        query = session.query(RecordTable).filter(RecordTable.name == 'a', RecordTable.value > 3)\
+            .order_by(RecordTable.value.desc())
+        session.close()
+        usage = analyze_statement(query.statement)['record']
+        self.assertEqual(['RecordTable'], usage['models'])
+        self.assertEqual(['name'], usage['equality'])
+        self.assertEqual(['value'], usage['range'])
+        self.assertEqual(['value'], usage['order'])
+
+    def test_candidates_are_ranked(self):
+        session = self.context()
+        for i in range(20):
+            session.query(RecordTable).filter(RecordTable.name == 'record-{i}'.format(i=i)).all()
+        session.query(RecordTable).filter(RecordTable.value == 3).all()
+        session.query(RecordTable).filter(RecordTable.primary_key == 3).all()
+        session.close()
+        self.assertEqual(3, len(self.workload))
+
+        candidates = IndexAdvisor().advise(self.workload)
+        self.assertEqual([('name',), ('value',)], [candidate.columns for candidate in candidates],
+                         msg='The primary key was suggested, or the candidates are not ranked by time.')
+        self.assertEqual(20, candidates[0].executions)
+        self.assertEqual(['RecordTable'], candidates[0].models)
+        self.assertEqual('CREATE INDEX ix_record_name ON record (name)', candidates[0].ddl())
+
+    def test_validate_candidate(self):
+        session = self.context()
+        session.query(RecordTable).filter(RecordTable.name == 'record-7').all()
+        session.close()
+        (candidate,) = IndexAdvisor().advise(self.workload)
+        IndexAdvisor().validate(candidate, engine=self.context.engine, repeat=3)
+        self.assertGreater(candidate.improvement, 1.0, msg='The index did not speed the query up.')
+        self.assertEqual(0, len(RecordTable.__table__.indexes), msg='Validation changed the model\'s table.')
+        self.assertEqual(0, self.context.engine.execute(text(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'index' AND name = 'ix_record_name'")).scalar())
+
+    def tearDown(self):
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.context
+        del self.workload
+        del self.directory
+
+class TestBatchedGets(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.context = create_sqlite_context(self.directory.name)
+        session = self.context()
+        session.bulk_insert_mappings(RecordTable, [{'name': str(i), 'value': i} for i in range(1, 3001)])
+        session.commit()
+        session.close()
+        self.repo = RecordRepository.instance(context=self.context)
+        self.selects = []
+
+        @event.listens_for(self.context.engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                self.selects.append(statement)
+
+    def test_get_many_preserves_order(self):
+        records = self.repo.get_records([3, 5000, 1, 3])
+        self.assertEqual(['3', None, '1', '3'], [record and record.name for record in records])
+        self.assertIs(records[0], records[3])
+        self.assertEqual(1, len(self.selects))
+
+    def test_get_many_chunks_in_lists(self):
+        keys = list(range(2500, 0, -1))
+        records = self.repo.get_records(keys)
+        self.assertEqual(keys, [record.value for record in records])
+        self.assertEqual(3, len(self.selects), msg='The IN list was not split to the SQLite parameter limit.')
+
+    def test_loader_coalesces_a_request(self):
+        with loader_scope():
+            futures = [self.repo.load_record(key) for key in (4, 2, 4, 9999)]
+            self.assertEqual([], self.selects, msg='A load ran before its result was needed.')
+            self.assertEqual(['4', '2', '4', None], [future.result() and future.result().name for future in futures])
+            self.assertIs(self.repo._loader(RecordTable), self.repo._loader(RecordTable))
+            self.assertEqual('2', self.repo.load_record(2).result().name)
+        self.assertEqual(1, len(self.selects))
+        self.assertIsNot(self.repo._loader(RecordTable), self.repo._loader(RecordTable))
+
+    def test_loader_coalesces_an_event_loop_tick(self):
+        async def resolve(key: int):
+            return (await self.repo._loader(RecordTable).load_async(key)).name
+
+        async def request():
+            with loader_scope():
+                return await asyncio.gather(*[resolve(key) for key in range(1, 21)])
+
+        self.assertEqual([str(key) for key in range(1, 21)], asyncio.run(request()))
+        self.assertEqual(1, len(self.selects))
+
+    def test_loader_errors_are_not_cached(self):
+        calls = []
+
+        def batch_load(keys):
+            calls.append(keys)
+            if len(calls) == 1:
+                raise RuntimeError('unavailable')
+            return keys
+
+        loader = DataLoader(batch_load)
+        with self.assertRaises(RuntimeError):
+            loader.load(1).result()
+        self.assertEqual(1, loader.load(1).result())
+        self.assertEqual(2, loader.batches)
+
+    def tearDown(self):
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.repo
+        del self.context
+        del self.directory
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.context = create_sqlite_context(self.directory.name)
+        self.coalesced = []
+        self.flights = SingleFlight(timeout=5, on_coalesced=self.coalesced.append)
+        self.repo = RecordRepository.instance(context=self.context, single_flight=self.flights)
+        self.repo.create_record(RecordTable(name='popular', value=1))
+        self.release = threading.Event()
+        self.selects = []
+
+        @event.listens_for(self.context.engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                self.selects.append(statement)
+                self.release.wait(timeout=5)
+
+    def wait_for_coalesced(self, count: int):
+        deadline = time.monotonic() + 5
+        while self.flights.stats['coalesced'] < count and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+    def test_identical_reads_share_one_execution(self):
+        statement = select([RecordTable.__table__]).where(RecordTable.__table__.c.name == 'popular')
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [pool.submit(self.repo._select, statement) for _ in range(8)]
+            self.wait_for_coalesced(7)
+            self.release.set()
+            results = [future.result() for future in futures]
+        self.assertEqual(1, len(self.selects), msg='The identical reads were not coalesced.')
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual('popular', results[0][0]['name'])
+        self.assertEqual({'executed': 1, 'coalesced': 7, 'timed_out': 0}, self.flights.stats)
+        self.assertEqual(7, len(self.coalesced))
+        self.assertEqual(0, len(self.flights))
+
+    def test_different_parameters_are_not_shared(self):
+        self.release.set()
+        table = RecordTable.__table__
+        self.repo._select(select([table]).where(table.c.value == 1))
+        self.repo._select(select([table]).where(table.c.value == 2))
+        self.assertEqual(2, self.flights.stats['executed'])
+
+    def test_waiting_caller_times_out(self):
+        statement = select([RecordTable.__table__])
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            leader = pool.submit(self.repo._select, statement)
+            while not self.selects:
+                time.sleep(0.001)
+            with self.assertRaises(SingleFlightTimeoutException):
+                self.repo._select(statement, timeout=0.01)
+            self.release.set()
+            self.assertEqual(1, len(leader.result()), msg='The call was cancelled with the caller giving up.')
+        self.assertEqual(1, self.flights.stats['timed_out'])
+
+    def test_counts_are_shared(self):
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(self.repo._count_objects, RecordTable) for _ in range(4)]
+            self.wait_for_coalesced(3)
+            self.release.set()
+            self.assertEqual([1] * 4, [future.result() for future in futures])
+        self.assertEqual(1, len(self.selects))
+
+    def test_tasks_share_one_execution(self):
+        self.release.set()
+        calls = []
+
+        def call():
+            calls.append(1)
+            time.sleep(0.05)
+            return len(calls)
+
+        async def request():
+            return await asyncio.gather(*[self.flights.do_async('key', call) for _ in range(5)])
+
+        self.assertEqual([1] * 5, asyncio.run(request()))
+        self.assertEqual(1, len(calls))
+
+    def test_errors_are_shared(self):
+        started = threading.Event()
+
+        def fail():
+            started.set()
+            self.release.wait(timeout=5)
+            raise RuntimeError('unavailable')
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(self.flights.do, 'key', fail)
+            started.wait(timeout=5)
+            follower = pool.submit(self.flights.do, 'key', fail)
+            self.wait_for_coalesced(1)
+            self.release.set()
+            for future in (leader, follower):
+                with self.assertRaises(RuntimeError):
+                    future.result()
+
+    def tearDown(self):
+        self.release.set()
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.repo
+        del self.context
+        del self.directory
+
+class TestBatchSession(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.context = create_sqlite_context(self.directory.name)
+        self.repo = RecordRepository.instance(context=self.context)
+
+    def committed(self) -> int:
+        connection = sqlite3.connect(path.join(self.directory.name, 'records.db'))
+        count = connection.execute('SELECT count(*) FROM record').fetchone()[0]
+        connection.close()
+        return count
+
+    def test_flushed_objects_are_expunged(self):
+        batch = self.repo._create_batch_session(BatchSession(max_objects=100))
+        session = self.repo.local_session
+        for i in range(1050):
+            self.repo._create_object(RecordTable(name=str(i), value=i), auto_commit=False)
+            self.assertLess(len(session.identity_map) + len(session.new), 100,
+                            msg='The Session grew past one batch.')
+        self.assertEqual(10, batch.stats['checkpoints'])
+        self.assertEqual(100, batch.stats['peak_objects'])
+        self.assertEqual(0, self.committed(), msg='A flush checkpoint committed.')
+        self.repo._commit_session()
+        self.assertEqual(1050, self.committed())
+        self.assertIsNone(self.repo.batch_session)
+
+    def test_memory_limit(self):
+        batch = self.repo._create_batch_session(BatchSession(max_objects=10 ** 6, max_megabytes=0.05))
+        for i in range(200):
+            self.repo._create_object(RecordTable(name='x' * 60, value=i), auto_commit=False)
+        self.assertGreater(batch.stats['checkpoints'], 1)
+        self.assertLessEqual(batch.stats['peak_bytes'], 0.05 * 1024 * 1024 + 2048)
+        self.repo._commit_session()
+        self.assertEqual(200, self.committed())
+
+    def test_commit_checkpoints_and_loaded_objects(self):
+        batch = self.repo._create_batch_session(BatchSession(max_objects=100, mode=BATCH_COMMIT))
+        for i in range(250):
+            self.repo._create_object(RecordTable(name=str(i), value=i), auto_commit=False)
+        self.assertEqual(200, self.committed())
+        self.assertEqual(50, batch.objects)
+
+        self.repo.local_session.query(RecordTable).limit(30).all()
+        self.assertEqual(80, batch.objects, msg='Loaded objects were not tracked.')
+        self.assertTrue(batch.checkpoint(force=True))
+        self.assertEqual(0, len(self.repo.local_session.identity_map))
+        self.repo._close_session(force=True)
+        self.assertEqual(250, self.committed())
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            BatchSession(mode='sometimes')
+
+    def tearDown(self):
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.repo
+        del self.context
+        del self.directory
+
+class TestSchemaBootstrap(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.context = Context(settings={
+            'drivername': 'sqlite',
+            'database': path.join(self.directory.name, 'schema.db'),
+        })
+        self.fingerprints = path.join(self.directory.name, 'fingerprints.json')
+        self.statements = []
+
+        @event.listens_for(self.context.engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            self.statements.append(statement)
+
+    def test_one_catalog_query(self):
+        created = create_tables(engine=self.context.engine)
+        self.assertEqual(sorted(Base.metadata.tables.keys()), sorted(created))
+        self.assertFalse([statement for statement in self.statements if 'PRAGMA' in statement],
+                         msg='A table was checked on its own.')
+
+        self.statements.clear()
+        self.assertEqual([], create_tables(engine=self.context.engine))
+        self.assertEqual(1, len(self.statements))
+
+    def test_missing_tables_are_created(self):
+        create_tables(engine=self.context.engine)
+        self.context.engine.execute('DROP TABLE record')
+        self.assertEqual(['record'], create_tables(engine=self.context.engine))
+        self.assertEqual(0, self.context.engine.execute(text('SELECT count(*) FROM record')).scalar())
+
+    def test_types_are_still_checked(self):
+        metadata = MetaData()
+        table = Table('bootstrap_typed', metadata, Column('id', Integer, primary_key=True),
+                      Column('name', String(32), index=True))
+        checks = []
+        event.listen(table, 'before_create', lambda target, connection, **kw: checks.append(kw['checkfirst']))
+        self.assertEqual(['bootstrap_typed'], bootstrap_schema(self.context.engine, metadata))
+        # Types (e.g. a PostgreSQL ENUM) create themselves from the table's before_create event, with its checkfirst.
+        self.assertEqual([True], checks, msg='The table\'s types would be created without checking for them.')
+        self.assertFalse([statement for statement in self.statements if 'PRAGMA' in statement],
+                         msg='A missing table was checked on its own.')
+        with self.context.engine.connect() as connection:
+            indexes = connection.dialect.get_indexes(connection, 'bootstrap_typed')
+        self.assertEqual([['name']], [index['column_names'] for index in indexes])
+
+    def test_cached_fingerprint_skips_the_check(self):
+        metadata = MetaData()
+        Table('bootstrap_a', metadata, Column('id', Integer, primary_key=True))
+        self.assertEqual(['bootstrap_a'], bootstrap_schema(self.context.engine, metadata, self.fingerprints))
+        self.statements.clear()
+        self.assertEqual([], bootstrap_schema(self.context.engine, metadata, self.fingerprints))
+        self.assertEqual([], self.statements, msg='An unchanged schema was checked again.')
+
+        Table('bootstrap_b', metadata, Column('id', Integer, primary_key=True))
+        self.assertEqual(['bootstrap_b'], bootstrap_schema(self.context.engine, metadata, self.fingerprints))
+        with open(self.fingerprints, encoding='utf-8') as f:
+            self.assertEqual([repr(self.context.engine.url)], list(json.load(f)))
+
+    def tearDown(self):
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.context
+        del self.directory
+
+if __name__ == '__main__':
+    unittest.main()
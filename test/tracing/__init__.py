@@ -0,0 +1,140 @@
+from alchemist_stack.context import Context
+from alchemist_stack.tracing import Tracer, InMemoryExporter, JsonLinesExporter, SlowQueryLog, current_span,\
+    fingerprint
+from test.repository import RecordRepository, RecordTable
+
+from os import path
+from tempfile import TemporaryDirectory
+import json
+import unittest
+
+__author__ = 'H.D. "Chip" McCullough IV'
+
+class TestTracer(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.exporter = InMemoryExporter(capacity=64)
+        self.tracer = Tracer(exporter=self.exporter, sample_rate=1.0)
+        self.context = Context(settings={
+            'drivername': 'sqlite',
+            'database': path.join(self.directory.name, 'traced.db'),
+        }, tracer=self.tracer)
+        RecordTable.__table__.create(bind=self.context.engine)
+
+    def test_repository_operation_span(self):
+        repo = RecordRepository.instance(context=self.context)
+        repo.create_record(RecordTable(name='traced', value=1))
+
+        spans = {span.name: span for span in self.exporter.spans}
+        self.assertIn('repository.create', spans)
+        self.assertIn('repository.session_scope', spans)
+        self.assertIn('session.open', spans)
+        self.assertIn('session.close', spans)
+
+        create = spans['repository.create']
+        self.assertIsNone(create.parent, msg='The outermost operation span has a parent.')
+        self.assertEqual('RecordRepository', create.attributes['repository'])
+        self.assertEqual('RecordTable', create.attributes['model'])
+        self.assertGreaterEqual(create.statements, 1, msg='The INSERT was not recorded on the operation span.')
+        self.assertEqual(spans['repository.session_scope'].trace_id, create.trace_id)
+
+    def test_rows_are_counted_once(self):
+        session = self.context()
+        session.add_all([RecordTable(name='rows', value=i) for i in range(3)])
+        session.commit()
+        with self.tracer.span('rows') as span:
+            self.assertEqual(3, len(session.query(RecordTable).all()))
+            session.query(RecordTable).filter(RecordTable.value < 2).update({'value': 9}, synchronize_session=False)
+            # A driver that reports the rows a SELECT returned in `rowcount`, as psycopg2 does.
+            cursor = type('Cursor', (), {'description': (('primary_key',),), 'rowcount': 3})()
+            self.context.engine.dispatch.after_cursor_execute(session.connection(), cursor, 'SELECT', (), None, False)
+        session.close()
+        self.assertEqual(5, span.rows, msg='3 loaded rows and 2 updated rows were not counted exactly once.')
+
+    def test_read_object_records_no_empty_span(self):
+        RecordRepository.instance(context=self.context)._read_object(RecordTable)
+        self.assertEqual([], self.exporter.spans, msg='Building a Query recorded a span with no database work.')
+
+    def test_spans_nest_through_context_variables(self):
+        with self.tracer.span('outer') as outer:
+            with self.tracer.span('inner') as inner:
+                self.assertIs(inner, current_span())
+                self.assertIs(outer, inner.parent)
+            self.assertIs(outer, current_span())
+        self.assertIsNone(current_span())
+
+    def test_unsampled_tracer_records_nothing(self):
+        self.tracer.sample_rate = 0.0
+        with self.tracer.span('outer') as span:
+            self.assertIsNone(span)
+        self.assertEqual(0, len(self.exporter))
+
+    def test_json_lines_exporter(self):
+        exporter = JsonLinesExporter(path.join(self.directory.name, 'spans.jsonl'))
+        tracer = Tracer(exporter=exporter)
+        with tracer.span('exported', model='RecordTable'):
+            pass
+        exporter.close()
+        with open(exporter.path, encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(1, len(lines))
+        self.assertEqual('exported', lines[0]['name'])
+        self.assertEqual('RecordTable', lines[0]['attributes']['model'])
+
+    def tearDown(self):
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.context
+        del self.tracer
+        del self.exporter
+        del self.directory
+
+class TestSlowQueryLog(unittest.TestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.log = SlowQueryLog(threshold=0.0, interval=60)
+        self.context = Context(settings={
+            'drivername': 'sqlite',
+            'database': path.join(self.directory.name, 'slow.db'),
+        }, slow_query_log=self.log)
+        RecordTable.__table__.create(bind=self.context.engine)
+
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(fingerprint("SELECT * FROM record WHERE name = 'a' AND id IN (1, 2, 3)"),
+                         fingerprint('SELECT *  FROM record WHERE name = ? AND id IN (?)'))
+        self.assertNotEqual(fingerprint('SELECT * FROM record WHERE id = 1'),
+                            fingerprint('SELECT * FROM record WHERE value = 1'))
+
+    def test_slow_statement_plan_is_captured(self):
+        session = self.context()
+        session.query(RecordTable).filter(RecordTable.value == 3).all()
+        session.close()
+        self.assertTrue(self.log.drain(timeout=5))
+
+        (query,) = [query for query in self.log.queries if query.statement.lstrip().upper().startswith('SELECT')]
+        self.assertIsNone(query.error)
+        self.assertEqual(['int'], query.parameters, msg='The parameters shape was not recorded.')
+        self.assertIn('SCAN', ' '.join(str(column) for row in query.plan for column in row))
+        self.assertEqual([query.fingerprint], [q['fingerprint'] for q in json.loads(self.log.dump())
+                                               if q['statement'] == query.statement])
+
+    def test_fingerprints_are_rate_limited(self):
+        session = self.context()
+        for value in range(5):
+            session.query(RecordTable).filter(RecordTable.value == value).all()
+        session.close()
+        self.assertTrue(self.log.drain(timeout=5))
+        selects = [query for query in self.log.queries if query.statement.lstrip().upper().startswith('SELECT')]
+        self.assertEqual(1, len(selects), msg='The same fingerprint was explained twice within the interval.')
+        self.assertEqual(1, len(self.log.history(selects[0].fingerprint)))
+
+    def tearDown(self):
+        self.log.close()
+        self.context.engine.dispose()
+        self.directory.cleanup()
+        del self.context
+        del self.log
+        del self.directory
+
+if __name__ == '__main__':
+    unittest.main()
@@ -33,6 +33,14 @@ class TestUtilityFunctions(unittest.TestCase):
         self.assertEqual(inverted_no_mid, diff,
                          msg='The two dictionaries contain different values.')
 
+    def test_value_comparison(self):
+        expected = {'a': 'abc' * 100, 'b': 1}
+        actual = {'a': ''.join(['abc'] * 100), 'b': 2, 'c': None}
+        self.assertIn('a', dict_diff(expected, actual),
+                      msg='Identity comparison treated equal, distinct objects as the same.')
+        self.assertEqual({'b': 2, 'c': None}, dict_diff(expected, actual, identity=False),
+                         msg='Value comparison returned the wrong keys.')
+
     def tearDown(self):
         del self.empty_dict
         del self.dict